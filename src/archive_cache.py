@@ -0,0 +1,234 @@
+# archive_cache.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+import requests
+from logger import logger
+from config import (
+    ARCHIVE_CACHE_DIR, ARCHIVE_CACHE_MAX_BYTES, ARCHIVE_CACHE_REVALIDATE_AFTER, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_TIMEOUT
+)
+from range_downloader import get_http_session, download_file_segmented, probe_remote_file
+
+_archive_cache = None
+_archive_cache_lock = threading.Lock()
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ArchiveCache:
+    """
+    On-disk cache of downloaded zip archives.
+
+    Archives are stored once per content hash under 'objects/<sha256>.zip' and an index maps
+    each URL to its object along with the ETag/Last-Modified validators seen at download time.
+    Entries validated within revalidate_after seconds are served without any network traffic;
+    older entries are revalidated with a conditional HEAD request before being reused.
+    Least recently used entries are evicted once the cache grows beyond max_bytes.
+
+    fetch() pins the object it returns until it is handed back to release(), so an archive that
+    is still being parsed is never evicted or replaced under its reader.
+    """
+
+    def __init__(self, cache_dir=ARCHIVE_CACHE_DIR, max_bytes=ARCHIVE_CACHE_MAX_BYTES,
+                 revalidate_after=ARCHIVE_CACHE_REVALIDATE_AFTER, session=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.session = session
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.downloads_dir = os.path.join(cache_dir, 'downloads')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self._lock = threading.Lock()
+        self._pins = Counter()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.downloads_dir, exist_ok=True)
+        self._entries = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f).get('entries', {})
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'entries': self._entries}, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, sha256):
+        return os.path.join(self.objects_dir, f'{sha256}.zip')
+
+    def _get_session(self):
+        return self.session or get_http_session()
+
+    def lookup(self, url):
+        """
+        Returns the cached path for a URL without touching the network, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry and os.path.exists(self._object_path(entry['sha256'])):
+                entry['last_access'] = time.time()
+                self._save_index()
+                return self._object_path(entry['sha256'])
+        return None
+
+    def _revalidate(self, url, entry):
+        """
+        Checks with the server whether a cached entry still matches the remote archive.
+        """
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            response = self._get_session().head(url, headers=headers, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f'Could not revalidate cached archive for {url}, serving cached copy: {str(e)}')
+            return True
+
+        if response.status_code == 304:
+            return True
+        if response.status_code != 200:
+            logger.warning(f'Revalidation of {url} returned status {response.status_code}, serving cached copy')
+            return True
+        etag = response.headers.get('ETag')
+        if etag and entry.get('etag'):
+            return etag == entry['etag']
+        return (response.headers.get('Last-Modified') == entry.get('last_modified')
+                and response.headers.get('Content-Length') == str(entry['size']))
+
+    def fetch(self, url):
+        """
+        Returns a local path for the archive at url, downloading it on a miss or when stale.
+
+        Args:
+            url (str): The URL of the archive.
+
+        Returns:
+            str: Path of the cached archive. The file belongs to the cache and must not be
+            removed; it stays pinned until it is passed to release().
+        """
+        with self._lock:
+            entry = dict(self._entries.get(url) or {})
+        if entry and os.path.exists(self._object_path(entry['sha256'])):
+            needs_revalidation = time.time() - entry['validated_at'] >= self.revalidate_after
+            if not needs_revalidation or self._revalidate(url, entry):
+                with self._lock:
+                    # The entry may have been replaced or evicted while revalidating
+                    current = self._entries.get(url)
+                    if current and current['sha256'] == entry['sha256'] and os.path.exists(self._object_path(entry['sha256'])):
+                        if needs_revalidation:
+                            current['validated_at'] = time.time()
+                        current['last_access'] = time.time()
+                        self._pins[entry['sha256']] += 1
+                        self._save_index()
+                        logger.info(f'Serving {url} from archive cache')
+                        return self._object_path(entry['sha256'])
+            else:
+                logger.info(f'Cached archive for {url} is stale, downloading it again')
+
+        return self._download(url)
+
+    def release(self, path):
+        """
+        Unpins an archive returned by fetch(), once it is no longer read.
+        """
+        sha256 = os.path.splitext(os.path.basename(path))[0]
+        with self._lock:
+            if self._pins[sha256] <= 1:
+                del self._pins[sha256]
+                self._discard_object(sha256)
+            else:
+                self._pins[sha256] -= 1
+
+    def _discard_object(self, sha256):
+        """
+        Removes an object no entry refers to and no reader has pinned. Must be called with the lock held.
+        """
+        if sha256 in self._pins or any(entry['sha256'] == sha256 for entry in self._entries.values()):
+            return
+        try:
+            os.remove(self._object_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def _download(self, url):
+        session = self._get_session()
+        # The probe of the segmented download supplies the validators stored with the entry
+        remote = probe_remote_file(session, url)
+
+        url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        download_path = os.path.join(self.downloads_dir, f'{url_hash}.zip')
+        download_file_segmented(url, download_path, session=session, remote=remote)
+        sha256 = _sha256_file(download_path)
+        size = os.path.getsize(download_path)
+
+        object_path = self._object_path(sha256)
+        if os.path.exists(object_path):
+            os.remove(download_path)
+        else:
+            os.replace(download_path, object_path)
+
+        now = time.time()
+        with self._lock:
+            replaced = self._entries.get(url)
+            self._entries[url] = {
+                'sha256': sha256,
+                'size': size,
+                'etag': remote['etag'],
+                'last_modified': remote['last_modified'],
+                'validated_at': now,
+                'last_access': now
+            }
+            self._pins[sha256] += 1
+            if replaced and replaced['sha256'] != sha256:
+                self._discard_object(replaced['sha256'])
+            self._evict(keep=url)
+            self._save_index()
+        logger.info(f'Cached {url} as {sha256} ({size} bytes)')
+        return object_path
+
+    def _total_bytes(self):
+        return sum({entry['sha256']: entry['size'] for entry in self._entries.values()}.values())
+
+    def _evict(self, keep):
+        """
+        Removes least recently used entries until the cache fits in max_bytes.
+
+        Must be called with the lock held. The entry for keep and entries whose object is
+        pinned by a reader are never evicted.
+        """
+        by_last_access = sorted((entry['last_access'], url) for url, entry in self._entries.items()
+                                if url != keep and entry['sha256'] not in self._pins)
+        for _, url in by_last_access:
+            if self._total_bytes() <= self.max_bytes:
+                break
+            entry = self._entries.pop(url)
+            self._discard_object(entry['sha256'])
+            logger.info(f'Evicted {url} from archive cache')
+
+def get_archive_cache():
+    """
+    Returns the shared ArchiveCache configured in config.py, creating it on first use.
+
+    The pipeline's download threads share this one instance, so its pins and entries cover
+    every archive in use.
+    """
+    global _archive_cache
+    if _archive_cache is None:
+        with _archive_cache_lock:
+            if _archive_cache is None:
+                _archive_cache = ArchiveCache()
+    return _archive_cache
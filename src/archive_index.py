@@ -0,0 +1,211 @@
+# archive_index.py
+
+import os
+import struct
+import hashlib
+import zipfile
+import zlib
+import argparse
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from logger import logger
+from config import ARCHIVE_INDEX_DIR
+from header_prefilter import scan_header
+
+INDEX_VERSION = '1'
+INDEX_SCHEMA = pa.schema([
+    ('member', pa.string()),
+    ('EIN', pa.string()),
+    ('TaxYear', pa.int32()),
+    ('State', pa.string()),
+    ('FormType', pa.string()),
+    ('returnVersion', pa.string()),
+    ('header_offset', pa.int64()),
+    ('compress_size', pa.int64()),
+    ('file_size', pa.int64()),
+    ('compress_type', pa.int32()),
+    ('crc', pa.int64()),
+])
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_LOCAL_HEADER_SIGNATURE = 0x04034b50
+_FINGERPRINT_BYTES = 64 * 1024
+
+def get_index_path(zip_path, index_dir=ARCHIVE_INDEX_DIR):
+    """
+    Returns the sidecar index path for an archive. Spooled and cached archive names are stable
+    across runs, so the index is found again the next time the same archive is fetched.
+    """
+    return os.path.join(index_dir, os.path.basename(zip_path) + '.index.parquet')
+
+def archive_fingerprint(zip_path):
+    """
+    Identifies an archive by its size and a hash of its tail, which holds the central directory.
+    """
+    size = os.path.getsize(zip_path)
+    with open(zip_path, 'rb') as f:
+        f.seek(max(0, size - _FINGERPRINT_BYTES))
+        tail_hash = hashlib.sha256(f.read()).hexdigest()
+    return f'{size}-{tail_hash}'
+
+def build_archive_index(zip_path, index_path=None):
+    """
+    Scans every XML member of an archive once and writes its member index as Parquet.
+
+    Each row maps a member to its ReturnHeader fields (EIN, TaxYear, State, FormType,
+    returnVersion) as read by header_prefilter.scan_header, and to the location of its
+    compressed data in the archive. Header fields that cannot be read reliably are null.
+
+    Args:
+        zip_path (str): The archive on disk.
+        index_path (str): Where to write the index, or None for get_index_path(zip_path).
+
+    Returns:
+        pyarrow.Table: The index.
+    """
+    index_path = index_path or get_index_path(zip_path)
+    logger.info(f'Building member index for {zip_path}')
+    rows = {name: [] for name in INDEX_SCHEMA.names}
+    with zipfile.ZipFile(zip_path) as zip_file:
+        for info in zip_file.infolist():
+            if not info.filename.endswith('.xml'):
+                continue
+            with zip_file.open(info) as file:
+                header = scan_header(file.read()) or {}
+            rows['member'].append(info.filename)
+            for field in ['EIN', 'TaxYear', 'State', 'FormType', 'returnVersion']:
+                rows[field].append(header.get(field))
+            rows['header_offset'].append(info.header_offset)
+            rows['compress_size'].append(info.compress_size)
+            rows['file_size'].append(info.file_size)
+            rows['compress_type'].append(info.compress_type)
+            rows['crc'].append(info.CRC)
+
+    metadata = {'index_version': INDEX_VERSION, 'archive_fingerprint': archive_fingerprint(zip_path)}
+    index = pa.Table.from_pydict(rows, schema=INDEX_SCHEMA.with_metadata(metadata))
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    temp_path = index_path + '.tmp'
+    pq.write_table(index, temp_path)
+    os.replace(temp_path, index_path)
+    logger.info(f'Indexed {index.num_rows} members of {zip_path} '
+                f'({index.num_rows - pc.count(index["State"]).as_py()} without a reliable State)')
+    return index
+
+def load_archive_index(zip_path, index_path=None, build=True):
+    """
+    Loads the member index of an archive, building it when it is missing or stale.
+
+    Args:
+        zip_path (str): The archive on disk.
+        index_path (str): The index location, or None for get_index_path(zip_path).
+        build (bool): Whether to build a missing or stale index. If False, None is returned.
+
+    Returns:
+        pyarrow.Table: The index, or None.
+    """
+    index_path = index_path or get_index_path(zip_path)
+    if os.path.exists(index_path):
+        try:
+            index = pq.read_table(index_path)
+            metadata = index.schema.metadata or {}
+            if (metadata.get(b'index_version') == INDEX_VERSION.encode()
+                    and metadata.get(b'archive_fingerprint') == archive_fingerprint(zip_path).encode()):
+                logger.info(f'Loaded member index for {zip_path} from {index_path}')
+                return index
+            logger.info(f'Member index {index_path} is stale')
+        except Exception as e:
+            logger.warning(f'Could not read member index {index_path}: {str(e)}')
+    return build_archive_index(zip_path, index_path) if build else None
+
+def _matches(column, values):
+    # Rows whose header field is unknown always match, so they fall back to the full parse
+    return pc.or_kleene(pc.is_in(column, value_set=pa.array(values, type=column.type)), pc.is_null(column))
+
+def select_members(index, states=None, eins=None, tax_years=None, form_types=None):
+    """
+    Selects the index rows that may match the given predicates.
+
+    Each predicate is a list of accepted values, or None to accept everything. A member whose
+    header field could not be read is kept, so the full parse still decides on it.
+
+    Returns:
+        pyarrow.Table: The selected rows, ordered by their position in the archive.
+    """
+    mask = pa.array([True] * index.num_rows, type=pa.bool_())
+    if states:
+        mask = pc.and_(mask, _matches(pc.utf8_upper(index['State']), [state.upper() for state in states]))
+    if eins:
+        mask = pc.and_(mask, _matches(index['EIN'], [str(ein).replace('-', '') for ein in eins]))
+    if tax_years:
+        mask = pc.and_(mask, _matches(index['TaxYear'], [int(year) for year in tax_years]))
+    if form_types:
+        mask = pc.and_(mask, _matches(index['FormType'], list(form_types)))
+    return index.filter(mask).sort_by('header_offset')
+
+_DIRECT_COMPRESS_TYPES = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+def read_member(file, row, zip_file=None):
+    """
+    Reads and decompresses one member at the offset recorded in the index.
+
+    Stored and deflated members are decompressed straight from their offset; members using
+    other compression methods are read through zipfile instead.
+
+    Args:
+        file: The archive opened in binary mode.
+        row (dict): An index row.
+        zip_file (zipfile.ZipFile): The archive opened with zipfile, reused for members that
+            are neither stored nor deflated; it is opened from file when needed and not given.
+
+    Returns:
+        bytes: The member's content.
+    """
+    if row['compress_type'] not in _DIRECT_COMPRESS_TYPES:
+        with (zip_file or zipfile.ZipFile(file)).open(row['member']) as member:
+            return member.read()
+    file.seek(row['header_offset'])
+    header = _LOCAL_HEADER.unpack(file.read(_LOCAL_HEADER.size))
+    if header[0] != _LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local file header for {row['member']}")
+    file.seek(header[9] + header[10], os.SEEK_CUR)
+    data = file.read(row['compress_size'])
+    if row['compress_type'] == zipfile.ZIP_DEFLATED:
+        data = zlib.decompress(data, -zlib.MAX_WBITS)
+    if zlib.crc32(data) != row['crc'] or len(data) != row['file_size']:
+        raise zipfile.BadZipFile(f"CRC mismatch for {row['member']}")
+    return data
+
+def iter_indexed_members(zip_path, rows):
+    """
+    Yields the selected members of an archive, seeking straight to each one.
+
+    Yields:
+        tuple: (filename, xml_content) for each row, like xml_downloader.iter_xml_members.
+    """
+    with open(zip_path, 'rb') as file:
+        zip_file = None
+        for row in rows.to_pylist():
+            if row['compress_type'] not in _DIRECT_COMPRESS_TYPES and zip_file is None:
+                zip_file = zipfile.ZipFile(file)
+            yield row['member'], read_member(file, row, zip_file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the member index of IRS 990 zip archives.')
+    parser.add_argument('archives', nargs='+', help='Zip archives on disk')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index even if it is up to date')
+    parser.add_argument('--state', action='append', help='Select members filed from this state')
+    parser.add_argument('--ein', action='append', help='Select members for this EIN')
+    parser.add_argument('--tax-year', action='append', type=int, help='Select members for this tax year')
+    parser.add_argument('--form-type', action='append', help='Select members with this ReturnTypeCd')
+    args = parser.parse_args()
+
+    for zip_path in args.archives:
+        index = build_archive_index(zip_path) if args.rebuild else load_archive_index(zip_path)
+        if args.state or args.ein or args.tax_year or args.form_type:
+            rows = select_members(index, args.state, args.ein, args.tax_year, args.form_type)
+            for member in rows['member'].to_pylist():
+                print(f'{zip_path}\t{member}')
+            logger.info(f'Selected {rows.num_rows} of {index.num_rows} members from {zip_path}')
+
+if __name__ == '__main__':
+    main()
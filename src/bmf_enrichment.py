@@ -0,0 +1,152 @@
+# bmf_enrichment.py
+
+import os
+import glob
+import time
+import argparse
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from logger import logger
+from config import BMF_CSV_PATHS, BMF_INDEX_PATH, NTEE_UNKNOWN
+from ntee_reference import get_ntee_reference
+
+INDEX_VERSION = '1'
+INDEX_SCHEMA = pa.schema([
+    ('EIN', pa.string()),
+    ('NTEECode', pa.dictionary(pa.int16(), pa.string())),
+])
+
+def find_bmf_files(patterns=BMF_CSV_PATHS):
+    """
+    Returns the BMF extract CSVs matching the configured glob patterns, sorted by path.
+    """
+    return sorted({path for pattern in patterns for path in glob.glob(pattern)})
+
+def bmf_fingerprint(csv_paths):
+    """
+    Identifies a set of BMF extracts by their paths, sizes and modification times.
+    """
+    return ';'.join(f'{os.path.abspath(path)}:{os.path.getsize(path)}:{int(os.path.getmtime(path))}'
+                    for path in sorted(csv_paths))
+
+def normalize_eins(eins):
+    """
+    Returns EINs as nine-digit strings, e.g. '12-3456789' -> '123456789' and '1234567' -> '001234567'.
+    """
+    eins = pc.cast(eins, pa.string())
+    return pc.utf8_lpad(pc.replace_substring(pc.utf8_trim_whitespace(eins), '-', ''), 9, '0')
+
+def _read_bmf_csv(path):
+    table = pv.read_csv(path, convert_options=pv.ConvertOptions(
+        include_columns=['EIN', 'NTEE_CD'],
+        column_types={'EIN': pa.string(), 'NTEE_CD': pa.string()},
+        strings_can_be_null=True
+    ))
+    ntee_codes = pc.utf8_slice_codeunits(pc.utf8_upper(pc.utf8_trim_whitespace(table['NTEE_CD'])), 0, 3)
+    table = pa.table({'EIN': normalize_eins(table['EIN']), 'NTEECode': ntee_codes})
+    return table.filter(pc.and_(pc.is_valid(table['NTEECode']), pc.not_equal(table['NTEECode'], '')))
+
+def build_bmf_index(csv_paths, index_path=BMF_INDEX_PATH):
+    """
+    Builds the EIN to NTEE code index of a set of IRS EO Business Master File extracts.
+
+    Only the EIN and NTEE_CD columns are read. Rows without an NTEE code are dropped, an EIN
+    listed more than once keeps its first code, and the codes are dictionary-encoded, so the
+    index of the full BMF stays a few tens of megabytes. It is saved as Parquet with the
+    fingerprint of its sources, so later runs load it instead of reparsing the CSVs.
+
+    Returns:
+        pyarrow.Table: The index, with the INDEX_SCHEMA columns, sorted by EIN.
+    """
+    start_time = time.time()
+    tables = [_read_bmf_csv(path) for path in csv_paths]
+    table = pa.concat_tables(tables) if tables else pa.table({'EIN': pa.array([], pa.string()), 'NTEECode': pa.array([], pa.string())})
+    table = table.group_by('EIN', use_threads=False).aggregate([('NTEECode', 'first')])
+    table = table.rename_columns(['EIN', 'NTEECode']).sort_by('EIN')
+    table = table.cast(INDEX_SCHEMA).replace_schema_metadata({
+        'index_version': INDEX_VERSION,
+        'bmf_fingerprint': bmf_fingerprint(csv_paths),
+    })
+    if index_path:
+        os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+        pq.write_table(table, index_path + '.tmp')
+        os.replace(index_path + '.tmp', index_path)
+    logger.info(f"Built BMF index of {table.num_rows} EINs from {len(csv_paths)} files in {time.time() - start_time:.2f} seconds")
+    return table
+
+def load_bmf_index(csv_paths=None, index_path=BMF_INDEX_PATH):
+    """
+    Loads the BMF index, rebuilding it when the extracts changed since it was saved.
+
+    Args:
+        csv_paths (list): The BMF extracts, or None for those matching config.BMF_CSV_PATHS.
+        index_path (str): Where the index is saved, or None to keep it in memory only.
+
+    Returns:
+        pyarrow.Table: The index, or None when there are no BMF extracts.
+    """
+    csv_paths = find_bmf_files() if csv_paths is None else csv_paths
+    if not csv_paths:
+        return None
+    if index_path and os.path.exists(index_path):
+        try:
+            index = pq.read_table(index_path)
+            metadata = index.schema.metadata or {}
+            if (metadata.get(b'index_version') == INDEX_VERSION.encode()
+                    and metadata.get(b'bmf_fingerprint') == bmf_fingerprint(csv_paths).encode()):
+                logger.info(f'Loaded BMF index of {index.num_rows} EINs from {index_path}')
+                return index
+            logger.info(f'BMF index {index_path} is stale')
+        except Exception as e:
+            logger.warning(f'Could not read BMF index {index_path}: {str(e)}')
+    return build_bmf_index(csv_paths, index_path)
+
+def missing_ntee_codes(ntee_codes):
+    """
+    Returns a boolean mask of the records without an NTEE code: null, empty or the NTEE_UNKNOWN
+    placeholder that parse_return writes when a return has no code.
+    """
+    missing = pc.is_in(pc.cast(ntee_codes, pa.string()), value_set=pa.array(['', NTEE_UNKNOWN]))
+    return pc.or_(pc.is_null(ntee_codes), missing)
+
+def join_bmf_ntee_codes(table, index):
+    """
+    Fills the NTEECode and NTEEDescription of records without a code from the BMF index.
+
+    The EIN column is matched against the index in one hash lookup over the whole table;
+    records that already have an NTEE code keep it.
+
+    Returns:
+        tuple: (table, missing), where missing is a boolean array marking the records that
+        still have no NTEE code.
+    """
+    positions = pc.index_in(normalize_eins(table['EIN']), value_set=index['EIN'].combine_chunks())
+    bmf_codes = pc.take(pc.cast(index['NTEECode'], pa.string()), positions)
+    fill = pc.and_(missing_ntee_codes(table['NTEECode']), pc.is_valid(bmf_codes))
+
+    descriptions = get_ntee_reference().map_codes(bmf_codes)['NTEEDescription']
+    descriptions = pc.fill_null(descriptions, 'Description not found')
+    columns = {
+        'NTEECode': pc.if_else(fill, bmf_codes, pc.cast(table['NTEECode'], pa.string())),
+        'NTEEDescription': pc.if_else(fill, descriptions, pc.cast(table['NTEEDescription'], pa.string())),
+    }
+    for name, column in columns.items():
+        index_of = table.schema.get_field_index(name)
+        table = table.set_column(index_of, table.schema.field(name), column.cast(table.schema.field(name).type))
+    return table, missing_ntee_codes(table['NTEECode'])
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the EIN to NTEE code index of IRS EO BMF extracts.')
+    parser.add_argument('csv_files', nargs='*', help='BMF extract CSVs; defaults to config.BMF_CSV_PATHS')
+    parser.add_argument('--index-path', default=BMF_INDEX_PATH, help='Where the index is saved')
+    args = parser.parse_args()
+
+    csv_paths = args.csv_files or find_bmf_files()
+    if not csv_paths:
+        parser.error('No BMF extracts found')
+    build_bmf_index(csv_paths, args.index_path)
+
+if __name__ == '__main__':
+    main()
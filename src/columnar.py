@@ -0,0 +1,117 @@
+# columnar.py
+
+from collections import Counter
+import pyarrow as pa
+import pyarrow.compute as pc
+from logger import logger
+from config import desired_fields
+
+# Values accepted by int() and float() for the plain decimal strings found in e-files. Integers
+# are limited to 18 digits so every accepted value fits in an int64.
+_INT_PATTERN = r'^[+-]?[0-9]{1,18}$'
+_DOUBLE_PATTERN = r'^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?$|^[+-]?([iI][nN][fF]([iI][nN][iI][tT][yY])?|[nN][aA][nN])$'
+_TRUE_VALUES = ['true', '1', 'yes', 'x']
+ARROW_TYPES = {'int': pa.int64(), 'double': pa.float64(), 'boolean': pa.bool_(), 'string': pa.string()}
+
+def convert_column(values, type_):
+    """
+    Converts a string column to the specified data type in bulk.
+
+    This is the columnar counterpart of utils.convert_value: 'int' and 'double' values that
+    do not parse become null, and 'boolean' is true for 'true', '1', 'yes' and 'x' in any case.
+
+    Args:
+        values (pyarrow.Array): The raw string values, with nulls for missing values.
+        type_ (str): The target data type ('int', 'double', 'boolean', etc.).
+
+    Returns:
+        tuple: (converted pyarrow.Array, number of non-null values that failed to convert).
+    """
+    if type_ == 'boolean':
+        return pc.is_in(pc.utf8_lower(values), value_set=pa.array(_TRUE_VALUES)), 0
+    if type_ not in ('int', 'double'):
+        return values, 0
+
+    valid = pc.match_substring_regex(values, _INT_PATTERN if type_ == 'int' else _DOUBLE_PATTERN)
+    failures = pc.sum(pc.invert(valid)).as_py() or 0
+    values = pc.if_else(valid, values, pa.scalar(None, pa.string()))
+    if type_ == 'int':
+        # Arrow does not parse a leading '+', which int() accepts
+        values = pc.replace_substring_regex(values, r'^\+', '')
+    return pc.cast(values, ARROW_TYPES[type_]), failures
+
+class ColumnarRecordBuilder:
+    """
+    Collects raw records into per-field column buffers and converts them in bulk.
+
+    Records are dicts of raw extracted strings, as returned by xml_parser.parse_return with
+    convert=False. Every key becomes a column; a key missing from a record is null in that
+    row. On build, the columns of config.desired_fields are converted to their declared types
+    with pyarrow compute, and values that fail to convert are counted per field instead of
+    being logged one by one.
+    """
+
+    def __init__(self, fields=desired_fields):
+        self.fields = fields
+        self.records = []
+        self.columns = {}
+        self.failures = Counter()
+        self.failure_examples = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, record):
+        for name in record:
+            if name not in self.columns:
+                self.columns[name] = [None] * len(self.records)
+        for name, column in self.columns.items():
+            column.append(record.get(name))
+        self.records.append(record)
+
+    def _convert(self, name):
+        values = self.columns[name]
+        type_ = self.fields.get(name, {}).get('type')
+        if type_ is None:
+            return pa.array(values)
+        raw = pa.array(values, type=pa.string())
+        converted, failures = convert_column(raw, type_)
+        if failures:
+            self.failures[name] += failures
+            failed = pc.and_(pc.is_valid(raw), pc.is_null(converted))
+            self.failure_examples[name] = raw.filter(failed).unique()[:3].to_pylist()
+        return converted
+
+    def build(self):
+        """
+        Returns the collected records as a pyarrow.Table with converted desired_fields columns.
+        """
+        self.failures.clear()
+        self.failure_examples.clear()
+        return pa.table({name: self._convert(name) for name in self.columns})
+
+    def to_records(self):
+        """
+        Converts the appended record dicts in place and returns them.
+
+        Only the typed columns are converted and written back. Values that failed to convert
+        become None, as with utils.convert_value, and keys missing from a record stay missing.
+        """
+        self.failures.clear()
+        self.failure_examples.clear()
+        for name, values in self.columns.items():
+            if self.fields.get(name, {}).get('type', 'string') == 'string':
+                continue
+            for record, raw, value in zip(self.records, values, self._convert(name).to_pylist()):
+                if raw is not None:
+                    record[name] = value
+        return self.records
+
+    def log_failures(self, context):
+        """
+        Logs one line per field with the number of values that failed to convert.
+        """
+        for name, count in self.failures.items():
+            type_ = self.fields[name].get('type')
+            logger.warning(f"{count} {name} values in {context} could not be converted to {type_}, "
+                           f"e.g. {self.failure_examples.get(name)}")
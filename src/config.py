@@ -1,6 +1,6 @@
 # config.py
 
-import boto3
+import os
 
 # AWS S3 configurations
 S3_BUCKET = 'nonprofit-financial-health-data'
@@ -10,7 +10,107 @@ S3_NOEXP_FOLDER = 'NoExp'
 S3_NOASS_FOLDER = 'NoAss'
 S3_NONASS_FOLDER = 'NoNAss'
 
-s3_client = boto3.client('s3')
+# S3 client settings
+S3_MAX_POOL_CONNECTIONS = 50  # HTTP connections the shared S3 client keeps open; at least the number of upload threads
+S3_RETRY_MODE = 'adaptive'  # botocore retry mode: 'standard' or 'adaptive', which also rate-limits on throttling
+S3_MAX_ATTEMPTS = 10  # Attempts per request, including the first
+S3_UPLOAD_WORKERS = 16  # Objects uploaded concurrently by s3_utils.upload_many
+S3_MULTIPART_PART_SIZE = 16 * 1024 * 1024  # Size of each part of a streamed S3 upload
+S3_MULTIPART_WORKERS = 4  # Parts of one upload sent concurrently
+S3_MULTIPART_MAX_PENDING_PARTS = 8  # Parts buffered or in flight before writes block
+
+# Partitioned dataset settings
+DATASET_PREFIX = f'{S3_FOLDER}/irs990_dataset'  # S3 prefix of the partitioned dataset and its manifest
+DATASET_LOCAL_DIR = None  # Directory to keep the dataset in instead of S3, e.g. for local runs
+LEGACY_PARQUET_KEY = f'{S3_FOLDER}/irs990_data.parquet'  # Single Parquet file written by earlier versions, imported into the dataset once
+DATASET_PARTITION_COLUMNS = ['TaxYear', 'State']
+DATASET_READ_THREADS = 8  # Part files read concurrently
+DATASET_COMPACT_MIN_DELTAS = 16  # Delta files of a tax year before it is due for compaction
+DATASET_COMPACT_MIN_DELTA_BYTES = 256 * 1024 * 1024  # Delta bytes of a tax year before it is due for compaction
+DATASET_COMPACTION_PROFILE = 'compact'  # Parquet writer profile of compacted base files
+
+# Parquet writer settings
+PARQUET_WRITER_PROFILE = 'balanced'  # One of PARQUET_WRITER_PROFILES
+PARQUET_WRITER_PROFILES = {
+    # Quick writes for frequent small delta files
+    'fast': {'compression': 'zstd', 'compression_level': 1, 'row_group_size': 122880, 'write_page_index': False},
+    # DuckDB scans row groups of 122880 rows in parallel, and Athena splits work by row group
+    'balanced': {'compression': 'zstd', 'compression_level': 3, 'row_group_size': 4 * 122880, 'write_page_index': True},
+    # Smallest files, for compacted base files that are written once and scanned many times
+    'compact': {'compression': 'zstd', 'compression_level': 12, 'row_group_size': 8 * 122880, 'write_page_index': True},
+}
+PARQUET_DATA_PAGE_SIZE = 1024 * 1024
+PARQUET_DICTIONARY_COLUMNS = ['State', 'FormType', 'NTEECode', 'NTEEDescription']  # Plus every '<field>_path' column
+
+# Ingestion settings
+STREAMING_INGESTION = True  # Spool archives to disk and parse members one at a time
+SPOOL_DIR = None  # Directory for spooled archives; None uses the system temp directory
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+NO_TOTAL_ASSETS_SAMPLE_LIMIT = 20  # Number of files without TotalAssets kept for upload to S3
+
+# Download settings
+DOWNLOAD_SEGMENT_SIZE = 64 * 1024 * 1024  # Size of each HTTP range request
+DOWNLOAD_WORKERS = 8  # Number of segments downloaded concurrently
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_RETRY_BACKOFF = 2  # Seconds before the first retry of a failed segment, doubled for each further retry
+DOWNLOAD_TIMEOUT = 60  # Seconds to wait for the server before retrying
+HTTP_POOL_SIZE = 16
+
+# Archive cache settings
+ARCHIVE_CACHE_ENABLED = True
+ARCHIVE_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'archive_cache')
+ARCHIVE_CACHE_MAX_BYTES = 50 * 1024 ** 3
+ARCHIVE_CACHE_REVALIDATE_AFTER = 7 * 24 * 3600  # Seconds before a cached archive is revalidated with the server
+
+# Archive index settings
+ARCHIVE_INDEX_ENABLED = True  # Select archive members from a sidecar header index instead of parsing every member
+ARCHIVE_INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'archive_index')
+
+# Pipeline settings
+PIPELINE_DOWNLOAD_WORKERS = 2  # Archives downloaded concurrently
+PIPELINE_PARSE_WORKERS = 1  # Archives parsed concurrently
+PIPELINE_QUEUE_SIZE = 1  # Archives waiting between stages before downloads block
+
+# Parser settings
+PARSE_PROCESSES = os.cpu_count() or 1  # Parser processes per archive; 1 parses in the calling process
+PARSE_START_METHOD = 'spawn'  # How parser processes start; not 'fork', since the pipeline's download threads are running
+PARSE_CHUNK_FILES = 200  # Maximum XML files sent to a parser process at once
+PARSE_CHUNK_BYTES = 64 * 1024 * 1024  # Maximum XML bytes sent to a parser process at once
+EXTRACTION_ENGINE = 'xpath'  # 'xpath' evaluates precompiled paths, 'treewalk' extracts all fields in one pass
+RETURN_SCOPED_EXTRACTION = True  # Evaluate field paths within each Return instead of the whole document
+XML_STREAMING_PARSE = False  # Parse with iterparse and free each Return once extracted, for large multi-Return files
+HEADER_PREFILTER = True  # Skip files whose ReturnHeader bytes show a state other than the state filter
+COLUMNAR_CONVERSION = True  # Convert extracted values per chunk with pyarrow instead of one value at a time
+RECORD_BATCH_SIZE = 10000  # Records buffered as dicts before they are appended to the record store as one batch
+NTEE_UNKNOWN = 'Unknown'  # NTEECode and NTEEDescription of parsed records without a code, filled in by enrichment
+
+# NTEE cache settings
+NTEE_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'ntee_cache.sqlite3')
+NTEE_CACHE_TTL = 180 * 24 * 3600  # Seconds before a cached NTEE code is fetched again
+NTEE_CACHE_NEGATIVE_TTL = 7 * 24 * 3600  # Seconds before an EIN without an NTEE code is retried
+
+# ProPublica API settings
+PROPUBLICA_API_URL = 'https://projects.propublica.org/nonprofits/api/v2/organizations'
+PROPUBLICA_RATE_LIMIT = 4.0  # Requests per second; halved on every 429 or 5xx and recovered on success
+PROPUBLICA_MIN_RATE = 0.25
+PROPUBLICA_BURST = 4
+PROPUBLICA_MAX_CONNECTIONS = 8
+PROPUBLICA_RETRIES = 5
+PROPUBLICA_TIMEOUT = 30
+
+# Batched NTEE inference settings
+NTEE_INFERENCE_MODEL = 'gpt-4'
+NTEE_INFERENCE_BATCH_SIZE = 20  # Organizations packed into one completion request
+NTEE_INFERENCE_CONCURRENCY = 4  # Completion requests in flight at once
+
+# Local NTEE classifier settings
+NTEE_CLASSIFIER_ENABLED = True  # Classify organizations offline before falling back to the LLM
+NTEE_CLASSIFIER_MIN_CONFIDENCE = 0.3  # Classifications below this are sent on to the LLM
+
+# IRS EO Business Master File settings
+BMF_ENRICHMENT_ENABLED = True  # Join NTEE codes from local BMF extracts before the API and LLM tiers
+BMF_CSV_PATHS = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'bmf', '*.csv')]
+BMF_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'bmf_index.parquet')
 
 # Desired fields to extract from XML
 desired_fields = {
@@ -1,21 +1,36 @@
 # data_analyzer.py
 # This file has been updated to include analysis for NTEE Code and Description fields
 
+import pyarrow as pa
+import pyarrow.compute as pc
 from logger import logger
-from collections import Counter
 from config import desired_fields
+from record_store import RecordStore
+from ntee_reference import get_ntee_reference
+
+def _to_table(records):
+    return records.to_table() if isinstance(records, RecordStore) else records
+
+def _non_empty(column):
+    return pc.and_(pc.is_valid(column), pc.not_equal(pc.cast(column, pa.string()), ''))
+
+def _most_common(column, n):
+    counts = pc.value_counts(column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column)
+    counts = sorted(counts.to_pylist(), key=lambda item: -item['counts'])
+    return [(item['values'], item['counts']) for item in counts[:n]]
 
 def analyze_field_coverage(records):
-    total_records = len(records)
+    table = _to_table(records)
+    total_records = table.num_rows
     if total_records == 0:
         logger.warning("No records to analyze field coverage.")
         return
 
-    field_coverage = {field: sum(1 for r in records if field in r) for field in desired_fields}
-    
+    field_coverage = {field: table[field].length() - table[field].null_count for field in desired_fields}
+
     # Add NTEE fields to the analysis
-    field_coverage['NTEECode'] = sum(1 for r in records if 'NTEECode' in r and r['NTEECode'])
-    field_coverage['NTEEDescription'] = sum(1 for r in records if 'NTEEDescription' in r and r['NTEEDescription'])
+    field_coverage['NTEECode'] = pc.sum(_non_empty(table['NTEECode'])).as_py() or 0
+    field_coverage['NTEEDescription'] = pc.sum(_non_empty(table['NTEEDescription'])).as_py() or 0
 
     logger.info("Field coverage analysis:")
     for field, count in field_coverage.items():
@@ -23,45 +38,51 @@ def analyze_field_coverage(records):
         logger.info(f"{field}: {count}/{total_records} ({percentage:.2f}%)")
 
 def analyze_path_usage(records):
+    table = _to_table(records)
     fields_to_analyze = ['TotalExpenses', 'TotalAssets', 'TotalNetAssets', 'MissionStatement']
-    path_usage = {field: {} for field in fields_to_analyze}
-
-    for record in records:
-        form_type = record['FormType']
-        for field in fields_to_analyze:
-            if field in record:
-                path = record.get(f'{field}_path', 'Unknown')
-                if form_type not in path_usage[field]:
-                    path_usage[field][form_type] = {}
-                path_usage[field][form_type][path] = path_usage[field][form_type].get(path, 0) + 1
 
     for field in fields_to_analyze:
         logger.info(f"Path usage analysis for {field}:")
-        for form_type, paths in path_usage[field].items():
+        found = table.filter(pc.is_valid(table[field]))
+        paths = pc.fill_null(pc.cast(found[f'{field}_path'], pa.string()), 'Unknown')
+        usage = pa.table({'FormType': pc.cast(found['FormType'], pa.string()), 'path': paths})
+        usage = usage.group_by(['FormType', 'path'], use_threads=False).aggregate([([], 'count_all')])
+        form_types = {}
+        for row in usage.to_pylist():
+            form_types.setdefault(row['FormType'], []).append((row['path'], row['count_all']))
+        for form_type, paths in form_types.items():
             logger.info(f"  {form_type}:")
-            for path, count in paths.items():
+            for path, count in paths:
                 logger.info(f"    {path}: {count}")
 
 def analyze_ntee_data(records):
-    ntee_codes = [r['NTEECode'] for r in records if 'NTEECode' in r and r['NTEECode']]
-    ntee_descriptions = [r['NTEEDescription'] for r in records if 'NTEEDescription' in r and r['NTEEDescription']]
+    table = _to_table(records)
+    ntee_codes = table['NTEECode'].filter(_non_empty(table['NTEECode']))
+    ntee_descriptions = table['NTEEDescription'].filter(_non_empty(table['NTEEDescription']))
 
     logger.info("NTEE Code analysis:")
-    code_counter = Counter(ntee_codes)
-    for code, count in code_counter.most_common(10):
+    for code, count in _most_common(ntee_codes, 10):
         percentage = (count / len(ntee_codes)) * 100
         logger.info(f"  {code}: {count} ({percentage:.2f}%)")
 
     logger.info("NTEE Description analysis:")
-    desc_counter = Counter(ntee_descriptions)
-    for desc, count in desc_counter.most_common(10):
+    for desc, count in _most_common(ntee_descriptions, 10):
         percentage = (count / len(ntee_descriptions)) * 100
         logger.info(f"  {desc}: {count} ({percentage:.2f}%)")
 
-    logger.info(f"Total unique NTEE Codes: {len(set(ntee_codes))}")
-    logger.info(f"Total unique NTEE Descriptions: {len(set(ntee_descriptions))}")
+    logger.info("NTEE major group analysis:")
+    major_groups = get_ntee_reference().map_codes(ntee_codes)['NTEEMajorGroupName']
+    for group, count in _most_common(pc.fill_null(major_groups, 'Unknown'), 26):
+        percentage = (count / len(ntee_codes)) * 100
+        logger.info(f"  {group}: {count} ({percentage:.2f}%)")
+
+    logger.info(f"Total unique NTEE Codes: {pc.count_distinct(ntee_codes).as_py()}")
+    logger.info(f"Total unique NTEE Descriptions: {pc.count_distinct(ntee_descriptions).as_py()}")
 
 def analyze_data(records):
+    """
+    Logs field coverage, path usage and NTEE statistics for a RecordStore or pyarrow.Table of records.
+    """
     analyze_field_coverage(records)
     analyze_path_usage(records)
     analyze_ntee_data(records)
@@ -1,24 +1,39 @@
 # data_processor.py
 
 import time
+import atexit
+import threading
+import multiprocessing
+from io import BytesIO
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pyarrow as pa
 from lxml import etree
 from logger import logger
 from config import (
-    S3_BUCKET, S3_NOREV_FOLDER, S3_NOEXP_FOLDER, S3_NOASS_FOLDER, S3_NONASS_FOLDER, s3_client, desired_fields
+    desired_fields, NO_TOTAL_ASSETS_SAMPLE_LIMIT, PARSE_PROCESSES, PARSE_START_METHOD, PARSE_CHUNK_FILES,
+    PARSE_CHUNK_BYTES, XML_STREAMING_PARSE, HEADER_PREFILTER, COLUMNAR_CONVERSION
 )
 from xml_parser import parse_return
+from columnar import ColumnarRecordBuilder
+from record_store import RecordStore
+from header_prefilter import prefilter_state, NO_MATCH
 from utils import is_state_nonprofit
-from s3_utils import upload_file_to_s3
 
-def print_summary(start_time, xml_files, records, total_returns_processed, state_filter, field_extraction_stats, no_revenue_files, no_exp_files, no_ass_files, no_nass_files, no_total_assets_files):
+FINANCIAL_FIELDS = ['TotalRevenue', 'TotalExpenses', 'TotalAssets', 'TotalNetAssets']
+RETURN_TAG = '{http://www.irs.gov/efile}Return'
+
+def print_summary(start_time, total_files_processed, records, total_returns_processed, state_filter, field_extraction_stats, no_revenue_files, no_exp_files, no_ass_files, no_nass_files, no_total_assets_files, total_files_prefiltered=0):
     end_time = time.time()
     processing_time = end_time - start_time
     
     logger.info("\n" + "="*50)
     logger.info("PROCESSING SUMMARY")
     logger.info("="*50)
-    logger.info(f"Total XML files processed: {len(xml_files)}")
+    logger.info(f"Total XML files processed: {total_files_processed}")
     logger.info(f"Total Returns processed: {total_returns_processed}")
+    logger.info(f"Files skipped by the header prefilter: {total_files_prefiltered}")
     logger.info(f"Total {state_filter} nonprofit records extracted: {len(records)}")
     logger.info(f"Total processing time: {processing_time:.2f} seconds")
     
@@ -33,16 +48,302 @@ def print_summary(start_time, xml_files, records, total_returns_processed, state
     logger.info(f"Files without TotalNetAssets: {len(no_nass_files)}")
     logger.info(f"Files without TotalAssets: {len(no_total_assets_files)}")
     
-    if records:
-        logger.info(f"\nAverage fields per record: {sum(len(r) for r in records) / len(records):.2f}")
+    if len(records):
+        logger.info(f"\nAverage fields per record: {records.average_fields_per_record():.2f}")
     else:
         logger.warning("\nNo valid nonprofit records processed.")
     
     logger.info("="*50)
 
-def process_xml_files(xml_files, state_filter, get_ntee_code_description):
-    records = []
-    state_files = set()
+def enrich_record(data, get_ntee_code_description):
+    organization_name = data.get('OrganizationName', '')
+    mission_statement = data.get('MissionStatement', '')
+    ein = data.get('EIN', '')  # Get the EIN from the parsed data
+    ntee_info = get_ntee_code_description(organization_name, mission_statement, ein)
+    data['NTEECode'] = ntee_info.get('ntee_code', '')
+    data['NTEEDescription'] = ntee_info.get('ntee_description', '')
+
+def _enrich_batch(batch, get_ntee_code_description, prefetch_ntee_codes=None):
+    ntee_codes = batch['NTEECode'].to_pylist()
+    ntee_descriptions = batch['NTEEDescription'].to_pylist()
+    columns = {name: batch[name].to_pylist() for name in ['OrganizationName', 'MissionStatement', 'EIN', '_source_file']}
+    if prefetch_ntee_codes is not None:
+        try:
+            prefetch_ntee_codes(columns['EIN'], columns['OrganizationName'], columns['MissionStatement'])
+        except Exception as e:
+            logger.error(f"Error prefetching NTEE codes for {batch.num_rows} records: {e}")
+    for i, (organization_name, mission_statement, ein, source_file) in enumerate(zip(*columns.values())):
+        try:
+            ntee_info = get_ntee_code_description(organization_name or '', mission_statement or '', ein or '')
+            ntee_codes[i] = ntee_info.get('ntee_code', '')
+            ntee_descriptions[i] = ntee_info.get('ntee_description', '')
+        except Exception as e:
+            logger.error(f"Error enriching record from {source_file}: {e}")
+    arrays = batch.columns
+    arrays[batch.schema.get_field_index('NTEECode')] = pa.array(ntee_codes, type=pa.string())
+    arrays[batch.schema.get_field_index('NTEEDescription')] = pa.array(ntee_descriptions, type=pa.string())
+    return pa.RecordBatch.from_arrays(arrays, schema=batch.schema)
+
+def enrich_records(records, get_ntee_code_description, prefetch_ntee_codes=None):
+    """
+    Enriches records returned by process_xml_files(..., get_ntee_code_description=None) with NTEE data.
+
+    Args:
+        records (RecordStore or list): A record store, whose NTEECode and NTEEDescription
+            columns are replaced batch by batch, or a list of record dicts, updated in place.
+        get_ntee_code_description (callable): Callback returning the NTEE data of one record.
+        prefetch_ntee_codes (callable): Optional callback called with the EINs, organization names
+            and mission statements of each batch before the per-record callbacks, so NTEE codes
+            can be fetched or inferred in bulk.
+    """
+    if isinstance(records, RecordStore):
+        records.map_batches(lambda batch: _enrich_batch(batch, get_ntee_code_description, prefetch_ntee_codes))
+        return records
+    if prefetch_ntee_codes is not None:
+        prefetch_ntee_codes([data.get('EIN') for data in records],
+                            [data.get('OrganizationName') for data in records],
+                            [data.get('MissionStatement') for data in records])
+    for data in records:
+        try:
+            enrich_record(data, get_ntee_code_description)
+        except Exception as e:
+            logger.error(f"Error enriching record from {data.get('_source_file')}: {e}")
+    return records
+
+def iter_returns(xml_source):
+    """
+    Incrementally parses an XML document and yields each Return element as it closes.
+
+    Once the consumer is done with a Return it is cleared and the siblings before it are
+    removed, so memory stays flat however many Returns the document holds. Callers must finish
+    with a Return before advancing the generator, and should use Return-scoped extraction.
+
+    Args:
+        xml_source (bytes or file-like): The XML document.
+
+    Yields:
+        lxml.etree.Element: Each Return element in document order.
+    """
+    if isinstance(xml_source, bytes):
+        xml_source = BytesIO(xml_source)
+    for _, Return in etree.iterparse(xml_source, events=('end',), tag=RETURN_TAG):
+        yield Return
+        Return.clear(keep_tail=True)
+        parent = Return.getparent()
+        if parent is not None:
+            while Return.getprevious() is not None:
+                del parent[0]
+
+def _collect_stats(result):
+    for data in result['records']:
+        for field in desired_fields.keys():
+            if field in data and data[field] is not None:
+                result['field_extraction_stats'][field] += 1
+
+        for field in FINANCIAL_FIELDS:
+            if field not in data or data[field] is None:
+                result['missing_fields'].add(field)
+
+def parse_xml_file(filename, xml_content, state_filter, convert=True):
+    """
+    Parses one XML file and returns the records and statistics for its matching Returns.
+
+    This function has no side effects beyond logging so it can run in a worker process. When
+    HEADER_PREFILTER is set and the raw ReturnHeader shows a state other than state_filter, the
+    file is counted as one processed Return and skipped without building a tree. Headers that
+    cannot be read reliably from bytes fall back to the full parse.
+
+    With convert=False the records hold raw strings and the statistics are left empty; pass
+    the results to _convert_results to convert them and fill in the statistics.
+
+    Returns:
+        dict: With the keys 'records', 'returns_processed', 'field_extraction_stats',
+        'missing_fields', the set of financial fields missing from at least one record, and
+        'prefiltered', True when the file was skipped by the header prefilter.
+    """
+    result = {
+        'records': [],
+        'returns_processed': 0,
+        'field_extraction_stats': {field: 0 for field in desired_fields.keys()},
+        'missing_fields': set(),
+        'prefiltered': False
+    }
+    if HEADER_PREFILTER and state_filter and prefilter_state(xml_content, state_filter) == NO_MATCH:
+        logger.debug(f"Skipped {filename}: header state does not match {state_filter}")
+        result['returns_processed'] = 1
+        result['prefiltered'] = True
+        return result
+
+    try:
+        ns = {'irs': 'http://www.irs.gov/efile'}
+        if XML_STREAMING_PARSE:
+            Returns = iter_returns(xml_content)
+        else:
+            tree = etree.fromstring(xml_content)
+            Returns = tree.xpath('//irs:Return', namespaces=ns)
+
+        for Return in Returns:
+            result['returns_processed'] += 1
+            try:
+                data = parse_return(Return, ns, filename, convert=convert)
+                logger.debug(f"Parsed data for {filename}: {data}")
+                if data and is_state_nonprofit(data, state_filter):
+                    result['records'].append(data)
+                    logger.info(f"Added record for {state_filter} nonprofit from {filename}")
+                else:
+                    logger.debug(f"Record from {filename} did not match state filter {state_filter} or had no data")
+
+            except Exception as e:
+                logger.error(f'Error processing Return in {filename}: {e}')
+
+        if not result['returns_processed']:
+            logger.debug(f"No Return elements found in {filename}")
+
+    except Exception as e:
+        logger.error(f'Error processing {filename}: {e}')
+
+    if convert:
+        _collect_stats(result)
+    return result
+
+def _convert_results(results):
+    """
+    Converts the raw records of several parse_xml_file(..., convert=False) results in bulk.
+
+    Records whose TaxYear does not convert are dropped, as parse_return does when converting
+    value by value, and the statistics of each result are filled in.
+    """
+    builder = ColumnarRecordBuilder()
+    for result in results:
+        for data in result['records']:
+            builder.append(data)
+    if not len(builder):
+        return results
+
+    records = iter(builder.to_records())
+    builder.log_failures(f"{len(results)} files")
+    for result in results:
+        converted = [next(records) for _ in result['records']]
+        result['records'] = []
+        for data in converted:
+            if data.get('TaxYear') is None:
+                logger.warning(f"Missing TaxYear in {data.get('_source_file')}. Skipping record.")
+                continue
+            result['records'].append(data)
+        _collect_stats(result)
+    return results
+
+def _parse_chunk(chunk, state_filter):
+    results = [parse_xml_file(filename, xml_content, state_filter, convert=not COLUMNAR_CONVERSION)
+               for filename, xml_content in chunk]
+    return _convert_results(results) if COLUMNAR_CONVERSION else results
+
+def _iter_chunks(xml_files, chunk_files, chunk_bytes):
+    chunk = []
+    size = 0
+    for filename, xml_content in xml_files:
+        chunk.append((filename, xml_content))
+        size += len(xml_content)
+        if len(chunk) >= chunk_files or size >= chunk_bytes:
+            yield chunk
+            chunk = []
+            size = 0
+    if chunk:
+        yield chunk
+
+_parse_pool = None
+_parse_pool_workers = 0
+_parse_pool_lock = threading.Lock()
+
+def get_parse_pool(workers):
+    """
+    Returns the process pool shared by every process_xml_files call, so parser processes are
+    started once per run rather than once per archive. It is recreated when a different
+    number of workers is asked for, or after a worker process died.
+
+    The pool is created lazily from a parse thread while download threads are running, so its
+    processes are started with PARSE_START_METHOD rather than forked from the threaded process,
+    whose children could deadlock on locks held by other threads at the time of the fork.
+    """
+    global _parse_pool, _parse_pool_workers
+    with _parse_pool_lock:
+        if _parse_pool is None or _parse_pool_workers != workers:
+            if _parse_pool is not None:
+                _parse_pool.shutdown()
+            _parse_pool = ProcessPoolExecutor(max_workers=workers,
+                                              mp_context=multiprocessing.get_context(PARSE_START_METHOD))
+            _parse_pool_workers = workers
+        return _parse_pool
+
+def shutdown_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(cancel_futures=True)
+            _parse_pool = None
+
+atexit.register(shutdown_parse_pool)
+
+def _iter_parsed_files(xml_files, state_filter, workers):
+    """
+    Yields (filename, xml_content, result) in input order, parsing in the shared process pool
+    (see get_parse_pool) when workers > 1.
+
+    Files are parsed in chunks so each chunk's values are converted in bulk. At most two chunks
+    per worker are in flight, which bounds the memory held by pending work.
+    """
+    if workers <= 1:
+        for chunk in _iter_chunks(xml_files, PARSE_CHUNK_FILES, PARSE_CHUNK_BYTES):
+            yield from ((filename, xml_content, result)
+                        for (filename, xml_content), result in zip(chunk, _parse_chunk(chunk, state_filter)))
+        return
+
+    pending = deque()
+    executor = get_parse_pool(workers)
+    try:
+        for chunk in _iter_chunks(xml_files, PARSE_CHUNK_FILES, PARSE_CHUNK_BYTES):
+            pending.append((chunk, executor.submit(_parse_chunk, chunk, state_filter)))
+            while len(pending) >= workers * 2:
+                chunk, future = pending.popleft()
+                yield from ((filename, xml_content, result)
+                            for (filename, xml_content), result in zip(chunk, future.result()))
+        while pending:
+            chunk, future = pending.popleft()
+            yield from ((filename, xml_content, result)
+                        for (filename, xml_content), result in zip(chunk, future.result()))
+    except BrokenProcessPool:
+        shutdown_parse_pool()
+        raise
+    finally:
+        # Work of an abandoned archive is not left running in the shared pool
+        for _, future in pending:
+            future.cancel()
+
+def process_xml_files(xml_files, state_filter, get_ntee_code_description, workers=PARSE_PROCESSES,
+                      prefetch_ntee_codes=None):
+    """
+    Parses XML files and extracts records for nonprofits matching the state filter.
+
+    With workers > 1 the files are sharded into chunks and parsed in a process pool. Results
+    are merged in input order so the output does not depend on scheduling, and NTEE enrichment
+    always runs in the calling process, one record batch at a time.
+
+    Args:
+        xml_files (dict or iterable): A dict of filename to XML content, or an iterable of
+            (filename, xml_content) pairs such as xml_downloader.iter_xml_members or
+            archive_index.iter_indexed_members for a selection of members.
+        state_filter (str): The two-letter state abbreviation to filter for.
+        get_ntee_code_description (callable): Callback used to enrich records with NTEE data,
+            or None to leave enrichment to a later stage (see enrich_records).
+        workers (int): Number of parser processes; 1 parses in the calling process.
+        prefetch_ntee_codes (callable): Optional batch callback, see enrich_records.
+
+    Returns:
+        tuple: (records, no_total_assets_files), where records is a RecordStore. Only the
+        first NO_TOTAL_ASSETS_SAMPLE_LIMIT entries of no_total_assets_files keep their XML
+        content; the rest map to None.
+    """
+    records = RecordStore()
     no_revenue_files = set()
     no_exp_files = set()
     no_ass_files = set()
@@ -50,74 +351,41 @@ def process_xml_files(xml_files, state_filter, get_ntee_code_description):
     no_total_assets_files = {}
     start_time = time.time()
 
+    total_files_processed = 0
     total_returns_processed = 0
+    total_files_prefiltered = 0
     field_extraction_stats = {field: 0 for field in desired_fields.keys()}
 
-    for filename, xml_content in xml_files.items():
-        try:
-            tree = etree.fromstring(xml_content)
-            ns = {'irs': 'http://www.irs.gov/efile'}
+    if isinstance(xml_files, dict):
+        xml_files = xml_files.items()
 
-            Returns = tree.xpath('//irs:Return', namespaces=ns)
-            if not Returns:
-                logger.debug(f"No Return elements found in {filename}")
-                continue
+    for filename, xml_content, result in _iter_parsed_files(xml_files, state_filter, workers):
+        total_files_processed += 1
+        total_returns_processed += result['returns_processed']
+        total_files_prefiltered += result['prefiltered']
+        for field, count in result['field_extraction_stats'].items():
+            field_extraction_stats[field] += count
 
-            file_missing_revenue = False
-            file_missing_expenses = False
-            file_missing_assets = False
-            file_missing_net_assets = False
-
-            for Return in Returns:
-                total_returns_processed += 1
-                try:
-                    data = parse_return(Return, ns, filename)
-                    logger.debug(f"Parsed data for {filename}: {data}")
-                    if data and is_state_nonprofit(data, state_filter):
-                        organization_name = data.get('OrganizationName', '')
-                        mission_statement = data.get('MissionStatement', '')
-                        ein = data.get('EIN', '')  # Get the EIN from the parsed data
-                        ntee_info = get_ntee_code_description(organization_name, mission_statement, ein)
-                        data['NTEECode'] = ntee_info.get('ntee_code', '')
-                        data['NTEEDescription'] = ntee_info.get('ntee_description', '')
-
-                        records.append(data)
-                        state_files.add(filename)
-                        logger.info(f"Added record for {state_filter} nonprofit from {filename}")
-
-                        for field in desired_fields.keys():
-                            if field in data and data[field] is not None:
-                                field_extraction_stats[field] += 1
-
-                        if 'TotalRevenue' not in data or data['TotalRevenue'] is None:
-                            file_missing_revenue = True
-                        if 'TotalExpenses' not in data or data['TotalExpenses'] is None:
-                            file_missing_expenses = True
-                        if 'TotalAssets' not in data or data['TotalAssets'] is None:
-                            file_missing_assets = True
-                        if 'TotalNetAssets' not in data or data['TotalNetAssets'] is None:
-                            file_missing_net_assets = True
-                    else:
-                        logger.debug(f"Record from {filename} did not match state filter {state_filter} or had no data")
-                    
-                except Exception as e:
-                    logger.error(f'Error processing Return in {filename}: {e}')
-
-            if file_missing_revenue:
-                no_revenue_files.add(filename)
-            if file_missing_expenses:
-                no_exp_files.add(filename)
-            if file_missing_assets:
-                no_ass_files.add(filename)
-            if file_missing_net_assets:
-                no_nass_files.add(filename)
-            if file_missing_assets:
-                no_total_assets_files[filename] = xml_content
+        records.append_records(result['records'])
 
-        except Exception as e:
-            logger.error(f'Error processing {filename}: {e}')
+        missing_fields = result['missing_fields']
+        if 'TotalRevenue' in missing_fields:
+            no_revenue_files.add(filename)
+        if 'TotalExpenses' in missing_fields:
+            no_exp_files.add(filename)
+        if 'TotalAssets' in missing_fields:
+            no_ass_files.add(filename)
+            # Only keep the content needed for the S3 samples so streaming stays bounded
+            keep_content = len(no_total_assets_files) < NO_TOTAL_ASSETS_SAMPLE_LIMIT
+            no_total_assets_files[filename] = xml_content if keep_content else None
+        if 'TotalNetAssets' in missing_fields:
+            no_nass_files.add(filename)
 
-    print_summary(start_time, xml_files, records, total_returns_processed, state_filter, field_extraction_stats, 
-                  no_revenue_files, no_exp_files, no_ass_files, no_nass_files, no_total_assets_files)
+    records.flush()
+    if get_ntee_code_description is not None:
+        enrich_records(records, get_ntee_code_description, prefetch_ntee_codes)
+    print_summary(start_time, total_files_processed, records, total_returns_processed, state_filter, field_extraction_stats, 
+                  no_revenue_files, no_exp_files, no_ass_files, no_nass_files, no_total_assets_files,
+                  total_files_prefiltered)
 
     return records, no_total_assets_files
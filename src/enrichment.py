@@ -0,0 +1,154 @@
+# enrichment.py
+
+import time
+import pyarrow as pa
+import pyarrow.compute as pc
+from logger import logger
+from config import RECORD_BATCH_SIZE
+from record_store import RecordStore
+from bmf_enrichment import join_bmf_ntee_codes, missing_ntee_codes
+
+def lookup_keys(table):
+    """
+    Returns the key each record is resolved by: its EIN, or its name and mission for records
+    without an EIN, so such records are still resolved once per organization.
+    """
+    names = pc.fill_null(pc.cast(table['OrganizationName'], pa.string()), '')
+    missions = pc.fill_null(pc.cast(table['MissionStatement'], pa.string()), '')
+    by_name = pc.binary_join_element_wise('name:', names, missions, '\x1f')
+    eins = pc.cast(table['EIN'], pa.string())
+    return pc.if_else(pc.fill_null(pc.not_equal(eins, ''), False), eins, by_name)
+
+def unique_organizations(table):
+    """
+    Returns one row per lookup key with the key, EIN, organization name and mission statement
+    of its first record, in the order the keys first appear.
+    """
+    organizations = pa.table({
+        'key': lookup_keys(table),
+        'EIN': pc.cast(table['EIN'], pa.string()),
+        'OrganizationName': pc.cast(table['OrganizationName'], pa.string()),
+        'MissionStatement': pc.cast(table['MissionStatement'], pa.string()),
+        'row': pa.array(range(table.num_rows), type=pa.int64()),
+    })
+    organizations = organizations.group_by('key', use_threads=False).aggregate([
+        ('EIN', 'first'), ('OrganizationName', 'first'), ('MissionStatement', 'first'), ('row', 'min')
+    ])
+    organizations = organizations.sort_by('row_min')
+    return pa.table({
+        'key': organizations['key'],
+        'EIN': organizations['EIN_first'],
+        'OrganizationName': organizations['OrganizationName_first'],
+        'MissionStatement': organizations['MissionStatement_first'],
+    })
+
+class EnrichmentStage:
+    """
+    Resolves the NTEE codes of a whole record set after parsing, once per organization.
+
+    Records are resolved in tiers, each only seeing what the previous ones left over:
+
+    1. bmf: one join against the local BMF index, when there is one (see bmf_enrichment).
+    2. prefetch: the distinct remaining organizations are handed to prefetch_ntee_codes in
+       batches, which fetches cached and API codes concurrently, classifies the rest locally
+       and infers the low-confidence ones with the LLM in batched requests.
+    3. lookup: get_ntee_code_description is called once per distinct organization, answering
+       from what the prefetch gathered.
+    4. join: the answers are joined back onto every record of the organization at once.
+
+    Records that already have an NTEE code keep it. The time spent in each tier is kept in
+    timings and logged by summary().
+    """
+
+    def __init__(self, get_ntee_code_description, prefetch_ntee_codes=None, bmf_index=None,
+                 batch_size=RECORD_BATCH_SIZE):
+        self.get_ntee_code_description = get_ntee_code_description
+        self.prefetch_ntee_codes = prefetch_ntee_codes
+        self.bmf_index = bmf_index
+        self.batch_size = batch_size
+        self.timings = {}
+        self.counts = {}
+
+    def _timed(self, stage, start_time):
+        self.timings[stage] = self.timings.get(stage, 0.0) + time.time() - start_time
+
+    def _prefetch(self, organizations):
+        for start in range(0, organizations.num_rows, self.batch_size):
+            batch = organizations.slice(start, self.batch_size)
+            try:
+                self.prefetch_ntee_codes(batch['EIN'].to_pylist(), batch['OrganizationName'].to_pylist(),
+                                         batch['MissionStatement'].to_pylist())
+            except Exception as e:
+                logger.error(f"Error prefetching NTEE codes for {batch.num_rows} organizations: {e}")
+
+    def _lookup(self, organizations):
+        ntee_codes = []
+        ntee_descriptions = []
+        columns = [organizations[name].to_pylist() for name in ['EIN', 'OrganizationName', 'MissionStatement']]
+        for ein, organization_name, mission_statement in zip(*columns):
+            try:
+                ntee_info = self.get_ntee_code_description(organization_name or '', mission_statement or '', ein or '')
+                ntee_codes.append(ntee_info.get('ntee_code', ''))
+                ntee_descriptions.append(ntee_info.get('ntee_description', ''))
+            except Exception as e:
+                logger.error(f"Error enriching records of EIN {ein}: {e}")
+                ntee_codes.append(None)
+                ntee_descriptions.append(None)
+        return pa.array(ntee_codes, type=pa.string()), pa.array(ntee_descriptions, type=pa.string())
+
+    def _join(self, table, missing, keys, ntee_codes, ntee_descriptions):
+        positions = pc.index_in(lookup_keys(table), value_set=keys)
+        fill = pc.and_(missing, pc.is_valid(positions))
+        for name, values in [('NTEECode', ntee_codes), ('NTEEDescription', ntee_descriptions)]:
+            field = table.schema.field(name)
+            column = pc.if_else(fill, pc.take(values, positions), pc.cast(table[name], pa.string()))
+            table = table.set_column(table.schema.get_field_index(name), field, column.cast(field.type))
+        return table
+
+    def run(self, records):
+        """
+        Enriches a RecordStore or pyarrow.Table of records with NTEE codes and descriptions.
+
+        Returns:
+            The enriched RecordStore, updated in place, or a new Table.
+        """
+        table = records.to_table() if isinstance(records, RecordStore) else records
+        self.counts['records'] = table.num_rows
+        if table.num_rows:
+            if self.bmf_index is not None:
+                start_time = time.time()
+                table, _ = join_bmf_ntee_codes(table, self.bmf_index)
+                self._timed('bmf', start_time)
+
+            missing = missing_ntee_codes(table['NTEECode'])
+            organizations = unique_organizations(table.filter(missing))
+            self.counts['records_left_after_bmf'] = pc.sum(missing).as_py() or 0
+            self.counts['organizations_looked_up'] = organizations.num_rows
+
+            if organizations.num_rows:
+                if self.prefetch_ntee_codes is not None:
+                    start_time = time.time()
+                    self._prefetch(organizations)
+                    self._timed('prefetch', start_time)
+
+                start_time = time.time()
+                ntee_codes, ntee_descriptions = self._lookup(organizations)
+                self._timed('lookup', start_time)
+
+                start_time = time.time()
+                table = self._join(table, missing, organizations['key'].combine_chunks(), ntee_codes, ntee_descriptions)
+                self._timed('join', start_time)
+
+        logger.info(self.summary())
+        if isinstance(records, RecordStore):
+            records.replace_table(table)
+            return records
+        return table
+
+    def summary(self):
+        summary = (f"NTEE enrichment of {self.counts.get('records', 0)} records: "
+                   f"{self.counts.get('records_left_after_bmf', 0)} without a BMF code, "
+                   f"{self.counts.get('organizations_looked_up', 0)} distinct organizations looked up\n")
+        for stage, seconds in self.timings.items():
+            summary += f"  {stage}: {seconds:.2f} seconds\n"
+        return summary
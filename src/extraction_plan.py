@@ -0,0 +1,118 @@
+# extraction_plan.py
+
+import re
+from functools import partial
+from lxml import etree
+from logger import logger
+from config import desired_fields, RETURN_SCOPED_EXTRACTION
+from utils import convert_value
+
+FORM_TYPES = ['990', '990EZ', '990PF', '990T', 'Unknown']
+IRS_NAMESPACES = {'irs': 'http://www.irs.gov/efile'}
+# Absolute '//' location paths at the start of an expression, of a function argument or of a union member
+_SCOPE_RE = re.compile(r'(^|[(,|]\s*)//')
+
+class ExtractionPlan:
+    """
+    Precompiled extraction plan for the fields in config.desired_fields.
+
+    Every path is compiled into an etree.XPath object once, and for each form type the fields
+    are stored with their ordered paths (form-specific paths first, then Common paths) and a
+    bound type converter. Extracting a Return then only evaluates precompiled callables.
+
+    With scoped=True every absolute '//' location path is evaluated as './/' relative to the
+    Return, so a Return inside a multi-Return document only sees its own values and each query
+    costs O(Return) rather than O(document). Recorded paths keep their configured form.
+    """
+
+    def __init__(self, fields, namespaces=IRS_NAMESPACES, scoped=False):
+        self.fields = fields
+        self.namespaces = namespaces
+        self.scoped = scoped
+        self._compiled = {}
+        self.plans = {form_type: self._build_form_plan(form_type) for form_type in FORM_TYPES}
+
+    def _compile(self, path):
+        if not path.startswith('/'):
+            path = './' + path
+        if path not in self._compiled:
+            use_namespaces = not ('local-name()' in path or '/*' in path)
+            expression = _SCOPE_RE.sub(r'\1.//', path) if self.scoped else path
+            try:
+                self._compiled[path] = etree.XPath(
+                    expression, namespaces=self.namespaces if use_namespaces else None, smart_strings=False
+                )
+            except etree.XPathSyntaxError as e:
+                logger.warning(f"Skipping invalid path '{path}': {str(e)}")
+                self._compiled[path] = None
+        return path, self._compiled[path]
+
+    def _build_form_plan(self, form_type):
+        plan = []
+        for field_name, field_info in self.fields.items():
+            paths_info = field_info.get('paths', {})
+            if not paths_info:
+                logger.warning(f"No paths defined for field '{field_name}'. Skipping extraction.")
+                continue
+            # Form-specific paths take precedence
+            paths = paths_info.get(form_type, []) + paths_info.get('Common', [])
+            compiled_paths = [(path, xpath) for path, xpath in map(self._compile, paths) if xpath is not None]
+            converter = partial(convert_value, type_=field_info.get('type', 'string'))
+            plan.append((field_name, converter, compiled_paths))
+        return plan
+
+    def fields_for(self, form_type):
+        """
+        Returns the (field_name, converter, [(path, xpath), ...]) entries for a form type.
+        """
+        return self.plans.get(form_type, self.plans['Unknown'])
+
+    def extract_first(self, element, field_name, compiled_paths):
+        """
+        Evaluates compiled paths in order and returns (value, path) for the first non-empty result.
+
+        Empty node-sets and false, zero or empty string results fall through to the next path,
+        while a whitespace-only match yields ''.
+        """
+        for path, xpath in compiled_paths:
+            try:
+                result = xpath(element)
+            except Exception as e:
+                logger.error(f"Error extracting {field_name} using path '{path}': {str(e)}")
+                continue
+
+            if not result:
+                continue
+            if isinstance(result, list):
+                result = result[0]
+            # Handle cases where the result is an element, a string, or a number
+            if isinstance(result, etree._Element):
+                value = result.text
+            elif isinstance(result, str):
+                value = result
+            else:
+                value = str(result)
+
+            if value:
+                return value.strip(), path
+        return None, None
+
+    def extract(self, element, form_type):
+        """
+        Returns a list of (field_name, converter, value, path) for the fields of a form type.
+
+        value and path are None for fields that were not found.
+        """
+        return [(field_name, converter) + self.extract_first(element, field_name, compiled_paths)
+                for field_name, converter, compiled_paths in self.fields_for(form_type)]
+
+    def extract_field(self, element, field_name, form_type):
+        """
+        Extracts a single field from a Return using the plan for its form type.
+        """
+        for name, _, compiled_paths in self.fields_for(form_type):
+            if name == field_name:
+                return self.extract_first(element, field_name, compiled_paths)
+        return None, None
+
+EXTRACTION_PLAN = ExtractionPlan(desired_fields, scoped=RETURN_SCOPED_EXTRACTION)
@@ -0,0 +1,120 @@
+# header_prefilter.py
+
+import re
+
+MATCH = 'match'
+NO_MATCH = 'no_match'
+AMBIGUOUS = 'ambiguous'
+
+_PREFIX = rb'(?:[\w.-]+:)?'
+_RETURN_OPEN_RE = re.compile(rb'<' + _PREFIX + rb'Return[\s>]')
+_HEADER_RE = re.compile(rb'<(' + _PREFIX + rb')ReturnHeader[\s>].*?</\1ReturnHeader\s*>', re.S)
+_HEADER_OPEN_RE = re.compile(rb'<' + _PREFIX + rb'ReturnHeader[\s>]')
+_TAG_RE = re.compile(rb'<(/?)' + _PREFIX + rb'([\w.-]+)[^>]*?(/?)>([^<]*)')
+
+# Element paths matched by the first two State paths in config.desired_fields
+_STATE_PATHS = [(b'ReturnHeader', b'Filer', b'USAddress', b'StateAbbreviationCd'),
+                (b'ReturnHeader', b'Filer', b'BusinessOfficeGrp', b'USAddress', b'StateAbbreviationCd')]
+_FILER_PATH = (b'ReturnHeader', b'Filer')
+_EIN_PATH = (b'ReturnHeader', b'Filer', b'EIN')
+# Element paths matched by the TaxYear paths in config.desired_fields, in order
+_TAX_YEAR_PATHS = [(b'ReturnHeader', b'TaxYr'), (b'ReturnHeader', b'TaxYear')]
+_FORM_TYPE_PATH = (b'ReturnHeader', b'ReturnTypeCd')
+_RETURN_VERSION_RE = re.compile(rb'\sreturnVersion\s*=\s*["\']([^"\']*)["\']')
+
+def _header_elements(header_block):
+    """
+    Tokenizes the ReturnHeader block into (path, text) pairs for every element, where text is
+    the character data directly after the start tag. Returns None if the tags do not nest.
+    """
+    elements = []
+    stack = []
+    for match in _TAG_RE.finditer(header_block):
+        closing, name, self_closing, text = match.groups()
+        if closing:
+            if not stack or stack[-1] != name:
+                return None
+            stack.pop()
+            continue
+        stack.append(name)
+        elements.append((tuple(stack), text))
+        if self_closing:
+            stack.pop()
+    return elements if not stack else None
+
+def _first_text(elements, paths):
+    for path in paths:
+        for element_path, text in elements:
+            if element_path == path:
+                return text.strip().decode('ascii', errors='replace') or None
+    return None
+
+def scan_header(xml_content):
+    """
+    Reads the filer's State and EIN and the return's header fields from the raw bytes of a
+    single-Return document.
+
+    Only the ReturnHeader is inspected and no XML tree is built. The State is reported only
+    when the full parse is guaranteed to extract the same value: the document holds a single
+    Return with a single Filer, and the Filer contains exactly one StateAbbreviationCd-like
+    element, located at one of the configured USAddress paths and holding plain text. FormType
+    is the header's ReturnTypeCd, e.g. '990EZ'.
+
+    Args:
+        xml_content (bytes): The raw XML document.
+
+    Returns:
+        dict: With the keys 'State', 'EIN', 'TaxYear', 'FormType' and 'returnVersion', each
+        None when absent. Returns None when the header cannot be read reliably from bytes
+        (e.g. multiple Returns or headers, comments, CDATA or UTF-16 input).
+    """
+    if not isinstance(xml_content, bytes) or xml_content.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return None
+    first_return = _RETURN_OPEN_RE.search(xml_content)
+    if not first_return:
+        return None
+    header = _HEADER_RE.search(xml_content, first_return.end())
+    if not header or _RETURN_OPEN_RE.search(xml_content, header.end()) or _HEADER_OPEN_RE.search(xml_content, header.end()):
+        return None
+    header_block = header.group(0)
+    if b'<!--' in header_block or b'<![CDATA[' in header_block or b'<?' in header_block:
+        return None
+    elements = _header_elements(header_block)
+    if elements is None or [path for path, _ in elements].count(_FILER_PATH) != 1:
+        return None
+    filer_elements = [(path, text) for path, text in elements if path[:2] == _FILER_PATH]
+
+    return_tag = xml_content[first_return.start():xml_content.find(b'>', first_return.start())]
+    return_version = _RETURN_VERSION_RE.search(return_tag)
+    tax_year = _first_text(elements, _TAX_YEAR_PATHS)
+    info = {
+        'State': None,
+        'EIN': None,
+        'TaxYear': int(tax_year) if tax_year and tax_year.isdigit() else None,
+        'FormType': _first_text(elements, [_FORM_TYPE_PATH]),
+        'returnVersion': return_version.group(1).decode('ascii', errors='replace') if return_version else None
+    }
+    state_elements = [(path, text) for path, text in filer_elements if b'StateAbbreviationCd' in path[-1]]
+    if len(state_elements) == 1:
+        path, text = state_elements[0]
+        state = text.strip()
+        if path in _STATE_PATHS and state and b'&' not in state:
+            info['State'] = state.decode('ascii', errors='replace')
+    for path, text in filer_elements:
+        if path == _EIN_PATH:
+            info['EIN'] = text.strip().replace(b'-', b'').decode('ascii', errors='replace') or None
+            break
+    return info
+
+def prefilter_state(xml_content, state_filter):
+    """
+    Decides from the raw bytes whether a document can match the state filter.
+
+    Returns:
+        str: NO_MATCH when the filer's state is known and differs, MATCH when it is known and
+        equal, and AMBIGUOUS when the document has to be fully parsed to decide.
+    """
+    info = scan_header(xml_content)
+    if not info or not info['State']:
+        return AMBIGUOUS
+    return MATCH if info['State'].upper() == state_filter.upper() else NO_MATCH
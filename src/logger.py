@@ -29,7 +29,7 @@ class CloudWatchFilter(logging.Filter):
             "Converting records to Parquet format.",
             "Uploaded file to s3://"
         ]
-        return any(record.message.startswith(msg) for msg in allowed_messages)
+        return any(record.getMessage().startswith(msg) for msg in allowed_messages)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -38,17 +38,22 @@ logging.basicConfig(level=logging.INFO,
                         logging.StreamHandler()
                     ])
 
-# Create CloudWatch handler
-cloudwatch_handler = watchtower.CloudWatchLogHandler(
-    log_group="NonprofitFinancialHealthPredictor",
-    stream_name="ApplicationLogs"
-)
-
-# Add CloudWatch filter
-cloudwatch_handler.addFilter(CloudWatchFilter())
-
-# Get the root logger and add the CloudWatch handler
+# Create CloudWatch handler. Without AWS credentials or a region, as in tests and local runs,
+# logs only go to the console.
 root_logger = logging.getLogger()
-root_logger.addHandler(cloudwatch_handler)
+try:
+    cloudwatch_handler = watchtower.CloudWatchLogHandler(
+        log_group="NonprofitFinancialHealthPredictor",
+        stream_name="ApplicationLogs"
+    )
+except Exception as e:
+    cloudwatch_handler = None
+    root_logger.warning(f"CloudWatch logging disabled: {e}")
+else:
+    # Add CloudWatch filter
+    cloudwatch_handler.addFilter(CloudWatchFilter())
+
+    # Add the CloudWatch handler to the root logger
+    root_logger.addHandler(cloudwatch_handler)
 
 logger = logging.getLogger(__name__)
@@ -8,25 +8,31 @@ import time
 import logging
 from datetime import datetime
 import subprocess
-from collections import Counter
 import pyarrow as pa
-import pyarrow.parquet as pq
 import boto3
-from io import BytesIO
-import pandas as pd
 import json
 import requests
-import csv
 from openai import OpenAI
 from dotenv import load_dotenv
 
 from available_urls import AVAILABLE_URLS
 
-from xml_downloader import download_and_extract_xml_files
-from data_processor import process_xml_files
+from pipeline import run_pipeline
+from enrichment import EnrichmentStage
+from bmf_enrichment import load_bmf_index
+from record_store import RecordStore, conform_table
+from parquet_dataset import ParquetDataset, S3Storage, import_legacy_parquet
+from ntee_cache import get_ntee_cache
+from propublica_client import ProPublicaClient
+from ntee_inference import NTEEInferenceClient, inference_key
+from ntee_classifier import get_ntee_classifier
+from ntee_reference import get_ntee_reference
 from data_analyzer import analyze_data
-from s3_utils import upload_file_to_s3, download_file_from_s3, get_s3_client
-from config import S3_BUCKET, S3_FOLDER, desired_fields
+from s3_utils import upload_many
+from config import (
+    S3_FOLDER, NO_TOTAL_ASSETS_SAMPLE_LIMIT, NTEE_CLASSIFIER_ENABLED,
+    BMF_ENRICHMENT_ENABLED
+)
 
 # Setup logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -47,11 +53,19 @@ LOG_STREAM_NAME = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
 successful_api_calls = 0
 unsuccessful_api_calls = 0
 openai_ntee_determinations = 0
+classifier_ntee_determinations = 0
 no_ntee_code_found = 0
 
 # List to store OpenAI inference attempts
 openai_inference_attempts = []
 
+# Concurrent ProPublica client and batched inference client, and their answers for the current run
+propublica_client = ProPublicaClient()
+ntee_inference_client = NTEEInferenceClient(client)
+prefetched_ntee_codes = {}
+prefetched_inferences = {}
+classified_ntee_codes = {}
+
 def send_logs_to_cloudwatch(message):
     try:
         cloudwatch_logs.create_log_stream(logGroupName=LOG_GROUP_NAME, logStreamName=LOG_STREAM_NAME)
@@ -69,8 +83,59 @@ def send_logs_to_cloudwatch(message):
         ]
     )
 
+def classify_ntee_code(organization_name, mission_statement):
+    """
+    Classifies an organization with the local NTEE classifier, once per name and mission.
+
+    Returns:
+        tuple: (ntee_code, confidence), with ntee_code None when the classification is
+        below the confidence threshold and the LLM should be asked instead.
+    """
+    if not NTEE_CLASSIFIER_ENABLED:
+        return None, 0.0
+    key = inference_key(organization_name, mission_statement)
+    if key not in classified_ntee_codes:
+        classifier = get_ntee_classifier()
+        ntee_code, confidence = classifier.classify(organization_name, mission_statement)
+        classified_ntee_codes[key] = (ntee_code if classifier.is_confident(confidence) else None, confidence)
+    return classified_ntee_codes[key]
+
+def prefetch_ntee_codes(eins, organization_names, mission_statements):
+    """
+    Fetches the NTEE codes of a batch of records concurrently, classifies those the API has
+    none for locally, and infers the codes of the low-confidence rest in batched requests,
+    so get_ntee_code_description can answer them without further network calls.
+    """
+    prefetched_ntee_codes.update(propublica_client.fetch_ntee_codes(eins))
+    without_code = [(organization_name, mission_statement)
+                    for ein, organization_name, mission_statement in zip(eins, organization_names, mission_statements)
+                    if not prefetched_ntee_codes.get(str(ein))]
+    unclassified = [organization for organization in without_code if not classify_ntee_code(*organization)[0]]
+    if unclassified:
+        prefetched_inferences.update(ntee_inference_client.infer_ntee_codes(unclassified))
+
 def get_ntee_code_from_api(ein):
     global successful_api_calls, unsuccessful_api_calls
+    # Prefetched and cached answers count as lookups, so the summary covers every EIN
+    if str(ein) in prefetched_ntee_codes:
+        ntee_code = prefetched_ntee_codes[str(ein)]
+        if ntee_code:
+            successful_api_calls += 1
+        else:
+            unsuccessful_api_calls += 1
+        return ntee_code
+
+    # NTEE codes rarely change, so answers from earlier runs are reused, including EINs the API has no code for
+    ntee_cache = get_ntee_cache()
+    found, ntee_code = ntee_cache.get('propublica', str(ein))
+    if found:
+        logger.debug(f"NTEE cache {'hit' if ntee_code else 'negative hit'} for EIN {ein}")
+        if ntee_code:
+            successful_api_calls += 1
+        else:
+            unsuccessful_api_calls += 1
+        return ntee_code
+
     url = f"https://projects.propublica.org/nonprofits/api/v2/organizations/{ein}.json"
     try:
         response = requests.get(url, timeout=10)
@@ -81,30 +146,42 @@ def get_ntee_code_from_api(ein):
             # Ensure we only keep the first 3 characters of the NTEE code
             ntee_code = ntee_code[:3]
             successful_api_calls += 1
+            ntee_cache.put('propublica', str(ein), ntee_code)
             time.sleep(0.5)  # Add delay to avoid throttling
             return ntee_code
         else:
             logger.warning(f"API response for EIN {ein} is missing NTEE code")
+            ntee_cache.put('propublica', str(ein), None)
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching NTEE code from API for EIN {ein}: {str(e)}")
+        # Only an unknown organization is a lasting answer; other errors are retried next run
+        if getattr(e.response, 'status_code', None) == 404:
+            ntee_cache.put('propublica', str(ein), None)
     except (KeyError, ValueError) as e:
         logger.error(f"Error parsing API response for EIN {ein}: {str(e)}")
     unsuccessful_api_calls += 1
     return None
 
 def get_ntee_description_from_csv(ntee_code):
-    csv_path = os.path.join(os.path.dirname(__file__), 'ntee_library.csv')
     try:
-        with open(csv_path, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row['NTEE Code'] == ntee_code:
-                    return row['Description']
+        description = get_ntee_reference().describe(ntee_code)
+        if description:
+            return description
     except Exception as e:
         logger.error(f"Error reading NTEE description from CSV for code {ntee_code}: {str(e)}")
     return "Description not found"
 
 def infer_ntee_code_with_gpt4(organization_name, mission_statement):
+    prefetched = prefetched_inferences.get(inference_key(organization_name, mission_statement))
+    if prefetched:
+        openai_inference_attempts.append({
+            "organization": organization_name,
+            "mission": mission_statement,
+            "response": prefetched,
+            "error": None
+        })
+        return prefetched["ntee_code"], prefetched["confidence"]
+
     prompt = f"""
     Given the following information about a nonprofit organization, infer the most appropriate NTEE (National Taxonomy of Exempt Entities) code. The NTEE code should be in the format of a letter followed by two digits (e.g., A01, B03, C30).
 
@@ -183,13 +260,19 @@ def infer_ntee_code_with_gpt4(organization_name, mission_statement):
         return None, 0.0
 
 def get_ntee_code_description(organization_name, mission_statement, ein):
-    global openai_ntee_determinations, no_ntee_code_found
+    global openai_ntee_determinations, classifier_ntee_determinations, no_ntee_code_found
     ntee_code = get_ntee_code_from_api(ein)
     if ntee_code:
         ntee_description = get_ntee_description_from_csv(ntee_code)
         return {"ntee_code": ntee_code, "ntee_description": ntee_description}
     else:
-        logger.warning(f"Failed to get NTEE code for EIN {ein} from API. Attempting to infer with GPT-4.")
+        classified_ntee_code, confidence = classify_ntee_code(organization_name, mission_statement)
+        if classified_ntee_code:
+            ntee_description = get_ntee_description_from_csv(classified_ntee_code)
+            logger.info(f"Classified NTEE code {classified_ntee_code} for EIN {ein} locally with confidence {confidence}")
+            classifier_ntee_determinations += 1
+            return {"ntee_code": classified_ntee_code, "ntee_description": ntee_description, "inferred": True, "confidence": confidence}
+        logger.warning(f"Failed to get NTEE code for EIN {ein} from API or the local classifier. Attempting to infer with GPT-4.")
         inferred_ntee_code, confidence = infer_ntee_code_with_gpt4(organization_name, mission_statement)
         if inferred_ntee_code:
             ntee_description = get_ntee_description_from_csv(inferred_ntee_code)
@@ -201,14 +284,23 @@ def get_ntee_code_description(organization_name, mission_statement, ein):
             no_ntee_code_found += 1
             return {"ntee_code": "Unknown", "ntee_description": "Unknown", "inferred": False}
 
-def upload_xml_content_to_s3(xml_content, s3_key):
-    try:
-        file_size = len(xml_content)
-        logger.info(f"Attempting to upload XML content (Size: {file_size} bytes)")
-        upload_file_to_s3(xml_content, s3_key)
-        logger.info(f"Successfully uploaded XML content to S3: {s3_key}")
-    except Exception as e:
-        logger.error(f"Error uploading XML content to S3: {str(e)}")
+def upload_xml_content_to_s3(xml_contents):
+    """
+    Uploads XML files concurrently (see s3_utils.upload_many).
+
+    Args:
+        xml_contents (dict): S3 key to XML content.
+
+    Returns:
+        list: The per-file results of upload_many.
+    """
+    total_size = sum(len(xml_content) for xml_content in xml_contents.values())
+    logger.info(f"Attempting to upload {len(xml_contents)} XML files (Size: {total_size} bytes)")
+    results = upload_many(xml_contents)
+    for result in results:
+        if result['error'] is None:
+            logger.info(f"Successfully uploaded XML content to S3: {result['key']}")
+    return results
 
 def run_new990_check():
     logger.info("Running new990.py to check for updates...")
@@ -231,65 +323,27 @@ def run_new990_check():
     logger.info("Continuing with the rest of the script...")
 
 def save_to_s3_parquet(records):
-    if not records:
+    """
+    Appends the records to the partitioned dataset (see parquet_dataset). Only new part files
+    are written; records saved again replace earlier ones when the dataset is read.
+    """
+    if not len(records):
         logger.warning('No valid records to save.')
         return
 
     logger.info('Converting records to Parquet format.')
-    new_df = pd.DataFrame(records)
+    new_table = records.to_table() if isinstance(records, RecordStore) else conform_table(pa.Table.from_pylist(records), lenient=True)
 
-    s3_key = f'{S3_FOLDER}/irs990_data.parquet'
-
-    s3_client = boto3.client('s3')
-    try:
-        s3_client.head_object(Bucket=S3_BUCKET, Key=s3_key)
-        file_exists = True
-    except:
-        file_exists = False
-
-    if file_exists:
-        logger.info('Existing Parquet file found. Downloading and merging data.')
-        existing_data = download_file_from_s3(s3_key)
-        existing_df = pd.read_parquet(BytesIO(existing_data))
-        existing_df['EIN'] = existing_df['EIN'].astype(str)
-
-        new_df['EIN'] = new_df['EIN'].astype(str)
-
-        merged_df = pd.concat([existing_df, new_df], ignore_index=True)
-        
-        merged_df.drop_duplicates(subset=['EIN', 'TaxYear'], keep='last', inplace=True)
-        
-        logger.info(f'Merged {len(new_df)} new or updated records with {len(existing_df)} existing records.')
-        logger.info(f'After deduplication, total records: {len(merged_df)}')
-    else:
-        logger.info('No existing Parquet file found. Creating new file.')
-        merged_df = new_df
-
-    merged_df['EIN'] = merged_df['EIN'].astype(str)
-
-    # Convert DataFrame to PyArrow Table
-    try:
-        merged_table = pa.Table.from_pandas(merged_df)
-    except pa.lib.ArrowInvalid as e:
-        logger.error(f"Error converting DataFrame to PyArrow Table: {str(e)}")
-        logger.info("Attempting to identify problematic columns...")
-        for column in merged_df.columns:
-            try:
-                pa.array(merged_df[column])
-            except pa.lib.ArrowInvalid as col_error:
-                logger.error(f"Error in column '{column}': {str(col_error)}")
-                logger.info(f"Sample data for '{column}': {merged_df[column].head()}")
-        return
-
-    local_parquet_file = 'temp_irs990_data.parquet'
-    pq.write_table(merged_table, local_parquet_file)
-
-    with open(local_parquet_file, 'rb') as f:
-        upload_file_to_s3(f.read(), s3_key)
-    
-    logger.info(f'Successfully uploaded merged data to S3: {s3_key}')
-    
-    os.remove(local_parquet_file)
+    # Values that do not fit the schema are saved as nulls, logged by conform_table
+    dataset = ParquetDataset()
+    if isinstance(dataset.storage, S3Storage):
+        try:
+            import_legacy_parquet(dataset)
+        except Exception as e:
+            logger.error(f"Could not import the legacy Parquet file into the dataset: {str(e)}")
+    entries = dataset.append(new_table)
+    logger.info(f"Successfully saved {new_table.num_rows} records to {len(entries)} partitions of "
+                f"{dataset.storage.uri('')}")
 
 def get_user_input():
     state = input("Enter the state abbreviation to filter for (e.g., GA), or press Enter to process all states: ").upper()
@@ -348,7 +402,7 @@ def print_openai_inference_summary():
     return summary
 
 def main():
-    global successful_api_calls, unsuccessful_api_calls, openai_ntee_determinations, no_ntee_code_found
+    global successful_api_calls, unsuccessful_api_calls, openai_ntee_determinations, classifier_ntee_determinations, no_ntee_code_found
     logger.info(f"Starting Nonprofit Financial Health Predictor at {datetime.now()}")
 
     try:
@@ -358,50 +412,70 @@ def main():
         logger.info(f"User selected state filter: {state_filter if state_filter else 'All states'}")
         logger.info(f"User selected {len(urls)} URLs to process")
         
-        all_records = []
+        all_records = RecordStore()
         total_files_processed = 0
         start_time = time.time()
         
         files_without_total_assets = {}
+        total_files_without_total_assets = 0
+
+        download_seconds = 0.0
+        parse_seconds = 0.0
+        failed_archives = []
         
-        for url in urls:
-            logger.info(f"Processing URL: {url}")
-            xml_files = download_and_extract_xml_files(url)
-            logger.info(f"Downloaded and extracted {len(xml_files)} XML files from {url}")
-            
-            if not xml_files:
-                logger.warning(f"No XML files were extracted from {url}")
+        # Records are enriched in one deduplicated stage once every archive is parsed
+        for result in run_pipeline(urls, state_filter, None):
+            url = result['url']
+            if result['error'] is not None:
+                logger.error(f"Skipping archive {url}: {str(result['error'])}")
+                failed_archives.append(url)
                 continue
-            
-            records, no_total_assets_files = process_xml_files(xml_files, state_filter, get_ntee_code_description)
+            if not result['file_count']:
+                continue
+            records = result['records']
+            no_total_assets_files = result['no_total_assets_files']
+            file_count = result['file_count']
             logger.info(f"Processed {len(records)} records from {url}")
             logger.info(f"Found {len(no_total_assets_files)} files without TotalAssets from {url}")
             
             all_records.extend(records)
-            files_without_total_assets.update(no_total_assets_files)
-            total_files_processed += len(xml_files)
+            total_files_without_total_assets += len(no_total_assets_files)
+            for file_name, xml_content in no_total_assets_files.items():
+                if xml_content is not None:
+                    files_without_total_assets[file_name] = xml_content
+            total_files_processed += file_count
+            download_seconds += result['download_seconds']
+            parse_seconds += result['parse_seconds']
             
-            logger.info(f"Files processed from this URL: {len(xml_files)}")
+            logger.info(f"Files processed from this URL: {file_count}")
             logger.info(f"Total records processed so far: {len(all_records)}")
 
+        parsed_time = time.time()
+        bmf_index = load_bmf_index() if BMF_ENRICHMENT_ENABLED else None
+        if BMF_ENRICHMENT_ENABLED and bmf_index is None:
+            logger.info("No BMF extracts found; enriching records through the API and LLM tiers")
+        enrichment = EnrichmentStage(get_ntee_code_description, prefetch_ntee_codes, bmf_index)
+        enrichment.run(all_records)
+        logger.info(f"Stage timings: download {download_seconds:.2f} seconds, parse {parse_seconds:.2f} seconds "
+                    f"(summed over archives, overlapping), enrichment {time.time() - parsed_time:.2f} seconds")
+
         end_time = time.time()
         processing_time = end_time - start_time
         logger.info(f"Processed {len(all_records)} {'all states' if state_filter is None else state_filter} nonprofit records from {total_files_processed} files in {processing_time:.2f} seconds")
+        if failed_archives:
+            logger.warning(f"{len(failed_archives)} of {len(urls)} archives failed and were skipped: {', '.join(failed_archives)}")
     
         if not all_records:
             logger.warning("No records were processed. This could be due to no matching records for the selected state or issues with data extraction.")
         
-        logger.info(f"Uploading files without TotalAssets to S3 (max 20 files)")
-        logger.info(f"Total files without TotalAssets: {len(files_without_total_assets)}")
-        for i, (file_name, xml_content) in enumerate(files_without_total_assets.items()):
-            s3_key = f"{S3_FOLDER}/NoTotalAssets/{file_name}"
-            logger.info(f"Attempting to upload file {i+1}: {file_name}")
-            upload_xml_content_to_s3(xml_content, s3_key)
-            if i == 19:
-                break
-
-        form_types = [r['FormType'] for r in all_records]
-        logger.info(f"Form type distribution: {dict(Counter(form_types))}")
+        logger.info(f"Uploading files without TotalAssets to S3 (max {NO_TOTAL_ASSETS_SAMPLE_LIMIT} files)")
+        logger.info(f"Total files without TotalAssets: {total_files_without_total_assets}")
+        samples = list(files_without_total_assets.items())[:NO_TOTAL_ASSETS_SAMPLE_LIMIT]
+        upload_xml_content_to_s3({f"{S3_FOLDER}/NoTotalAssets/{file_name}": xml_content
+                                  for file_name, xml_content in samples})
+
+        all_records.log_size()
+        logger.info(f"Form type distribution: {all_records.value_counts('FormType')}")
 
         # Use the new analyze_data function
         analyze_data(all_records)
@@ -411,19 +485,28 @@ def main():
         # Prepare summary of API calls and NTEE code determinations
         total_api_calls = successful_api_calls + unsuccessful_api_calls
         summary = f"\nSummary of API calls and NTEE code determinations:\n"
-        summary += f"Total Nonprofit Explorer API calls: {total_api_calls}\n"
-        summary += f"Successful Nonprofit Explorer API calls: {successful_api_calls}\n"
-        summary += f"Unsuccessful Nonprofit Explorer API calls: {unsuccessful_api_calls}\n"
+        summary += f"Archives that failed to download or parse: {len(failed_archives)} of {len(urls)}\n"
+        summary += f"Total Nonprofit Explorer lookups (API, prefetch or cache): {total_api_calls}\n"
+        summary += f"Nonprofit Explorer lookups with an NTEE code: {successful_api_calls}\n"
+        summary += f"Nonprofit Explorer lookups without an NTEE code: {unsuccessful_api_calls}\n"
+        summary += f"NTEE codes determined by the local classifier: {classifier_ntee_determinations}\n"
         summary += f"NTEE codes determined by OpenAI: {openai_ntee_determinations}\n"
         summary += f"Records with no NTEE code found: {no_ntee_code_found}\n"
+        summary += propublica_client.summary()
+        if NTEE_CLASSIFIER_ENABLED:
+            summary += get_ntee_classifier().summary()
+        summary += ntee_inference_client.summary()
+        summary += get_ntee_cache().summary()
+        summary += enrichment.summary()
 
         if total_api_calls > 0:
             success_rate = (successful_api_calls / total_api_calls) * 100
-            summary += f"Nonprofit Explorer API success rate: {success_rate:.2f}%\n"
+            summary += f"Nonprofit Explorer lookup success rate: {success_rate:.2f}%\n"
 
-        total_ntee_attempts = total_api_calls + openai_ntee_determinations
+        # Every organization is looked up once, then classified or inferred when the lookup has no code
+        total_ntee_attempts = total_api_calls
         if total_ntee_attempts > 0:
-            ntee_success_rate = ((successful_api_calls + openai_ntee_determinations) / total_ntee_attempts) * 100
+            ntee_success_rate = ((successful_api_calls + classifier_ntee_determinations + openai_ntee_determinations) / total_ntee_attempts) * 100
             summary += f"Overall NTEE code determination success rate: {ntee_success_rate:.2f}%\n"
 
         # Add OpenAI inference summary
@@ -439,6 +522,8 @@ def main():
         logger.error(f"An error occurred: {str(e)}")
         logger.exception("Exception details:")
         send_logs_to_cloudwatch(f"An error occurred: {str(e)}\nException details: {logger.exception('Exception details:')}")
+    finally:
+        propublica_client.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
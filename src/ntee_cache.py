@@ -0,0 +1,148 @@
+# ntee_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from logger import logger
+from config import NTEE_CACHE_PATH, NTEE_CACHE_TTL, NTEE_CACHE_NEGATIVE_TTL
+
+class NTEECache:
+    """
+    Persistent key/value cache for NTEE lookups, stored in SQLite.
+
+    Entries live in namespaces (e.g. 'propublica' for EIN lookups) and are either hits, holding
+    a JSON value, or negative results recording that the source had nothing for the key. Hits
+    and negative results expire after separate TTLs so a missing code is retried sooner than a
+    known one is refreshed.
+
+    The database runs in WAL mode and every thread gets its own connection, so concurrent
+    readers never block and writers from several threads or processes wait on the busy timeout
+    instead of failing.
+    """
+
+    def __init__(self, path=NTEE_CACHE_PATH, ttl=NTEE_CACHE_TTL, negative_ttl=NTEE_CACHE_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT, negative INTEGER NOT NULL, '
+                'updated_at REAL NOT NULL, PRIMARY KEY (namespace, key))'
+            )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, namespace, key):
+        """
+        Looks up a key.
+
+        Returns:
+            tuple: (found, value). found is False for a missing or expired entry; value is None
+            for a negative result.
+        """
+        return self.get_many(namespace, [key]).get(key, (False, None))
+
+    def get_many(self, namespace, keys):
+        """
+        Looks up several keys in one query. If the cache cannot be read every key is a miss.
+
+        Returns:
+            dict: key to (found, value) for every key, as returned by get.
+        """
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        rows = {}
+        try:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                query = (f'SELECT key, value, negative, updated_at FROM entries '
+                         f'WHERE namespace = ? AND key IN ({",".join("?" * len(batch))})')
+                for key, value, negative, updated_at in self._connection().execute(query, [namespace] + batch):
+                    rows[key] = (value, negative, updated_at)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading {len(keys)} entries from the NTEE cache: {str(e)}")
+            rows = {}
+
+        results = {}
+        for key in keys:
+            value, negative, updated_at = rows.get(key, (None, 0, None))
+            if updated_at is None or now - updated_at > (self.negative_ttl if negative else self.ttl):
+                self._count('misses')
+                results[key] = (False, None)
+            elif negative:
+                self._count('negative_hits')
+                results[key] = (True, None)
+            else:
+                self._count('hits')
+                results[key] = (True, json.loads(value))
+        return results
+
+    def put(self, namespace, key, value):
+        """
+        Stores a hit, or a negative result when value is None.
+        """
+        self.put_many(namespace, {key: value})
+
+    def put_many(self, namespace, values):
+        """
+        Stores several keys in one transaction. None values are stored as negative results.
+        """
+        now = time.time()
+        rows = [(namespace, key, None if value is None else json.dumps(value), int(value is None), now)
+                for key, value in values.items()]
+        try:
+            with self._connection() as connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO entries (namespace, key, value, negative, updated_at) VALUES (?, ?, ?, ?, ?)',
+                    rows
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error writing {len(rows)} entries to the NTEE cache: {str(e)}")
+
+    def stats(self):
+        return {'hits': self.hits, 'negative_hits': self.negative_hits, 'misses': self.misses}
+
+    def summary(self):
+        """
+        Returns the cache counters as lines for the run summary.
+        """
+        lookups = self.hits + self.negative_hits + self.misses
+        hit_rate = ((self.hits + self.negative_hits) / lookups * 100) if lookups else 0
+        return (f"NTEE cache hits: {self.hits}\n"
+                f"NTEE cache negative hits: {self.negative_hits}\n"
+                f"NTEE cache misses: {self.misses}\n"
+                f"NTEE cache hit rate: {hit_rate:.2f}%\n")
+
+_ntee_cache = None
+_ntee_cache_lock = threading.Lock()
+
+def get_ntee_cache():
+    """
+    Returns the shared NTEE cache, creating it on first use.
+    """
+    global _ntee_cache
+    with _ntee_cache_lock:
+        if _ntee_cache is None:
+            _ntee_cache = NTEECache()
+        return _ntee_cache
@@ -0,0 +1,135 @@
+# ntee_classifier.py
+
+import re
+import math
+from collections import Counter, defaultdict
+from logger import logger
+from config import NTEE_CLASSIFIER_MIN_CONFIDENCE
+from ntee_reference import get_ntee_reference
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in inc includes including is it its of on or other
+organization organizations org such that the their them these this those to was were which whose
+with within primary purpose purposes provide provides major group area nonprofit
+""".split())
+
+def tokenize(text):
+    """
+    Splits text into lowercase terms, dropping stopwords and folding simple plurals.
+    """
+    terms = []
+    for token in _TOKEN_RE.findall((text or '').lower()):
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        if len(token) > 4 and token.endswith('ies'):
+            token = token[:-3] + 'y'
+        elif len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+def load_category_documents(reference=None):
+    """
+    Builds the text describing each three-character NTEE code from the NTEE reference index.
+
+    Returns:
+        dict: NTEE code to its document text.
+    """
+    reference = reference or get_ntee_reference()
+    documents = {}
+    for code in reference.codes:
+        name = reference.describe(code)
+        # The category name is repeated so it outweighs the longer description
+        documents[code] = ' '.join([name, name, reference.major_group_name(code) or '', reference.category_text(code)])
+    return documents
+
+class NTEEClassifier:
+    """
+    Offline TF-IDF classifier of organizations into NTEE codes.
+
+    Every code is a document built by load_category_documents. An organization's name and
+    mission statement are scored against all codes at once through an inverted index of
+    term to (code, weight) postings, so only codes sharing a term with the query are touched.
+    The confidence is the cosine similarity of the best code, discounted when the runner-up
+    scores almost as high.
+    """
+
+    def __init__(self, documents=None, min_confidence=NTEE_CLASSIFIER_MIN_CONFIDENCE):
+        documents = documents if documents is not None else load_category_documents()
+        self.min_confidence = min_confidence
+        self.codes = list(documents)
+        term_counts = [Counter(tokenize(text)) for text in documents.values()]
+        document_frequency = Counter(term for counts in term_counts for term in counts)
+        total = len(term_counts)
+        self.idf = {term: math.log((1 + total) / (1 + count)) + 1 for term, count in document_frequency.items()}
+
+        self.postings = defaultdict(list)
+        for index, counts in enumerate(term_counts):
+            weights = {term: (1 + math.log(count)) * self.idf[term] for term, count in counts.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            for term, weight in weights.items():
+                self.postings[term].append((index, weight / norm))
+        self.classified = 0
+        self.confident = 0
+        logger.info(f"Built NTEE classifier over {total} codes and {len(self.idf)} terms")
+
+    def classify(self, organization_name, mission_statement=''):
+        """
+        Scores an organization against every NTEE code.
+
+        Args:
+            organization_name (str): The organization's name.
+            mission_statement (str): The organization's mission statement, if any.
+
+        Returns:
+            tuple: (ntee_code, confidence), or (None, 0.0) when no term matches any code.
+        """
+        self.classified += 1
+        counts = Counter(tokenize(f"{organization_name or ''} {mission_statement or ''}"))
+        weights = {term: (1 + math.log(count)) * self.idf[term] for term, count in counts.items() if term in self.idf}
+        if not weights:
+            return None, 0.0
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        scores = defaultdict(float)
+        for term, weight in weights.items():
+            for index, document_weight in self.postings[term]:
+                scores[index] += weight * document_weight
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:2]
+        best_index, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        best /= norm
+        runner_up /= norm
+        confidence = round(best * (0.5 + 0.5 * (best - runner_up) / best), 4) if best > 0 else 0.0
+        if confidence >= self.min_confidence:
+            self.confident += 1
+        return self.codes[best_index], confidence
+
+    def classify_many(self, organizations):
+        """
+        Classifies (organization_name, mission_statement) pairs.
+
+        Returns:
+            list: (ntee_code, confidence) per pair, in order.
+        """
+        return [self.classify(name, mission) for name, mission in organizations]
+
+    def is_confident(self, confidence):
+        return confidence >= self.min_confidence
+
+    def summary(self):
+        return (f"Organizations scored by the local NTEE classifier: {self.classified}\n"
+                f"Local NTEE classifications above the confidence threshold: {self.confident}\n")
+
+_classifier = None
+
+def get_ntee_classifier():
+    """
+    Returns the process-wide classifier, building it on first use.
+    """
+    global _classifier
+    if _classifier is None:
+        _classifier = NTEEClassifier()
+    return _classifier
@@ -0,0 +1,158 @@
+# ntee_inference.py
+
+import re
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI
+from logger import logger
+from config import NTEE_INFERENCE_MODEL, NTEE_INFERENCE_BATCH_SIZE, NTEE_INFERENCE_CONCURRENCY
+from ntee_cache import get_ntee_cache
+
+_NTEE_CODE_RE = re.compile(r'^[A-Z]\d{2}')
+_JSON_RE = re.compile(r'\{.*\}', re.S)
+
+SYSTEM_PROMPT = ("You are an AI assistant tasked with inferring NTEE codes for nonprofit organizations "
+                 "based on their name and mission statement.")
+
+BATCH_PROMPT = """
+For each nonprofit organization listed below, infer the most appropriate NTEE (National Taxonomy of Exempt Entities) code. The NTEE code should be in the format of a letter followed by two digits (e.g., A01, B03, C30).
+
+Provide your response in the following JSON format, with one entry per organization id:
+{
+    "results": [
+        {"id": 0, "ntee_code": "X00", "confidence": 0.0}
+    ]
+}
+
+Where "ntee_code" is your inferred NTEE code, and "confidence" is a number between 0 and 1 indicating your confidence in this inference.
+
+Organizations:
+"""
+
+def normalize_text(text):
+    return ' '.join((text or '').lower().split())
+
+def inference_key(organization_name, mission_statement):
+    """
+    Returns the cache key of an organization: a sha256 of its normalized name and mission.
+    """
+    text = normalize_text(organization_name) + '\x1f' + normalize_text(mission_statement)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def parse_batch_response(content, count):
+    """
+    Parses a batch completion into a dict of organization id to {'ntee_code', 'confidence'}.
+
+    Entries with a malformed code are dropped.
+    """
+    match = _JSON_RE.search(content or '')
+    if not match:
+        raise ValueError('No JSON object in response')
+    results = {}
+    for item in json.loads(match.group(0)).get('results', []):
+        try:
+            index = int(item['id'])
+            ntee_code = str(item.get('ntee_code') or '').strip().upper()
+            confidence = float(item.get('confidence') or 0.0)
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= index < count and _NTEE_CODE_RE.match(ntee_code):
+            # Ensure we only keep the first 3 characters of the NTEE code
+            results[index] = {'ntee_code': ntee_code[:3], 'confidence': confidence}
+    return results
+
+class NTEEInferenceClient:
+    """
+    Infers NTEE codes with a chat completion model, many organizations per request.
+
+    Organizations are deduplicated by inference_key and looked up in the NTEE cache first.
+    The rest are packed batch_size at a time into one structured request, and up to
+    max_concurrency requests run at once. Inferred codes are cached, so the same name and
+    mission are never inferred twice; organizations missing from a response or in a failed
+    request are left uncached and retried on the next run.
+    """
+
+    def __init__(self, client=None, model=NTEE_INFERENCE_MODEL, batch_size=NTEE_INFERENCE_BATCH_SIZE,
+                 max_concurrency=NTEE_INFERENCE_CONCURRENCY, cache=None):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self.requests = 0
+        self.failed_requests = 0
+        self.inferred = 0
+
+    def _complete(self, organizations):
+        payload = [{'id': index, 'name': name or '', 'mission': mission or ''}
+                   for index, (name, mission) in enumerate(organizations)]
+        client = self.client or OpenAI()
+        response = client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": BATCH_PROMPT + json.dumps(payload)}
+            ],
+            temperature=0.2,
+            max_tokens=40 * len(organizations) + 50
+        )
+        logger.debug(f"Raw batch inference response: {response.choices[0].message.content}")
+        return parse_batch_response(response.choices[0].message.content, len(organizations))
+
+    def _infer_batch(self, keys, organizations):
+        try:
+            results = self._complete(organizations)
+        except Exception as e:
+            logger.error(f"Error inferring NTEE codes for a batch of {len(organizations)} organizations: {str(e)}")
+            return None
+        if len(results) < len(organizations):
+            logger.warning(f"Batch inference returned {len(results)} of {len(organizations)} NTEE codes")
+        return {keys[index]: result for index, result in results.items()}
+
+    def infer_ntee_codes(self, organizations):
+        """
+        Infers NTEE codes for (organization_name, mission_statement) pairs.
+
+        Args:
+            organizations (iterable): (organization_name, mission_statement) pairs.
+
+        Returns:
+            dict: inference_key to {'ntee_code': str, 'confidence': float} for every
+            organization with a cached or newly inferred code.
+        """
+        unique = {}
+        for name, mission in organizations:
+            unique.setdefault(inference_key(name, mission), (name, mission))
+        if not unique:
+            return {}
+
+        cache = self.cache or get_ntee_cache()
+        results = {}
+        missing = []
+        for key, (found, result) in cache.get_many('llm', list(unique)).items():
+            if found and result:
+                results[key] = result
+            else:
+                missing.append(key)
+
+        batches = [missing[start:start + self.batch_size] for start in range(0, len(missing), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=max(1, self.max_concurrency)) as executor:
+            futures = [executor.submit(self._infer_batch, keys, [unique[key] for key in keys]) for keys in batches]
+            for future in futures:
+                self.requests += 1
+                inferred = future.result()
+                if inferred is None:
+                    self.failed_requests += 1
+                    continue
+                cache.put_many('llm', inferred)
+                results.update(inferred)
+                self.inferred += len(inferred)
+
+        logger.info(f"Inferred NTEE codes for {len(results)} of {len(unique)} organizations "
+                    f"({len(unique) - len(missing)} from cache, {len(batches)} requests)")
+        return results
+
+    def summary(self):
+        return (f"Batched NTEE inference requests: {self.requests} ({self.failed_requests} failed)\n"
+                f"NTEE codes inferred in batches: {self.inferred}\n")
@@ -0,0 +1,122 @@
+# ntee_reference.py
+
+import os
+import csv
+import json
+from collections import Counter
+import pyarrow as pa
+import pyarrow.compute as pc
+from logger import logger
+
+NTEE_LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ntee_library.csv')
+NTEE_CODES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ntee_codes.json')
+
+def normalize_code(ntee_code):
+    """
+    Returns the three-character form of an NTEE code, e.g. ' b203' -> 'B20', or None.
+    """
+    ntee_code = (ntee_code or '').strip().upper()[:3]
+    return ntee_code or None
+
+class NTEEReference:
+    """
+    In-memory index of NTEE codes, built once from ntee_library.csv and ntee_codes.json.
+
+    ntee_library.csv names every major group ('B') and code ('B20'), and ntee_codes.json holds
+    the long description of each name. Names like "Alliances & Advocacy" repeat in every major
+    group, while ntee_codes.json only has one description for them, so such codes take their
+    long description from their major group instead.
+    """
+
+    def __init__(self, library_path=NTEE_LIBRARY_PATH, codes_path=NTEE_CODES_PATH):
+        with open(library_path, 'r') as csvfile:
+            rows = [(row['NTEE Code'].strip().upper(), row['Description'].strip()) for row in csv.DictReader(csvfile)]
+        with open(codes_path, 'r') as f:
+            self.category_descriptions = {' '.join(name.split()): text for name, text in json.load(f).items()}
+
+        self.descriptions = dict(rows)
+        self.major_groups = {code: name for code, name in rows if len(code) == 1}
+        self.codes = [code for code, _ in rows if len(code) == 3]
+        self._name_counts = Counter(self.descriptions[code] for code in self.codes)
+
+        # Lookup arrays for map_codes: every known code, its description, major group and group name
+        self._code_array = pa.array(list(self.descriptions), type=pa.string())
+        self._description_array = pa.array(list(self.descriptions.values()), type=pa.string())
+        self._major_group_array = pa.array([code[0] for code in self.descriptions], type=pa.string())
+        self._major_group_name_array = pa.array([self.major_groups.get(code[0]) for code in self.descriptions],
+                                                type=pa.string())
+        logger.info(f"Loaded NTEE reference index with {len(self.codes)} codes in {len(self.major_groups)} major groups")
+
+    def describe(self, ntee_code):
+        """
+        Returns the description of an NTEE code or major group letter, or None if unknown.
+        """
+        return self.descriptions.get(normalize_code(ntee_code))
+
+    def major_group(self, ntee_code):
+        """
+        Returns the major group letter of a known NTEE code, or None.
+        """
+        ntee_code = normalize_code(ntee_code)
+        return ntee_code[0] if ntee_code in self.descriptions else None
+
+    def major_group_name(self, ntee_code):
+        return self.major_groups.get(self.major_group(ntee_code))
+
+    def category_text(self, ntee_code):
+        """
+        Returns the long description of an NTEE code from ntee_codes.json, or ''.
+        """
+        ntee_code = normalize_code(ntee_code)
+        name = self.descriptions.get(ntee_code)
+        if name is None:
+            return ''
+        if len(ntee_code) == 3 and self._name_counts[name] > 1:
+            name = self.major_groups.get(ntee_code[0], '')
+        return self.category_descriptions.get(name, '')
+
+    def map_codes(self, ntee_codes):
+        """
+        Maps a whole column of NTEE codes to their descriptions and major groups at once.
+
+        Args:
+            ntee_codes (pyarrow.Array, pyarrow.ChunkedArray, pandas.Series or list): The codes;
+                they are normalized as in normalize_code, and unknown codes map to nulls.
+
+        Returns:
+            pyarrow.Table or pandas.DataFrame: NTEEDescription, NTEEMajorGroup and
+            NTEEMajorGroupName columns, one row per code. A DataFrame sharing the index of the
+            input is returned for a pandas Series.
+        """
+        index = None
+        if not isinstance(ntee_codes, (pa.Array, pa.ChunkedArray)):
+            # pandas Series are detected by duck typing so pandas is not needed for Arrow input
+            if hasattr(ntee_codes, 'index') and hasattr(ntee_codes, 'to_numpy'):
+                index = ntee_codes.index
+                ntee_codes = pa.Array.from_pandas(ntee_codes)
+            else:
+                ntee_codes = pa.array(ntee_codes, type=pa.string())
+
+        normalized = pc.utf8_slice_codeunits(pc.utf8_upper(pc.utf8_trim_whitespace(pc.cast(ntee_codes, pa.string()))), 0, 3)
+        positions = pc.index_in(normalized, value_set=self._code_array)
+        table = pa.table({
+            'NTEEDescription': pc.take(self._description_array, positions),
+            'NTEEMajorGroup': pc.take(self._major_group_array, positions),
+            'NTEEMajorGroupName': pc.take(self._major_group_name_array, positions),
+        })
+        if index is not None:
+            frame = table.to_pandas()
+            frame.index = index
+            return frame
+        return table
+
+_reference = None
+
+def get_ntee_reference():
+    """
+    Returns the process-wide NTEE reference index, loading it on first use.
+    """
+    global _reference
+    if _reference is None:
+        _reference = NTEEReference()
+    return _reference
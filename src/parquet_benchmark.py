@@ -0,0 +1,101 @@
+# parquet_benchmark.py
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from config import desired_fields, PARQUET_WRITER_PROFILES
+from record_store import RECORD_SCHEMA
+from parquet_writer import write_table
+from parquet_dataset import ParquetDataset, LocalStorage
+
+STATES = ['CA', 'NY', 'TX', 'FL', 'GA', 'IL', 'PA', 'OH', 'WA', 'MA']
+FORM_TYPES = ['990', '990EZ', '990PF']
+NTEE_CODES = ['B20', 'B82', 'E22', 'P20', 'T20', 'X20', 'Y40', 'A23']
+
+def synthetic_records(rows, seed=0):
+    """
+    Builds a table of made-up records shaped like RECORD_SCHEMA, with the value distributions of
+    real returns: few states, form types and paths, unique EINs and skewed amounts.
+    """
+    rng = random.Random(seed)
+    columns = {'FormType': [rng.choice(FORM_TYPES) for _ in range(rows)]}
+    for field_name, field_info in desired_fields.items():
+        type_ = field_info.get('type', 'string')
+        if field_name == 'State':
+            values = [rng.choice(STATES) for _ in range(rows)]
+        elif field_name == 'EIN':
+            values = [f'{rng.randrange(10 ** 9):09d}' for _ in range(rows)]
+        elif field_name == 'TaxYear':
+            values = [rng.choice([2019, 2020, 2021, 2022, 2023]) for _ in range(rows)]
+        elif field_name == 'NTEECode':
+            values = [rng.choice(NTEE_CODES) for _ in range(rows)]
+        elif type_ == 'int':
+            values = [int(rng.lognormvariate(3, 2)) for _ in range(rows)]
+        elif type_ == 'double':
+            values = [round(rng.lognormvariate(12, 2), 2) if rng.random() < 0.8 else None for _ in range(rows)]
+        elif type_ == 'boolean':
+            values = [rng.random() < 0.3 for _ in range(rows)]
+        else:
+            values = [f'{field_name} {rng.randrange(rows)}' if rng.random() < 0.7 else None for _ in range(rows)]
+        columns[field_name] = values
+        columns[f'{field_name}_path'] = [f'//{field_name}/{rng.randrange(3)}' for _ in range(rows)]
+    columns['_source_file'] = [f'{index // 100}.xml' for index in range(rows)]
+    return pa.table({name: pa.array(columns[name]) for name in RECORD_SCHEMA.names}).cast(RECORD_SCHEMA)
+
+def benchmark_profile(table, profile, directory):
+    """
+    Writes the table with a writer profile and times a full read and a filtered, projected scan.
+
+    Returns:
+        dict: File size in bytes, row groups, and write, read and scan times in seconds.
+    """
+    path = os.path.join(directory, f'{profile}.parquet')
+    start_time = time.time()
+    write_table(table, path, profile)
+    write_seconds = time.time() - start_time
+
+    start_time = time.time()
+    pq.read_table(path)
+    read_seconds = time.time() - start_time
+
+    # A typical analysis query: a few columns of one state, pruned by row group statistics
+    start_time = time.time()
+    scanned = pq.read_table(path, columns=['EIN', 'TaxYear', 'TotalAssets'], filters=[('State', '=', 'GA')])
+    pc.sum(scanned['TotalAssets'])
+    scan_seconds = time.time() - start_time
+
+    return {
+        'bytes': os.path.getsize(path),
+        'row_groups': pq.ParquetFile(path).metadata.num_row_groups,
+        'write_seconds': write_seconds,
+        'read_seconds': read_seconds,
+        'scan_seconds': scan_seconds,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the Parquet writer profiles on record data.')
+    parser.add_argument('--rows', type=int, default=200000, help='Number of synthetic records')
+    parser.add_argument('--local-dir', help='Benchmark on the records of a local dataset instead of synthetic ones')
+    parser.add_argument('--profiles', nargs='*', default=list(PARQUET_WRITER_PROFILES), help='Profiles to compare')
+    args = parser.parse_args()
+
+    if args.local_dir:
+        table = ParquetDataset(LocalStorage(args.local_dir)).read()
+    else:
+        table = synthetic_records(args.rows)
+
+    print(f"{table.num_rows} records, {table.nbytes} bytes in memory")
+    print('profile\tbytes\trow groups\twrite s\tread s\tscan s')
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in args.profiles:
+            result = benchmark_profile(table, profile, directory)
+            print(f"{profile}\t{result['bytes']}\t{result['row_groups']}\t{result['write_seconds']:.3f}\t"
+                  f"{result['read_seconds']:.3f}\t{result['scan_seconds']:.3f}")
+
+if __name__ == '__main__':
+    main()
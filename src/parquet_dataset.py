@@ -0,0 +1,439 @@
+# parquet_dataset.py
+
+import os
+import json
+import uuid
+import argparse
+from io import BytesIO
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+import botocore.exceptions
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from logger import logger
+from config import (
+    S3_BUCKET, DATASET_PREFIX, DATASET_LOCAL_DIR, LEGACY_PARQUET_KEY, DATASET_PARTITION_COLUMNS, DATASET_READ_THREADS,
+    DATASET_COMPACT_MIN_DELTAS, DATASET_COMPACT_MIN_DELTA_BYTES, DATASET_COMPACTION_PROFILE, PARQUET_WRITER_PROFILE
+)
+from record_store import RECORD_SCHEMA, conform_table
+from s3_utils import get_s3_client
+from s3_multipart import S3MultipartWriter
+from parquet_writer import write_table
+
+MANIFEST_NAME = '_manifest.json'
+MANIFEST_VERSION = 2
+UPSERT_KEYS = ('EIN', 'TaxYear')
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+class LocalStorage:
+    """
+    Dataset storage in a local directory, for tests and for runs without S3.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def uri(self, key):
+        return os.path.join(self.root, key)
+
+    def read(self, key):
+        try:
+            with open(self.uri(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key, data):
+        path = self.uri(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    @contextmanager
+    def open_write(self, key):
+        """
+        Opens a file to stream an object into; it appears at key once the block exits cleanly.
+        """
+        path = self.uri(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                yield f
+            os.replace(path + '.tmp', path)
+        except BaseException:
+            if os.path.exists(path + '.tmp'):
+                os.remove(path + '.tmp')
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(self.uri(key))
+        except FileNotFoundError:
+            pass
+
+class S3Storage:
+    """
+    Dataset storage under a prefix of an S3 bucket. Objects are written with one put_object,
+    or streamed through a multipart upload by open_write, so either way a reader sees the
+    whole object or none of it.
+    """
+
+    def __init__(self, bucket=S3_BUCKET, prefix=DATASET_PREFIX, client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = client
+
+    def _client(self):
+        if self.client is None:
+            self.client = get_s3_client()
+        return self.client
+
+    def _key(self, key):
+        return f'{self.prefix}/{key}' if self.prefix else key
+
+    def uri(self, key):
+        return f's3://{self.bucket}/{self._key(key)}'
+
+    def read(self, key):
+        try:
+            return self._client().get_object(Bucket=self.bucket, Key=self._key(key))['Body'].read()
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def write(self, key, data):
+        self._client().put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def open_write(self, key):
+        """
+        Returns an S3MultipartWriter streaming into the object; use it in a with block so a
+        failed write aborts the upload.
+        """
+        return S3MultipartWriter(self.bucket, self._key(key), client=self._client())
+
+    def delete(self, key):
+        self._client().delete_object(Bucket=self.bucket, Key=self._key(key))
+
+def get_dataset_storage():
+    """
+    Returns the configured dataset storage: DATASET_LOCAL_DIR when set, S3 otherwise.
+    """
+    if DATASET_LOCAL_DIR:
+        return LocalStorage(DATASET_LOCAL_DIR)
+    return S3Storage()
+
+def _partition_value(value):
+    return NULL_PARTITION if value is None else quote(str(value), safe='')
+
+def partition_path(partition):
+    """
+    Returns the Hive-style directory of a partition, e.g. 'TaxYear=2021/State=GA'.
+    """
+    return '/'.join(f'{name}={_partition_value(value)}' for name, value in partition.items())
+
+class ParquetDataset:
+    """
+    Parquet dataset partitioned Hive-style by DATASET_PARTITION_COLUMNS, with upserts by
+    (EIN, TaxYear) resolved on read.
+
+    Each append writes one small delta file to every partition its records fall in, tagged
+    with the next sequence number, and never reads or rewrites existing files, so a save
+    costs time proportional to the new records. Readers concatenate the files of the
+    partitions they need in sequence order and keep the latest row per (EIN, TaxYear) with
+    one hash aggregation (see keep_last_rows). compact() folds the deltas of a tax year into
+    one base file per partition once there are too many of them.
+
+    The partition columns are encoded in the directory names rather than stored in the files,
+    as Athena and DuckDB expect. The manifest (_manifest.json) lists the live files with their
+    partition values, kind, sequence number and row count. It is rewritten after the files are
+    in place, so readers that go through it never see a partial append or compaction and never
+    list the prefix. A single writer at a time is assumed.
+    """
+
+    def __init__(self, storage=None, partition_columns=DATASET_PARTITION_COLUMNS, schema=RECORD_SCHEMA,
+                 writer_profile=PARQUET_WRITER_PROFILE, compaction_profile=DATASET_COMPACTION_PROFILE):
+        self.storage = storage or get_dataset_storage()
+        self.partition_columns = list(partition_columns)
+        self.schema = schema
+        self.writer_profile = writer_profile
+        self.compaction_profile = compaction_profile
+        # Upserted records can move between partitions that are not part of the key, e.g. a
+        # filer changing state, so they are resolved across all partitions sharing the key ones
+        self.key_partition_columns = [name for name in self.partition_columns if name in UPSERT_KEYS]
+
+    def load_manifest(self):
+        data = self.storage.read(MANIFEST_NAME)
+        if data is None:
+            return {'version': MANIFEST_VERSION, 'partition_columns': self.partition_columns, 'next_sequence': 0,
+                    'files': []}
+        manifest = json.loads(data)
+        if manifest.get('partition_columns') != self.partition_columns:
+            raise ValueError(f"Dataset at {self.storage.uri('')} is partitioned by {manifest.get('partition_columns')}, "
+                             f"not {self.partition_columns}")
+        if manifest.get('version', 1) < 2:
+            # Version 1 part files were plain appends; they become deltas in append order
+            for sequence, entry in enumerate(manifest['files']):
+                entry.setdefault('kind', 'delta')
+                entry.setdefault('sequence', sequence)
+            manifest['next_sequence'] = len(manifest['files'])
+            manifest['version'] = MANIFEST_VERSION
+        return manifest
+
+    def save_manifest(self, manifest):
+        self.storage.write(MANIFEST_NAME, json.dumps(manifest, indent=1).encode('utf-8'))
+
+    def _split_partitions(self, table):
+        rows = pa.array(range(table.num_rows), type=pa.int64())
+        keys = table.select(self.partition_columns).append_column('_row', rows)
+        groups = keys.group_by(self.partition_columns, use_threads=False).aggregate([('_row', 'list')])
+        for group in groups.to_pylist():
+            partition = {name: group[name] for name in self.partition_columns}
+            yield partition, table.take(pa.array(group['_row_list'], type=pa.int64()))
+
+    def _write_part(self, key, table, profile):
+        # Row groups are streamed to storage as they are encoded, without a copy of the file
+        with self.storage.open_write(key) as sink:
+            write_table(table, sink, profile)
+            return sink.tell()
+
+    def _write_files(self, table, kind, sequence, run_id):
+        profile = self.compaction_profile if kind == 'base' else self.writer_profile
+        entries = []
+        for partition, part in self._split_partitions(table):
+            key = f'{partition_path(partition)}/{kind}-{sequence:08d}-{run_id}.parquet'
+            size = self._write_part(key, part.drop_columns(self.partition_columns), profile)
+            entries.append({'path': key, 'partition': partition, 'kind': kind, 'sequence': sequence,
+                            'num_rows': part.num_rows, 'size': size, 'run_id': run_id})
+        return entries
+
+    def append(self, table):
+        """
+        Writes a table of records as delta files with the next sequence number.
+
+        Returns:
+            list: The manifest entries of the files written.
+        """
+        table = conform_table(table, self.schema, lenient=True).select(self.schema.names)
+        if not table.num_rows:
+            return []
+        manifest = self.load_manifest()
+        sequence = manifest['next_sequence']
+        entries = self._write_files(table, 'delta', sequence, _run_id())
+        manifest['files'].extend(entries)
+        manifest['next_sequence'] = sequence + 1
+        self.save_manifest(manifest)
+        logger.info(f"Appended {table.num_rows} records to {self.storage.uri('')} as {len(entries)} delta files "
+                    f"with sequence {sequence}")
+        if self.compaction_candidates(manifest):
+            logger.info(f"Dataset {self.storage.uri('')} has tax years due for compaction; "
+                        f"run `python src/parquet_dataset.py compact`")
+        return entries
+
+    def import_legacy(self, table, source):
+        """
+        Imports the records of a single-file table written by earlier versions, once per source.
+
+        The records are written as base files with sequence 0 placed ahead of every other file,
+        so anything saved to the dataset since still wins over them. The source is recorded in
+        the manifest and importing it again does nothing.
+
+        Returns:
+            list: The manifest entries of the files written, empty if the source was imported before.
+        """
+        if source in self.load_manifest().get('imported', []):
+            logger.info(f"{source} was already imported into {self.storage.uri('')}")
+            return []
+        table = keep_last_rows(conform_table(table, self.schema, lenient=True).select(self.schema.names))
+        entries = self._write_files(table, 'base', 0, _run_id()) if table.num_rows else []
+
+        # Reload so files appended meanwhile are kept
+        manifest = self.load_manifest()
+        manifest['files'] = entries + manifest['files']
+        manifest.setdefault('imported', []).append(source)
+        self.save_manifest(manifest)
+        logger.info(f"Imported {table.num_rows} records from {source} into {self.storage.uri('')} as "
+                    f"{len(entries)} base files")
+        return entries
+
+    def live_files(self, manifest=None, **filters):
+        """
+        Returns the manifest entries of the live files, in sequence order, whose partition
+        values are in the given lists, e.g. live_files(TaxYear=[2021], State=['GA']).
+        """
+        files = (manifest or self.load_manifest())['files']
+        for name, values in filters.items():
+            if values is not None:
+                files = [entry for entry in files if entry['partition'].get(name) in values]
+        return sorted(files, key=lambda entry: entry['sequence'])
+
+    def _read_part(self, entry):
+        table = pq.read_table(BytesIO(self.storage.read(entry['path'])))
+        for name in self.partition_columns:
+            field = self.schema.field(name)
+            value = entry['partition'][name]
+            table = table.append_column(field, pa.array([value] * table.num_rows, type=field.type))
+        # Files written before a schema change are read with the current schema
+        return conform_table(table, self.schema, lenient=True).select(self.schema.names)
+
+    def _read_resolved(self, files):
+        if not files:
+            return self.schema.empty_table()
+        with ThreadPoolExecutor(max_workers=DATASET_READ_THREADS) as executor:
+            table = pa.concat_tables(list(executor.map(self._read_part, files)))
+        return keep_last_rows(table)
+
+    def read(self, **filters):
+        """
+        Reads the latest version of the records matching the partition filters (see live_files).
+
+        Files are pruned on the partition columns that are part of the (EIN, TaxYear) key,
+        merged in sequence order so a later save of a record replaces the earlier one, and
+        then filtered on the remaining partition columns.
+
+        Returns:
+            pyarrow.Table: The records, with the dataset schema.
+        """
+        key_filters = {name: values for name, values in filters.items() if name in self.key_partition_columns}
+        table = self._read_resolved(self.live_files(**key_filters))
+        for name, values in filters.items():
+            if values is not None and name not in key_filters:
+                mask = pc.is_in(table[name], value_set=pa.array(values, type=self.schema.field(name).type))
+                table = table.filter(mask)
+        return table
+
+    def _compaction_groups(self, manifest):
+        groups = {}
+        for entry in manifest['files']:
+            key = tuple(entry['partition'][name] for name in self.key_partition_columns)
+            groups.setdefault(key, []).append(entry)
+        return groups
+
+    def compaction_candidates(self, manifest=None, min_deltas=DATASET_COMPACT_MIN_DELTAS,
+                              min_delta_bytes=DATASET_COMPACT_MIN_DELTA_BYTES):
+        """
+        Returns the key partitions (tax years) whose delta files number at least min_deltas
+        or add up to at least min_delta_bytes, as tuples of key partition values.
+        """
+        candidates = []
+        for key, entries in self._compaction_groups(manifest or self.load_manifest()).items():
+            deltas = [entry for entry in entries if entry['kind'] == 'delta']
+            if deltas and (len(deltas) >= min_deltas or sum(entry['size'] for entry in deltas) >= min_delta_bytes):
+                candidates.append(key)
+        return candidates
+
+    def compact(self, force=False):
+        """
+        Rewrites the files of every tax year due for compaction (every tax year with deltas
+        if force) as one base file per partition holding the latest row per (EIN, TaxYear).
+
+        The new base files take the highest sequence number they fold in, so deltas appended
+        while compacting still win. Replaced files are deleted once the manifest no longer
+        references them.
+
+        Returns:
+            int: The number of files replaced.
+        """
+        manifest = self.load_manifest()
+        groups = self._compaction_groups(manifest)
+        if force:
+            candidates = [key for key, entries in groups.items() if any(entry['kind'] == 'delta' for entry in entries)]
+        else:
+            candidates = self.compaction_candidates(manifest)
+
+        replaced = []
+        for key in candidates:
+            entries = sorted(groups[key], key=lambda entry: entry['sequence'])
+            table = self._read_resolved(entries)
+            sequence = entries[-1]['sequence']
+            new_entries = self._write_files(table, 'base', sequence, _run_id())
+
+            # Reload so entries appended meanwhile are kept
+            manifest = self.load_manifest()
+            paths = {entry['path'] for entry in entries}
+            manifest['files'] = [entry for entry in manifest['files'] if entry['path'] not in paths] + new_entries
+            self.save_manifest(manifest)
+            replaced.extend(paths)
+            logger.info(f"Compacted {len(entries)} files of {dict(zip(self.key_partition_columns, key))} into "
+                        f"{len(new_entries)} base files of {table.num_rows} records")
+
+        for path in replaced:
+            try:
+                self.storage.delete(path)
+            except Exception as e:
+                logger.warning(f"Could not delete compacted file {self.storage.uri(path)}: {str(e)}")
+        return len(replaced)
+
+    def stats(self):
+        """
+        Returns per-partition counts of base and delta files, rows and bytes.
+        """
+        stats = {}
+        for entry in self.load_manifest()['files']:
+            partition = partition_path(entry['partition'])
+            partition_stats = stats.setdefault(partition, {'base_files': 0, 'delta_files': 0, 'rows': 0, 'bytes': 0})
+            partition_stats[f"{entry['kind']}_files"] += 1
+            partition_stats['rows'] += entry['num_rows']
+            partition_stats['bytes'] += entry['size']
+        return stats
+
+def _run_id():
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ') + '-' + uuid.uuid4().hex[:8]
+
+def keep_last_rows(table, keys=UPSERT_KEYS):
+    """
+    Keeps the last row per key, in the original order.
+
+    The keys are hashed into a group-by index holding the position of their last row, so
+    resolving upserts costs one pass over the rows read.
+    """
+    row_numbers = pa.array(range(table.num_rows), type=pa.int64())
+    key_table = table.select(list(keys)).append_column('_row', row_numbers)
+    last_rows = key_table.group_by(list(keys), use_threads=False).aggregate([('_row', 'max')])['_row_max']
+    return table.take(pc.take(last_rows, pc.sort_indices(last_rows)))
+
+def import_legacy_parquet(dataset, bucket=S3_BUCKET, key=LEGACY_PARQUET_KEY, client=None):
+    """
+    Imports the single Parquet file that earlier versions rewrote on every save into the
+    dataset (see ParquetDataset.import_legacy). Does nothing once it has been imported or
+    when there is no such file.
+
+    Returns:
+        list: The manifest entries of the files written.
+    """
+    source = f's3://{bucket}/{key}'
+    if source in dataset.load_manifest().get('imported', []):
+        return []
+    data = S3Storage(bucket, '', client).read(key)
+    if data is None:
+        logger.debug(f"No legacy Parquet file at {source}")
+        return []
+    return dataset.import_legacy(pq.read_table(BytesIO(data)), source)
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or compact the partitioned IRS 990 dataset.')
+    parser.add_argument('command', choices=['stats', 'compact', 'import-legacy'])
+    parser.add_argument('--force', action='store_true', help='Compact every tax year that has delta files')
+    parser.add_argument('--local-dir', help='Use the dataset in this directory instead of the configured storage')
+    parser.add_argument('--legacy-file', help='Import this local Parquet file instead of the legacy S3 object')
+    args = parser.parse_args()
+
+    dataset = ParquetDataset(LocalStorage(args.local_dir) if args.local_dir else None)
+    if args.command == 'import-legacy':
+        if args.legacy_file:
+            dataset.import_legacy(pq.read_table(args.legacy_file), os.path.abspath(args.legacy_file))
+        else:
+            import_legacy_parquet(dataset)
+    elif args.command == 'compact':
+        replaced = dataset.compact(force=args.force)
+        logger.info(f"Replaced {replaced} files in {dataset.storage.uri('')}")
+    for partition, partition_stats in sorted(dataset.stats().items()):
+        print(f"{partition}\t{partition_stats['base_files']} base\t{partition_stats['delta_files']} delta\t"
+              f"{partition_stats['rows']} rows\t{partition_stats['bytes']} bytes")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# parquet_writer.py
+
+import pyarrow.parquet as pq
+from config import (
+    desired_fields, PARQUET_WRITER_PROFILE, PARQUET_WRITER_PROFILES, PARQUET_DATA_PAGE_SIZE, PARQUET_DICTIONARY_COLUMNS
+)
+
+DICTIONARY_COLUMNS = PARQUET_DICTIONARY_COLUMNS + [f'{field}_path' for field in desired_fields]
+
+def get_writer_options(profile=PARQUET_WRITER_PROFILE, schema=None):
+    """
+    Returns the pyarrow.parquet writer options of a profile in config.PARQUET_WRITER_PROFILES.
+
+    Only the low-cardinality columns in DICTIONARY_COLUMNS are dictionary-encoded, since
+    dictionaries of EINs, names and amounts cost more than they save, and every column gets
+    min/max statistics so engines can skip row groups.
+
+    Args:
+        profile (str): The profile name.
+        schema (pyarrow.Schema): The schema to be written, to restrict the dictionary columns
+            to those present; None keeps them all.
+
+    Returns:
+        dict: Keyword arguments for pq.write_table and pq.ParquetWriter, plus 'row_group_size',
+        which ParquetWriter takes in write_table instead.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    if profile not in PARQUET_WRITER_PROFILES:
+        raise ValueError(f"Unknown Parquet writer profile '{profile}'; expected one of {list(PARQUET_WRITER_PROFILES)}")
+    options = dict(PARQUET_WRITER_PROFILES[profile])
+    dictionary_columns = DICTIONARY_COLUMNS if schema is None else [name for name in DICTIONARY_COLUMNS if name in schema.names]
+    options.update({
+        'use_dictionary': dictionary_columns,
+        'write_statistics': True,
+        'data_page_size': PARQUET_DATA_PAGE_SIZE,
+    })
+    return options
+
+def write_table(table, where, profile=PARQUET_WRITER_PROFILE):
+    """
+    Writes a table to a path or file-like object with a writer profile.
+    """
+    options = get_writer_options(profile, table.schema)
+    row_group_size = options.pop('row_group_size')
+    pq.write_table(table, where, row_group_size=row_group_size, **options)
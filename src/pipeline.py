@@ -0,0 +1,186 @@
+# pipeline.py
+
+import time
+import queue
+import threading
+from logger import logger
+from config import (
+    STREAMING_INGESTION, PIPELINE_DOWNLOAD_WORKERS, PIPELINE_PARSE_WORKERS, PIPELINE_QUEUE_SIZE, ARCHIVE_INDEX_ENABLED
+)
+from xml_downloader import (
+    download_and_extract_xml_files, download_to_spool, release_spool, count_xml_members, iter_xml_members
+)
+from archive_index import load_archive_index, select_members, iter_indexed_members
+from data_processor import process_xml_files, enrich_records
+
+_DONE = object()
+
+def _download_archive(url, state_filter=None):
+    """
+    Fetches one archive and returns (xml_files, file_count, spool_path).
+
+    With a state filter and ARCHIVE_INDEX_ENABLED, only the members the archive index selects
+    for the state are returned, read by offset. The index is built on the first fetch.
+    """
+    if STREAMING_INGESTION:
+        spool_path = download_to_spool(url)
+        try:
+            if ARCHIVE_INDEX_ENABLED and state_filter:
+                index = load_archive_index(spool_path)
+                rows = select_members(index, states=[state_filter])
+                logger.info(f"Selected {rows.num_rows} of {index.num_rows} members from {url} for {state_filter}")
+                return iter_indexed_members(spool_path, rows), rows.num_rows, spool_path
+            return iter_xml_members(spool_path), count_xml_members(spool_path), spool_path
+        except Exception:
+            release_spool(spool_path)
+            raise
+    xml_files = download_and_extract_xml_files(url)
+    return xml_files, len(xml_files), None
+
+def _put(target_queue, item, stop):
+    """
+    Puts an item on a bounded queue, giving up once stop is set. Returns whether it was put.
+    """
+    while not stop.is_set():
+        try:
+            target_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _get(source_queue, stop):
+    """
+    Takes an item from a queue, returning _DONE once stop is set.
+    """
+    while not stop.is_set():
+        try:
+            return source_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+def _release(archive):
+    if archive is not _DONE and archive.get('spool_path'):
+        try:
+            release_spool(archive['spool_path'])
+        except OSError as e:
+            logger.warning(f"Could not release spool file {archive['spool_path']}: {str(e)}")
+
+def _download_worker(url_queue, archive_queue, state_filter, stop):
+    while not stop.is_set():
+        try:
+            url = url_queue.get_nowait()
+        except queue.Empty:
+            return
+        start_time = time.time()
+        try:
+            xml_files, file_count, spool_path = _download_archive(url, state_filter)
+            logger.info(f"Downloaded {file_count} XML files from {url}")
+            archive = {'url': url, 'xml_files': xml_files, 'file_count': file_count, 'spool_path': spool_path,
+                       'download_seconds': time.time() - start_time}
+        except Exception as e:
+            logger.error(f"Error downloading {url}: {str(e)}")
+            archive = {'url': url, 'error': e, 'download_seconds': time.time() - start_time}
+        if not _put(archive_queue, archive, stop):
+            _release(archive)
+
+def _parse_worker(archive_queue, record_queue, state_filter, stop):
+    while True:
+        archive = _get(archive_queue, stop)
+        if archive is _DONE:
+            _put(record_queue, _DONE, stop)
+            return
+        url = archive['url']
+        result = {'url': url, 'records': [], 'no_total_assets_files': {}, 'file_count': archive.get('file_count', 0),
+                  'error': archive.get('error'), 'download_seconds': archive['download_seconds']}
+        start_time = time.time()
+        try:
+            if stop.is_set():
+                continue
+            if result['error'] is None and result['file_count']:
+                result['records'], result['no_total_assets_files'] = process_xml_files(
+                    archive['xml_files'], state_filter, None
+                )
+            elif result['error'] is None:
+                logger.warning(f"No XML files were extracted from {url}")
+        except Exception as e:
+            logger.error(f"Error parsing archive from {url}: {str(e)}")
+            result['error'] = e
+        finally:
+            _release(archive)
+        result['parse_seconds'] = time.time() - start_time
+        _put(record_queue, result, stop)
+
+def run_pipeline(urls, state_filter, get_ntee_code_description, download_workers=PIPELINE_DOWNLOAD_WORKERS,
+                 parse_workers=PIPELINE_PARSE_WORKERS, queue_size=PIPELINE_QUEUE_SIZE, prefetch_ntee_codes=None):
+    """
+    Downloads, parses and enriches archives as overlapping stages joined by bounded queues.
+
+    Download workers fetch archives while parse workers process the ones already on disk, so
+    archive N+1 downloads while archive N is parsed. Once queue_size archives are waiting to be
+    parsed the download workers block, which bounds the number of archives spooled at once.
+    Enrichment runs in the calling thread as results arrive, unless get_ntee_code_description
+    is None, in which case the caller enriches all records at once (see enrichment).
+
+    A failed download or parse is reported in the 'error' of its result rather than raised.
+    If the caller stops iterating early or raises, the workers are stopped and every spooled
+    archive is released before the generator is closed.
+
+    Args:
+        urls (list): The archive URLs to process.
+        state_filter (str): The two-letter state abbreviation to filter for.
+        get_ntee_code_description (callable): Callback used to enrich records with NTEE data,
+            or None to leave enrichment to the caller once all archives are parsed.
+        download_workers (int): Number of archives downloaded concurrently.
+        parse_workers (int): Number of archives parsed concurrently.
+        queue_size (int): Maximum number of items waiting between two stages.
+        prefetch_ntee_codes (callable): Optional batch callback, see data_processor.enrich_records.
+
+    Yields:
+        dict: One result per URL in completion order, with the keys 'url', 'records',
+        'no_total_assets_files', 'file_count', 'error', 'download_seconds' and 'parse_seconds'.
+    """
+    url_queue = queue.Queue()
+    for url in urls:
+        url_queue.put(url)
+    archive_queue = queue.Queue(maxsize=queue_size)
+    record_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    downloaders = [
+        threading.Thread(target=_download_worker, args=(url_queue, archive_queue, state_filter, stop), daemon=True)
+        for _ in range(max(1, min(download_workers, len(urls))))
+    ]
+    parsers = [
+        threading.Thread(target=_parse_worker, args=(archive_queue, record_queue, state_filter, stop), daemon=True)
+        for _ in range(max(1, parse_workers))
+    ]
+
+    def close_downloads():
+        for thread in downloaders:
+            thread.join()
+        for _ in parsers:
+            _put(archive_queue, _DONE, stop)
+
+    closer = threading.Thread(target=close_downloads, daemon=True)
+    for thread in downloaders + parsers + [closer]:
+        thread.start()
+
+    try:
+        remaining_parsers = len(parsers)
+        while remaining_parsers:
+            result = record_queue.get()
+            if result is _DONE:
+                remaining_parsers -= 1
+                continue
+            if get_ntee_code_description is not None:
+                enrich_records(result['records'], get_ntee_code_description, prefetch_ntee_codes)
+            yield result
+    finally:
+        # Stops the workers when the consumer stops early or fails, and releases the archives they still hold
+        stop.set()
+        for thread in downloaders + parsers + [closer]:
+            thread.join()
+        while not archive_queue.empty():
+            _release(archive_queue.get_nowait())
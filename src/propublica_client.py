@@ -0,0 +1,220 @@
+# propublica_client.py
+
+import time
+import random
+import asyncio
+import threading
+import aiohttp
+from logger import logger
+from config import (
+    PROPUBLICA_API_URL, PROPUBLICA_RATE_LIMIT, PROPUBLICA_MIN_RATE, PROPUBLICA_BURST, PROPUBLICA_MAX_CONNECTIONS,
+    PROPUBLICA_RETRIES, PROPUBLICA_TIMEOUT
+)
+from ntee_cache import get_ntee_cache
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Asyncio token bucket whose refill rate adapts to the server.
+
+    Requests take one token each. A throttling response halves the rate, down to min_rate, and
+    every success adds back a small step up to the configured rate.
+    """
+
+    def __init__(self, rate, burst, min_rate):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def slow_down(self):
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self):
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class ProPublicaClient:
+    """
+    Concurrent client for NTEE codes from the ProPublica Nonprofit Explorer API.
+
+    All requests run on one background event loop sharing a single aiohttp connection pool,
+    and are paced by an adaptive token bucket. 429 and 5xx responses and network errors are
+    retried with exponential backoff, honouring Retry-After. Concurrent lookups of the same
+    EIN share one in-flight request, and answers are stored in the NTEE cache, including
+    negative results for organizations without a code.
+    """
+
+    def __init__(self, base_url=PROPUBLICA_API_URL, rate=PROPUBLICA_RATE_LIMIT, burst=PROPUBLICA_BURST,
+                 min_rate=PROPUBLICA_MIN_RATE, max_connections=PROPUBLICA_MAX_CONNECTIONS, retries=PROPUBLICA_RETRIES,
+                 timeout=PROPUBLICA_TIMEOUT, cache=None):
+        self.base_url = base_url.rstrip('/')
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_connections = max_connections
+        self.retries = retries
+        self.timeout = timeout
+        self.cache = cache
+        self.successful_calls = 0
+        self.unsuccessful_calls = 0
+        self.retried_calls = 0
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._bucket = None
+        self._in_flight = {}
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='propublica-client', daemon=True)
+                self._thread.start()
+        return self._loop
+
+    async def _get_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._bucket = TokenBucket(self.rate, self.burst, self.min_rate)
+        return self._session
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(30, 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    async def _request(self, ein):
+        """
+        Returns (found, ntee_code): found is False when no answer could be obtained.
+        """
+        session = await self._get_session()
+        url = f"{self.base_url}/{ein}.json"
+        for attempt in range(self.retries + 1):
+            await self._bucket.acquire()
+            retry_after = None
+            try:
+                async with session.get(url) as response:
+                    if response.status == 404:
+                        self._bucket.speed_up()
+                        return True, None
+                    if response.status in _RETRY_STATUSES:
+                        self._bucket.slow_down()
+                        retry_after = response.headers.get('Retry-After')
+                        logger.warning(f"ProPublica API returned {response.status} for EIN {ein} (attempt {attempt + 1})")
+                    else:
+                        response.raise_for_status()
+                        data = await response.json(content_type=None)
+                        self._bucket.speed_up()
+                        ntee_code = data['organization'].get('ntee_code')
+                        if not ntee_code:
+                            logger.warning(f"API response for EIN {ein} is missing NTEE code")
+                        # Ensure we only keep the first 3 characters of the NTEE code
+                        return True, ntee_code[:3] if ntee_code else None
+            except (aiohttp.ClientResponseError, KeyError, ValueError) as e:
+                logger.error(f"Error fetching NTEE code from API for EIN {ein}: {str(e)}")
+                return False, None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Request for EIN {ein} failed (attempt {attempt + 1}): {str(e) or type(e).__name__}")
+            if attempt < self.retries:
+                self.retried_calls += 1
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+        logger.error(f"Giving up on EIN {ein} after {self.retries + 1} attempts")
+        return False, None
+
+    async def fetch_ntee_code(self, ein):
+        """
+        Fetches the NTEE code of one EIN, sharing the request with concurrent lookups of it.
+
+        Must run on the client's event loop; use fetch_ntee_codes from other threads.
+
+        Returns:
+            tuple: (found, ntee_code) as in _request.
+        """
+        ein = str(ein)
+        task = self._in_flight.get(ein)
+        if task is None:
+            task = asyncio.ensure_future(self._request(ein))
+            self._in_flight[ein] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(ein, None))
+        found, ntee_code = await asyncio.shield(task)
+        return found, ntee_code
+
+    async def _fetch_many(self, eins):
+        results = await asyncio.gather(*(self.fetch_ntee_code(ein) for ein in eins))
+        return dict(zip(eins, results))
+
+    def fetch_ntee_codes(self, eins):
+        """
+        Fetches the NTEE codes of a batch of EINs concurrently, consulting the NTEE cache first.
+
+        Args:
+            eins (iterable): The EINs to look up; duplicates and empty values are ignored.
+
+        Returns:
+            dict: EIN to NTEE code, or None when the organization has no code. EINs whose
+            lookup failed are left out and not cached, so callers can retry them.
+        """
+        eins = [str(ein) for ein in dict.fromkeys(eins) if ein]
+        if not eins:
+            return {}
+        cache = self.cache or get_ntee_cache()
+        results = {}
+        missing = []
+        for ein, (found, ntee_code) in cache.get_many('propublica', eins).items():
+            if found:
+                results[ein] = ntee_code
+            else:
+                missing.append(ein)
+
+        if missing:
+            start_time = time.time()
+            fetched = asyncio.run_coroutine_threadsafe(self._fetch_many(missing), self._ensure_loop()).result()
+            answers = {ein: ntee_code for ein, (found, ntee_code) in fetched.items() if found}
+            cache.put_many('propublica', answers)
+            self.successful_calls += sum(1 for ntee_code in answers.values() if ntee_code)
+            self.unsuccessful_calls += len(missing) - sum(1 for ntee_code in answers.values() if ntee_code)
+            results.update(answers)
+            logger.info(f"Fetched {len(missing)} EINs from the ProPublica API in {time.time() - start_time:.2f} seconds "
+                        f"({len(eins) - len(missing)} served from cache)")
+        return results
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = self._session = self._bucket = None
+
+    def summary(self):
+        return (f"ProPublica API lookups with an NTEE code: {self.successful_calls}\n"
+                f"ProPublica API lookups without an NTEE code: {self.unsuccessful_calls}\n"
+                f"ProPublica API retried requests: {self.retried_calls}\n")
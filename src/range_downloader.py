@@ -0,0 +1,219 @@
+# range_downloader.py
+
+import hashlib
+import json
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from logger import logger
+from config import (
+    DOWNLOAD_CHUNK_SIZE, DOWNLOAD_SEGMENT_SIZE, DOWNLOAD_WORKERS, DOWNLOAD_RETRIES, DOWNLOAD_RETRY_BACKOFF,
+    DOWNLOAD_TIMEOUT, HTTP_POOL_SIZE
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+class SegmentDownloadError(Exception):
+    """Raised when a segment cannot be downloaded or fails its checksum."""
+
+def get_http_session():
+    """
+    Returns the shared pooled HTTP session used for archive downloads.
+
+    The session retries connection errors and 429/5xx responses with exponential backoff.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=DOWNLOAD_RETRIES,
+                backoff_factor=1,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['HEAD', 'GET'],
+                respect_retry_after_header=True
+            )
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+def probe_remote_file(session, url):
+    """
+    Issues a HEAD request for a remote file.
+
+    Returns:
+        dict: 'size' (None when unknown), 'accepts_ranges', 'etag', 'last_modified' and
+        'validator', the ETag or else Last-Modified used to detect changes.
+    """
+    response = session.head(url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    size = response.headers.get('Content-Length')
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    return {
+        'size': int(size) if size and size.isdigit() else None,
+        'accepts_ranges': response.headers.get('Accept-Ranges', '').lower() == 'bytes',
+        'etag': etag,
+        'last_modified': last_modified,
+        'validator': etag or last_modified,
+    }
+
+def _retry_delay(attempt, backoff=DOWNLOAD_RETRY_BACKOFF):
+    """
+    Returns the jittered exponential delay before retry number attempt + 1 of a segment.
+    """
+    return min(60, backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+def _plan_segments(size, segment_size):
+    return [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+
+def _load_state(state_path, url, size, validator):
+    """
+    Loads the completed-segment checksums of an interrupted download.
+
+    The state is discarded when the remote file changed since it was written.
+    """
+    try:
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if state.get('url') != url or state.get('size') != size or state.get('validator') != validator:
+        logger.info(f'Remote file changed since the last attempt, restarting download of {url}')
+        return {}
+    return {int(index): digest for index, digest in state.get('segments', {}).items()}
+
+def _save_state(state_path, url, size, validator, segments):
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'url': url, 'size': size, 'validator': validator,
+                   'segments': {str(index): digest for index, digest in segments.items()}}, f)
+    os.replace(tmp_path, state_path)
+
+def _segment_digest(part_path, start, end):
+    digest = hashlib.sha256()
+    remaining = end - start + 1
+    with open(part_path, 'rb') as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                return None
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def _fetch_segment(session, url, part_path, start, end, validator):
+    """
+    Downloads bytes start..end into the part file and returns the SHA-256 of the segment.
+    """
+    headers = {'Range': f'bytes={start}-{end}'}
+    if validator:
+        headers['If-Range'] = validator
+    digest = hashlib.sha256()
+    written = 0
+    with session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise SegmentDownloadError(f'Server ignored range request for bytes {start}-{end} (status {response.status_code})')
+        with open(part_path, 'r+b') as f:
+            f.seek(start)
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+    if written != end - start + 1:
+        raise SegmentDownloadError(f'Segment {start}-{end} is truncated: received {written} bytes')
+    return digest.hexdigest()
+
+def _download_single_stream(session, url, dest_path):
+    part_path = dest_path + '.part'
+    with session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        with open(part_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+    os.replace(part_path, dest_path)
+    return dest_path
+
+def download_file_segmented(url, dest_path, segment_size=DOWNLOAD_SEGMENT_SIZE, max_workers=DOWNLOAD_WORKERS,
+                            session=None, retries=DOWNLOAD_RETRIES, remote=None):
+    """
+    Downloads a file as concurrent HTTP range segments, resuming an interrupted download.
+
+    Progress is kept next to the destination in '<dest_path>.part' and '<dest_path>.part.json'.
+    The state file records the SHA-256 of every completed segment; on resume each recorded
+    segment is re-hashed from disk and only missing or corrupt segments are fetched again.
+    Servers without range support fall back to a single streamed GET.
+
+    Args:
+        url (str): The URL of the file to download.
+        dest_path (str): The final path of the downloaded file.
+        segment_size (int): Size of each range request in bytes.
+        max_workers (int): Number of segments downloaded concurrently.
+        session (requests.Session): Session to use, defaults to the shared pooled session.
+        retries (int): Number of times a failed segment is retried before giving up.
+        remote (dict): The result of probe_remote_file for url, if the caller already probed it.
+
+    Returns:
+        str: dest_path once the download is complete.
+    """
+    session = session or get_http_session()
+    remote = remote or probe_remote_file(session, url)
+    size, validator = remote['size'], remote['validator']
+    if not size or not remote['accepts_ranges']:
+        logger.info(f'Range requests not supported for {url}, downloading as a single stream')
+        return _download_single_stream(session, url, dest_path)
+
+    part_path = dest_path + '.part'
+    state_path = part_path + '.json'
+    segments = _plan_segments(size, segment_size)
+    completed = _load_state(state_path, url, size, validator) if os.path.exists(part_path) else {}
+
+    if not completed:
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+    else:
+        for index, digest in list(completed.items()):
+            if index >= len(segments) or _segment_digest(part_path, *segments[index]) != digest:
+                logger.warning(f'Segment {index} of {url} failed checksum verification, fetching it again')
+                del completed[index]
+        logger.info(f'Resuming download of {url}: {len(completed)}/{len(segments)} segments already complete')
+
+    pending = [index for index in range(len(segments)) if index not in completed]
+    state_lock = threading.Lock()
+
+    def fetch(index):
+        start, end = segments[index]
+        for attempt in range(retries + 1):
+            try:
+                digest = _fetch_segment(session, url, part_path, start, end, validator)
+                break
+            except (requests.exceptions.RequestException, SegmentDownloadError) as e:
+                if attempt == retries:
+                    raise
+                # The session already retried connection errors and 5xx responses, so back off before trying again
+                delay = _retry_delay(attempt)
+                logger.warning(f'Retrying segment {index} of {url} in {delay:.1f} seconds after error: {str(e)}')
+                time.sleep(delay)
+        with state_lock:
+            completed[index] = digest
+            _save_state(state_path, url, size, validator, completed)
+
+    logger.info(f'Downloading {url} ({size} bytes) in {len(pending)} segments with {max_workers} workers')
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [executor.submit(fetch, index) for index in pending]:
+            future.result()
+
+    os.replace(part_path, dest_path)
+    os.remove(state_path)
+    logger.info(f'Download complete: {dest_path}')
+    return dest_path
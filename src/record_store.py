@@ -0,0 +1,160 @@
+# record_store.py
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from logger import logger
+from config import desired_fields, RECORD_BATCH_SIZE
+from columnar import ARROW_TYPES, convert_column
+
+_DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+def build_record_schema(fields=desired_fields):
+    """
+    Derives the Arrow schema of the extracted records from config.desired_fields.
+
+    Each field gets a column of its declared type followed by a '<field>_path' column with the
+    path it was extracted from. FormType and the path columns repeat a handful of values, so
+    they are dictionary-encoded.
+    """
+    columns = [pa.field('FormType', _DICTIONARY)]
+    for field_name, field_info in fields.items():
+        columns.append(pa.field(field_name, ARROW_TYPES.get(field_info.get('type', 'string'), pa.string())))
+        columns.append(pa.field(f'{field_name}_path', _DICTIONARY))
+    columns.append(pa.field('_source_file', pa.string()))
+    return pa.schema(columns)
+
+RECORD_SCHEMA = build_record_schema()
+
+def _cast_leniently(column, type_, name):
+    """
+    Casts a column, parsing the text of each value when a plain cast fails so that values that
+    do not convert become null instead of failing the whole column.
+    """
+    try:
+        return column.cast(type_)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        pass
+    try:
+        text = pc.cast(column, pa.string())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        logger.warning(f"Column '{name}' of type {column.type} cannot be cast to {type_}; replacing it with nulls")
+        return pa.nulls(len(column), type=type_)
+    type_names = {arrow_type: type_name for type_name, arrow_type in ARROW_TYPES.items()}
+    if type_ in type_names:
+        converted, failures = convert_column(text, type_names[type_])
+    else:
+        converted, failures = text.cast(type_), 0
+    if failures:
+        logger.warning(f"{failures} values of column '{name}' could not be cast to {type_} and were set to null")
+    return converted
+
+def conform_table(table, schema=RECORD_SCHEMA, lenient=False):
+    """
+    Casts a table to the record schema. Columns missing from the table are added as nulls and
+    columns that are not in the schema are kept after the schema's columns.
+
+    With lenient, a column whose type drifted is converted value by value as in
+    columnar.convert_column, and values that do not convert become null.
+
+    Raises:
+        pyarrow.ArrowInvalid: If a column cannot be cast to its schema type and lenient is False.
+    """
+    columns = []
+    for field in schema:
+        if field.name not in table.column_names:
+            columns.append(pa.nulls(table.num_rows, type=field.type))
+        elif lenient:
+            columns.append(_cast_leniently(table[field.name], field.type, field.name))
+        else:
+            columns.append(table[field.name].cast(field.type))
+    fields = list(schema)
+    for name in table.column_names:
+        if name not in schema.names:
+            fields.append(table.schema.field(name))
+            columns.append(table[name])
+    return pa.Table.from_arrays(columns, schema=pa.schema(fields))
+
+class RecordStore:
+    """
+    Holds extracted records as Arrow record batches with a fixed schema.
+
+    Records are appended as dicts and buffered until batch_size of them are waiting, then
+    converted into one RecordBatch, so memory is dominated by the compact columnar data rather
+    than by per-record dicts. Keys that are not in the schema are dropped.
+    """
+
+    def __init__(self, schema=RECORD_SCHEMA, batch_size=RECORD_BATCH_SIZE):
+        self.schema = schema
+        self.batch_size = batch_size
+        self.batches = []
+        self._pending = []
+
+    def __len__(self):
+        return sum(batch.num_rows for batch in self.batches) + len(self._pending)
+
+    def append_records(self, records):
+        self._pending.extend(records)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def append_batch(self, batch):
+        """
+        Appends a RecordBatch or Table, casting it to the store's schema.
+        """
+        self.flush()
+        table = pa.Table.from_batches([batch]) if isinstance(batch, pa.RecordBatch) else batch
+        table = conform_table(table, self.schema).select(self.schema.names)
+        self.batches.extend(table.to_batches())
+
+    def extend(self, other):
+        """
+        Appends the records of another RecordStore.
+        """
+        other.flush()
+        self.flush()
+        self.batches.extend(other.batches)
+
+    def flush(self):
+        if self._pending:
+            self.batches.append(pa.RecordBatch.from_pylist(self._pending, schema=self.schema))
+            self._pending = []
+
+    def map_batches(self, function):
+        """
+        Replaces every batch with function(batch), which must return a batch of the same schema.
+        """
+        self.flush()
+        self.batches = [function(batch) for batch in self.batches]
+
+    def replace_table(self, table):
+        """
+        Replaces the store's records with a table of the store's schema, such as one derived
+        from to_table() by column-wise operations.
+        """
+        self._pending = []
+        table = conform_table(table, self.schema).select(self.schema.names)
+        self.batches = table.combine_chunks().to_batches(max_chunksize=self.batch_size)
+
+    def to_table(self):
+        self.flush()
+        return pa.Table.from_batches(self.batches, schema=self.schema)
+
+    def value_counts(self, column):
+        """
+        Returns a dict of value to count for a column, ignoring nulls.
+        """
+        counts = pc.value_counts(self.to_table()[column].combine_chunks())
+        return {item['values']: item['counts'] for item in counts.to_pylist() if item['values'] is not None}
+
+    def average_fields_per_record(self):
+        """
+        Returns the average number of non-null values per record.
+        """
+        table = self.to_table()
+        if not table.num_rows:
+            return 0
+        return sum(column.length() - column.null_count for column in table.columns) / table.num_rows
+
+    def log_size(self):
+        table = self.to_table()
+        logger.info(f"Record store holds {table.num_rows} records in {len(self.batches)} batches ({table.nbytes} bytes)")
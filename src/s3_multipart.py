@@ -0,0 +1,150 @@
+# s3_multipart.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from logger import logger
+from config import S3_MULTIPART_PART_SIZE, S3_MULTIPART_WORKERS, S3_MULTIPART_MAX_PENDING_PARTS
+from s3_utils import get_s3_client
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects smaller parts, except the last one
+
+class S3MultipartWriter:
+    """
+    Write-only file object that streams into an S3 object through a multipart upload.
+
+    Written bytes are collected into parts of part_size, which are uploaded on a thread pool
+    while the caller keeps writing. At most max_pending_parts parts are in flight; write()
+    blocks until one finishes beyond that, so memory stays bounded by about
+    (max_pending_parts + 1) * part_size however large the object grows. Objects smaller than
+    one part are sent with a single put_object when the writer is closed.
+
+    The object only appears once close() completes the upload. If a part fails, or the writer
+    is left through an exception in a with block, the multipart upload is aborted so S3 keeps
+    no orphaned parts. It can be passed as the sink of pyarrow.parquet.write_table or
+    ParquetWriter, so row groups go to S3 as they are encoded.
+    """
+
+    def __init__(self, bucket, key, client=None, part_size=S3_MULTIPART_PART_SIZE,
+                 max_workers=S3_MULTIPART_WORKERS, max_pending_parts=S3_MULTIPART_MAX_PENDING_PARTS):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f'part_size must be at least {MIN_PART_SIZE} bytes')
+        self.bucket = bucket
+        self.key = key
+        self.client = client or get_s3_client()
+        self.part_size = part_size
+        self.max_workers = max_workers
+        self.closed = False
+        self.upload_id = None
+        self._buffer = bytearray()
+        self._position = 0
+        self._parts = []
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_pending_parts)
+        self._error = None
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def readable(self):
+        return False
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('I/O operation on closed S3MultipartWriter')
+        self._raise_failed_part()
+        data = memoryview(data).cast('B')
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit_part(part)
+        return len(data)
+
+    def _start_upload(self):
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+        self.upload_id = response['UploadId']
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def _upload_part(self, part_number, data):
+        try:
+            response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                               PartNumber=part_number, Body=data)
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        except Exception as e:
+            self._error = self._error or e
+            raise
+        finally:
+            self._slots.release()
+
+    def _submit_part(self, data):
+        if self.upload_id is None:
+            self._start_upload()
+        self._slots.acquire()
+        self._raise_failed_part()
+        self._parts.append(self._executor.submit(self._upload_part, len(self._parts) + 1, data))
+
+    def _raise_failed_part(self):
+        if self._error is not None:
+            error = self._error
+            self.abort()
+            raise error
+
+    def close(self):
+        """
+        Uploads the remaining bytes and completes the upload, aborting it if any part failed.
+        """
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+            else:
+                if self._buffer:
+                    self._submit_part(bytes(self._buffer))
+                parts = [future.result() for future in self._parts]
+                self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                      MultipartUpload={'Parts': parts})
+                logger.info(f'Uploaded {self._position} bytes in {len(parts)} parts to s3://{self.bucket}/{self.key}')
+        except Exception:
+            self.abort()
+            raise
+        self._shutdown()
+
+    def abort(self):
+        """
+        Abandons the object, aborting the multipart upload so its parts are deleted.
+        """
+        if self.closed:
+            return
+        self._shutdown(cancel=True)
+        if self.upload_id is not None:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+                logger.warning(f'Aborted multipart upload of s3://{self.bucket}/{self.key}')
+            except Exception as e:
+                logger.error(f'Error aborting multipart upload of s3://{self.bucket}/{self.key}: {e}')
+
+    def _shutdown(self, cancel=False):
+        self.closed = True
+        self._buffer = bytearray()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
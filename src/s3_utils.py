@@ -1,26 +1,82 @@
 # s3_utils.py
 
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import boto3
-from config import S3_BUCKET
+from botocore.config import Config
+from config import S3_BUCKET, S3_MAX_POOL_CONNECTIONS, S3_RETRY_MODE, S3_MAX_ATTEMPTS, S3_UPLOAD_WORKERS
 from logger import logger
 import botocore.exceptions
-from io import BytesIO
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
 
 def get_s3_client():
-    return boto3.client('s3')
+    """
+    Returns the process-wide S3 client, creating it on first use.
 
-s3_client = get_s3_client()
+    boto3 clients are thread-safe, so every module and upload thread shares this one and its
+    connection pool of S3_MAX_POOL_CONNECTIONS connections, and retries use S3_RETRY_MODE.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.client('s3', config=Config(
+                    max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                    retries={'mode': S3_RETRY_MODE, 'max_attempts': S3_MAX_ATTEMPTS}
+                ))
+    return _s3_client
 
 def upload_file_to_s3(file_content, s3_key):
     try:
-        s3_client.put_object(Bucket=S3_BUCKET, Key=s3_key, Body=file_content)
+        get_s3_client().put_object(Bucket=S3_BUCKET, Key=s3_key, Body=file_content)
         logger.info(f'Uploaded file to s3://{S3_BUCKET}/{s3_key}')
     except botocore.exceptions.ClientError as e:
         logger.error(f'Error uploading file to S3: {e}')
 
+def upload_many(objects, bucket=S3_BUCKET, client=None, max_workers=S3_UPLOAD_WORKERS):
+    """
+    Uploads many small objects concurrently, one put_object each, on a thread pool.
+
+    A failed object does not stop the others; its error is reported in its result.
+
+    Args:
+        objects (dict or iterable): S3 key to content, or (key, content) pairs. Text content
+            is uploaded UTF-8 encoded.
+        bucket (str): The bucket to upload to.
+        client: The S3 client to use; defaults to get_s3_client().
+        max_workers (int): Objects uploaded at the same time.
+
+    Returns:
+        list: One dict per object, in order, with its 'key', 'size' in bytes and 'error', which
+        is None when the upload succeeded.
+    """
+    items = list(objects.items() if isinstance(objects, dict) else objects)
+    if not items:
+        return []
+    client = client or get_s3_client()
+
+    def upload(item):
+        key, content = item
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        try:
+            client.put_object(Bucket=bucket, Key=key, Body=content)
+            return {'key': key, 'size': len(content), 'error': None}
+        except Exception as e:
+            logger.error(f'Error uploading file to s3://{bucket}/{key}: {e}')
+            return {'key': key, 'size': len(content), 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        results = list(executor.map(upload, items))
+    uploaded = sum(1 for result in results if result['error'] is None)
+    logger.info(f'Uploaded {uploaded} of {len(results)} files to s3://{bucket}')
+    return results
+
 def download_file_from_s3(s3_key):
     try:
-        response = s3_client.get_object(Bucket=S3_BUCKET, Key=s3_key)
+        response = get_s3_client().get_object(Bucket=S3_BUCKET, Key=s3_key)
         file_content = response['Body'].read()
         logger.info(f'Downloaded file from s3://{S3_BUCKET}/{s3_key}')
         return file_content
@@ -0,0 +1,208 @@
+# tree_walk_extractor.py
+
+import re
+from logger import logger
+from extraction_plan import EXTRACTION_PLAN, FORM_TYPES
+
+_TOKEN_RE = re.compile(r'\s*(local-name\(\)\s*=\s*"([^"]*)"|contains\(\s*local-name\(\)\s*,\s*"([^"]*)"\s*\)|and\b|or\b|\(|\))')
+_STEP_RE = re.compile(r'\*\[(.*)\]$')
+
+class UnsupportedPath(ValueError):
+    """Raised for paths outside the local-name() subset handled by the tree walk."""
+
+def _parse_predicate(predicate):
+    """
+    Compiles a local-name() predicate such as 'contains(local-name(), "A") and contains(local-name(), "B")'
+    into a function of the element's local name.
+    """
+    tokens = []
+    position = 0
+    while position < len(predicate):
+        match = _TOKEN_RE.match(predicate, position)
+        if not match:
+            if predicate[position:].strip():
+                raise UnsupportedPath(predicate)
+            break
+        if match.group(2) is not None:
+            tokens.append(('eq', match.group(2)))
+        elif match.group(3) is not None:
+            tokens.append(('contains', match.group(3)))
+        else:
+            tokens.append((match.group(1), None))
+        position = match.end()
+
+    def parse_or(index):
+        terms, index = parse_and(index)
+        terms = [terms]
+        while index < len(tokens) and tokens[index][0] == 'or':
+            term, index = parse_and(index + 1)
+            terms.append(term)
+        return (lambda name: any(term(name) for term in terms)) if len(terms) > 1 else terms[0], index
+
+    def parse_and(index):
+        factor, index = parse_atom(index)
+        factors = [factor]
+        while index < len(tokens) and tokens[index][0] == 'and':
+            factor, index = parse_atom(index + 1)
+            factors.append(factor)
+        return (lambda name: all(factor(name) for factor in factors)) if len(factors) > 1 else factors[0], index
+
+    def parse_atom(index):
+        if index >= len(tokens):
+            raise UnsupportedPath(predicate)
+        kind, value = tokens[index]
+        if kind == 'eq':
+            return (lambda name: name == value), index + 1
+        if kind == 'contains':
+            return (lambda name: value in name), index + 1
+        if kind == '(':
+            term, index = parse_or(index + 1)
+            if index >= len(tokens) or tokens[index][0] != ')':
+                raise UnsupportedPath(predicate)
+            return term, index + 1
+        raise UnsupportedPath(predicate)
+
+    function, index = parse_or(0)
+    if index != len(tokens):
+        raise UnsupportedPath(predicate)
+    return function
+
+def _split_steps(path):
+    steps = []
+    depth = 0
+    current = ''
+    for char in path:
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        if char == '/' and depth == 0:
+            steps.append(current)
+            current = ''
+        else:
+            current += char
+    steps.append(current)
+    return steps
+
+def compile_path(path):
+    """
+    Compiles a '//*[pred]/*[pred]/.../text()' path into a list of step predicates.
+
+    Raises:
+        UnsupportedPath: If the path is not in the supported subset.
+    """
+    if not path.startswith('//'):
+        raise UnsupportedPath(path)
+    steps = _split_steps(path[2:])
+    if steps[-1] != 'text()' or len(steps) < 2:
+        raise UnsupportedPath(path)
+    predicates = []
+    for step in steps[:-1]:
+        match = _STEP_RE.match(step)
+        if not match:
+            raise UnsupportedPath(path)
+        predicates.append(_parse_predicate(match.group(1)))
+    return predicates
+
+class TreeWalkExtractor:
+    """
+    Extracts every desired field from a Return in a single walk of its subtree.
+
+    Each path is compiled into a chain of local-name predicates. While walking the tree, the
+    local names of the open elements form a stack; an element matches a path when the path's
+    predicates match the top of that stack. Candidate paths for an element are looked up in a
+    suffix table keyed by local name, filled lazily as new names are seen. The first text node
+    of each matching path is recorded in document order, which reproduces the '[0]' result of
+    the XPath engine. Paths outside the supported subset fall back to the precompiled XPath.
+
+    Only the Return's own subtree is searched, so results are identical to the XPath engine in
+    Return-scoped mode, and to document mode whenever the Return is the document root.
+    """
+
+    def __init__(self, plan=EXTRACTION_PLAN):
+        self.plan = plan
+        self._patterns = []
+        self._pattern_ids = {}
+        self._form_plans = {}
+        self._suffix_tables = {}
+        for form_type in FORM_TYPES:
+            form_plan = []
+            form_pattern_ids = set()
+            for field_name, converter, compiled_paths in plan.fields_for(form_type):
+                entries = []
+                for path, xpath in compiled_paths:
+                    pattern_id = self._compile(path)
+                    if pattern_id is not None:
+                        form_pattern_ids.add(pattern_id)
+                    entries.append((path, xpath, pattern_id))
+                form_plan.append((field_name, converter, entries))
+            self._form_plans[form_type] = (form_plan, sorted(form_pattern_ids))
+            self._suffix_tables[form_type] = {}
+
+    def _compile(self, path):
+        if path not in self._pattern_ids:
+            try:
+                self._patterns.append(compile_path(path))
+                self._pattern_ids[path] = len(self._patterns) - 1
+            except UnsupportedPath:
+                logger.debug(f"Path '{path}' is not supported by the tree walk, using XPath instead")
+                self._pattern_ids[path] = None
+        return self._pattern_ids[path]
+
+    def _candidates(self, form_type, pattern_ids, name):
+        suffix_table = self._suffix_tables[form_type]
+        candidates = suffix_table.get(name)
+        if candidates is None:
+            candidates = [pattern_id for pattern_id in pattern_ids if self._patterns[pattern_id][-1](name)]
+            suffix_table[name] = candidates
+        return candidates
+
+    def _walk(self, element, names, parent_matches, found, form_type, pattern_ids):
+        tag = element.tag
+        if isinstance(tag, str):
+            names.append(tag.rpartition('}')[2])
+            matches = []
+            for pattern_id in self._candidates(form_type, pattern_ids, names[-1]):
+                predicates = self._patterns[pattern_id]
+                if len(predicates) > len(names):
+                    continue
+                if all(predicates[-offset](names[-offset]) for offset in range(2, len(predicates) + 1)):
+                    matches.append(pattern_id)
+            if element.text is not None:
+                for pattern_id in matches:
+                    if pattern_id not in found:
+                        found[pattern_id] = element.text
+            for child in element:
+                self._walk(child, names, matches, found, form_type, pattern_ids)
+            names.pop()
+        # The tail is a text node of the parent, after this element's subtree in document order
+        if element.tail is not None:
+            for pattern_id in parent_matches:
+                if pattern_id not in found:
+                    found[pattern_id] = element.tail
+
+    def extract(self, element, form_type):
+        """
+        Returns a list of (field_name, converter, value, path) for the fields of a form type.
+
+        value and path are None for fields that were not found.
+        """
+        form_type = form_type if form_type in self._form_plans else 'Unknown'
+        form_plan, pattern_ids = self._form_plans[form_type]
+        found = {}
+        self._walk(element, [], (), found, form_type, pattern_ids)
+
+        results = []
+        for field_name, converter, entries in form_plan:
+            value, found_path = None, None
+            for path, xpath, pattern_id in entries:
+                if pattern_id is None:
+                    value, found_path = self.plan.extract_first(element, field_name, [(path, xpath)])
+                elif pattern_id in found:
+                    value, found_path = found[pattern_id].strip(), path
+                if found_path is not None:
+                    break
+            results.append((field_name, converter, value, found_path))
+        return results
+
+TREE_WALK_EXTRACTOR = TreeWalkExtractor()
@@ -1,10 +1,32 @@
 # utils.py
 
+from lxml import etree
 from logger import logger
 
+FORM_TYPE_PATHS = {
+    '990': './irs:ReturnData/irs:IRS990',
+    '990EZ': './irs:ReturnData/irs:IRS990EZ',
+    '990PF': './irs:ReturnData/irs:IRS990PF',
+    '990T': './irs:ReturnData/irs:IRS990T'
+}
+
+# Compiled form type XPaths, keyed by the namespaces they were compiled with
+_form_type_xpaths = {}
+
+def _get_form_type_xpaths(ns):
+    key = tuple(sorted(ns.items()))
+    if key not in _form_type_xpaths:
+        _form_type_xpaths[key] = [
+            (form_type, xpath, etree.XPath(xpath, namespaces=ns)) for form_type, xpath in FORM_TYPE_PATHS.items()
+        ]
+    return _form_type_xpaths[key]
+
 def detect_form_type(Return, ns):
     """
     Detects the form type (e.g., 990, 990EZ, 990PF, 990T) from the XML Return data.
+
+    The XPath probes are compiled once per namespace mapping. Callers should detect the form
+    type once per Return and pass it along rather than calling this for every field.
     
     Args:
         Return (lxml.etree.Element): The XML element representing the Return.
@@ -13,16 +35,9 @@ def detect_form_type(Return, ns):
     Returns:
         str: The detected form type, or 'Unknown' if no form type is matched.
     """
-    form_types = {
-        '990': './irs:ReturnData/irs:IRS990',
-        '990EZ': './irs:ReturnData/irs:IRS990EZ',
-        '990PF': './irs:ReturnData/irs:IRS990PF',
-        '990T': './irs:ReturnData/irs:IRS990T'
-    }
-
-    for form_type, xpath in form_types.items():
+    for form_type, xpath, compiled_xpath in _get_form_type_xpaths(ns):
         try:
-            if Return.xpath(xpath, namespaces=ns):
+            if compiled_xpath(Return):
                 logger.debug(f"Detected form type '{form_type}' using XPath: {xpath}")
                 return form_type
         except Exception as e:
@@ -1,23 +1,103 @@
 # xml_downloader.py
 
-import requests
+import os
+import hashlib
+import tempfile
 import zipfile
 import io
 from logger import logger
+from config import SPOOL_DIR, DOWNLOAD_TIMEOUT, ARCHIVE_CACHE_ENABLED
+from range_downloader import get_http_session, download_file_segmented
+from archive_cache import get_archive_cache
 
 def download_and_extract_xml_files(url):
-    logger.info(f'Downloading zip file from {url}')
-    response = requests.get(url)
-    response.raise_for_status()
-    logger.info('Download complete.')
+    if ARCHIVE_CACHE_ENABLED:
+        zip_source = get_archive_cache().fetch(url)
+    else:
+        logger.info(f'Downloading zip file from {url}')
+        response = get_http_session().get(url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        logger.info('Download complete.')
+        zip_source = io.BytesIO(response.content)
 
     logger.info('Extracting all XML files from zip archive.')
-    zip_file = zipfile.ZipFile(io.BytesIO(response.content))
     xml_files = {}
-    for filename in zip_file.namelist():
-        if filename.endswith('.xml'):
-            with zip_file.open(filename) as file:
-                xml_files[filename] = file.read()
-                logger.info(f'Extracted {filename}')
+    try:
+        with zipfile.ZipFile(zip_source) as zip_file:
+            for filename in zip_file.namelist():
+                if filename.endswith('.xml'):
+                    with zip_file.open(filename) as file:
+                        xml_files[filename] = file.read()
+                        logger.info(f'Extracted {filename}')
+    finally:
+        if ARCHIVE_CACHE_ENABLED:
+            get_archive_cache().release(zip_source)
     logger.info('Extraction complete.')
     return xml_files
+
+def get_spool_path(url, spool_dir=SPOOL_DIR):
+    """
+    Returns the spool file path for a URL.
+
+    The path is stable across runs so an interrupted download can be resumed.
+    """
+    url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(spool_dir or tempfile.gettempdir(), f'{url_hash}_{os.path.basename(url)}')
+
+def download_to_spool(url, spool_dir=SPOOL_DIR):
+    """
+    Downloads a zip archive to a local spool file without holding it in memory.
+
+    The archive is fetched as parallel range segments and a partial spool left behind by
+    a crash is resumed rather than downloaded again. When the archive cache is enabled the
+    cached archive itself is returned and no spool file is written.
+
+    Args:
+        url (str): The URL of the zip archive.
+        spool_dir (str): Directory for the spool file, or None for the system temp directory.
+
+    Returns:
+        str: The path of the spool file. Release it with release_spool once parsed.
+    """
+    if ARCHIVE_CACHE_ENABLED:
+        return get_archive_cache().fetch(url)
+
+    logger.info(f'Downloading zip file from {url} to spool')
+    spool_path = download_file_segmented(url, get_spool_path(url, spool_dir))
+    logger.info(f'Download complete. Spooled {os.path.getsize(spool_path)} bytes to {spool_path}')
+    return spool_path
+
+def release_spool(spool_path):
+    """
+    Removes a spool file returned by download_to_spool. Cached archives are left in place and
+    unpinned, so the cache may evict them again.
+    """
+    if ARCHIVE_CACHE_ENABLED:
+        get_archive_cache().release(spool_path)
+        return
+    os.remove(spool_path)
+    logger.info(f'Removed spool file {spool_path}')
+
+def count_xml_members(zip_path):
+    """
+    Counts the XML members of a zip archive using only its central directory.
+    """
+    with zipfile.ZipFile(zip_path) as zip_file:
+        return sum(1 for filename in zip_file.namelist() if filename.endswith('.xml'))
+
+def iter_xml_members(zip_path):
+    """
+    Lazily yields the XML members of a zip archive on disk.
+
+    Only one member is decompressed and held in memory at a time.
+
+    Yields:
+        tuple: (filename, xml_content) for each XML member of the archive.
+    """
+    with zipfile.ZipFile(zip_path) as zip_file:
+        for filename in zip_file.namelist():
+            if filename.endswith('.xml'):
+                with zip_file.open(filename) as file:
+                    xml_content = file.read()
+                logger.debug(f'Extracted {filename}')
+                yield filename, xml_content
@@ -0,0 +1,87 @@
+"""Fixtures shared by several test modules."""
+
+import os
+from http.server import BaseHTTPRequestHandler
+
+from lxml import etree
+
+COMBINED_XML = os.path.join(os.path.dirname(__file__), '..', 'combined.xml')
+
+def load_sample_returns():
+    """Splits combined.xml into its individual Return documents, skipping truncated ones."""
+    with open(COMBINED_XML, 'rb') as f:
+        documents = [b'<?xml' + part for part in f.read().split(b'<?xml') if part.strip()]
+    returns = []
+    for document in documents:
+        try:
+            returns.append(etree.fromstring(document))
+        except etree.XMLSyntaxError:
+            continue
+    return returns, documents
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serves in-memory files with optional range support, standing in for apps.irs.gov."""
+    files = {}
+    etag = '"v1"'
+    supports_ranges = True
+    failing_offsets = set()
+    requested_ranges = []
+    head_requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_headers(self, status, length, extra=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', self.etag)
+        if self.supports_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        type(self).head_requests += 1
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self._send_headers(200, len(self.files[self.path]))
+
+    def do_GET(self):
+        body = self.files[self.path]
+        range_header = self.headers.get('Range')
+        if not (range_header and self.supports_ranges):
+            self._send_headers(200, len(body))
+            self.wfile.write(body)
+            return
+        start, end = (int(value) for value in range_header.split('=')[1].split('-'))
+        type(self).requested_ranges.append((start, end))
+        if start in self.failing_offsets:
+            self.send_error(503)
+            return
+        self._send_headers(206, end - start + 1, {'Content-Range': f'bytes {start}-{end}/{len(body)}'})
+        self.wfile.write(body[start:end + 1])
+
+class FailingClient:
+    """
+    Wraps an S3 client so that calls of the given operation whose arguments include all of
+    the given values fail, e.g. FailingClient(client, 'upload_part', PartNumber=2).
+    """
+
+    def __init__(self, client, operation, **arguments):
+        self.client = client
+        self.operation = operation
+        self.arguments = arguments
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        if name != self.operation:
+            return method
+
+        def call(**kwargs):
+            if all(kwargs.get(key) == value for key, value in self.arguments.items()):
+                raise IOError('connection reset')
+            return method(**kwargs)
+        return call
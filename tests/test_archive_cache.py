@@ -0,0 +1,136 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from http.server import ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import archive_cache
+from archive_cache import ArchiveCache, get_archive_cache
+
+from helpers import RangeRequestHandler
+
+class TestArchiveCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        RangeRequestHandler.files = {'/a.zip': b'a' * 3000, '/b.zip': b'b' * 3000, '/c.zip': b'c' * 3000}
+        RangeRequestHandler.etag = '"v1"'
+        RangeRequestHandler.supports_ranges = True
+        RangeRequestHandler.failing_offsets = set()
+        RangeRequestHandler.requested_ranges = []
+        RangeRequestHandler.head_requests = 0
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_cache(self, **kwargs):
+        kwargs.setdefault('max_bytes', 10000)
+        kwargs.setdefault('revalidate_after', 3600)
+        return ArchiveCache(self.tmp_dir.name, session=requests.Session(), **kwargs)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def fetch(self, cache, name):
+        """Fetches an archive and releases it, as the pipeline does once it is parsed."""
+        path = cache.fetch(f'{self.base_url}/{name}')
+        cache.release(path)
+        return path
+
+    def test_fresh_hit_uses_no_network(self):
+        path = self.fetch(self.make_cache(), 'a.zip')
+        self.assertEqual(self.read(path), b'a' * 3000)
+        self.assertEqual(RangeRequestHandler.head_requests, 1)
+
+        RangeRequestHandler.head_requests = 0
+        RangeRequestHandler.requested_ranges = []
+        self.assertEqual(self.fetch(self.make_cache(), 'a.zip'), path)
+        self.assertEqual(RangeRequestHandler.head_requests, 0)
+        self.assertEqual(RangeRequestHandler.requested_ranges, [])
+
+    def test_stale_entry_revalidates_with_etag(self):
+        cache = self.make_cache(revalidate_after=0)
+        path = self.fetch(cache, 'a.zip')
+
+        RangeRequestHandler.requested_ranges = []
+        self.assertEqual(self.fetch(cache, 'a.zip'), path)
+        self.assertEqual(RangeRequestHandler.requested_ranges, [])
+
+        RangeRequestHandler.etag = '"v2"'
+        RangeRequestHandler.files['/a.zip'] = b'z' * 3000
+        new_path = self.fetch(cache, 'a.zip')
+        self.assertNotEqual(new_path, path)
+        self.assertEqual(self.read(new_path), b'z' * 3000)
+        self.assertFalse(os.path.exists(path))
+
+    def test_evicts_least_recently_used(self):
+        cache = self.make_cache(max_bytes=7000)
+        path_a = self.fetch(cache, 'a.zip')
+        path_b = self.fetch(cache, 'b.zip')
+        self.fetch(cache, 'a.zip')
+        self.fetch(cache, 'c.zip')
+
+        self.assertTrue(os.path.exists(path_a))
+        self.assertFalse(os.path.exists(path_b))
+        self.assertIsNone(cache.lookup(f'{self.base_url}/b.zip'))
+
+    def test_pinned_archives_are_not_evicted(self):
+        cache = self.make_cache(max_bytes=7000)
+        path_a = cache.fetch(f'{self.base_url}/a.zip')
+        path_b = self.fetch(cache, 'b.zip')
+        self.fetch(cache, 'c.zip')
+
+        # a.zip is still being parsed, so the less recently used but unpinned b.zip goes instead
+        self.assertTrue(os.path.exists(path_a))
+        self.assertFalse(os.path.exists(path_b))
+
+        cache.release(path_a)
+        self.fetch(cache, 'b.zip')
+        self.assertFalse(os.path.exists(path_a))
+
+    def test_replaced_archive_is_kept_until_released(self):
+        cache = self.make_cache(revalidate_after=0)
+        path = cache.fetch(f'{self.base_url}/a.zip')
+        RangeRequestHandler.etag = '"v2"'
+        RangeRequestHandler.files['/a.zip'] = b'z' * 3000
+        self.fetch(cache, 'a.zip')
+        self.assertEqual(self.read(path), b'a' * 3000)
+        cache.release(path)
+        self.assertFalse(os.path.exists(path))
+
+    def test_shared_cache_is_created_once_across_threads(self):
+        def make_cache():
+            time.sleep(0.05)
+            return self.make_cache()
+
+        caches = []
+        with mock.patch.object(archive_cache, '_archive_cache', None), \
+                mock.patch.object(archive_cache, 'ArchiveCache', side_effect=make_cache) as constructor:
+            threads = [threading.Thread(target=lambda: caches.append(get_archive_cache())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(constructor.call_count, 1)
+        self.assertEqual(len({id(cache) for cache in caches}), 1)
+
+if __name__ == '__main__':
+    unittest.main()
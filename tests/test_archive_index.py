@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from archive_index import load_archive_index, select_members, iter_indexed_members
+
+from helpers import load_sample_returns
+
+FILER_STATE = b'<CityNm>Fayetteville</CityNm>\n        <StateAbbreviationCd>GA</StateAbbreviationCd>'
+
+class TestArchiveIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp_dir.name, 'archive.zip')
+        self.index_path = os.path.join(self.tmp_dir.name, 'archive.zip.index.parquet')
+        _, documents = load_sample_returns()
+        self.members = {
+            'ga.xml': documents[0],
+            'ca.xml': documents[0].replace(FILER_STATE, FILER_STATE.replace(b'GA', b'CA')),
+            'ambiguous.xml': documents[0].replace(FILER_STATE, FILER_STATE.replace(b'GA', b'<!-- x -->CA')),
+            'stored.xml': documents[1],
+            'bzip2.xml': documents[1].replace(b'<', b' <'),
+        }
+        with zipfile.ZipFile(self.zip_path, 'w') as zip_file:
+            zip_file.writestr('readme.txt', b'not a return')
+            for name, content in self.members.items():
+                compression = {'stored.xml': zipfile.ZIP_STORED, 'bzip2.xml': zipfile.ZIP_BZIP2}.get(name, zipfile.ZIP_DEFLATED)
+                zip_file.writestr(name, content, compress_type=compression)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_index_records_header_fields(self):
+        index = load_archive_index(self.zip_path, self.index_path)
+        rows = {row['member']: row for row in index.to_pylist()}
+        self.assertEqual(sorted(rows), sorted(self.members))
+        self.assertEqual(rows['ga.xml']['State'], 'GA')
+        self.assertEqual(rows['ga.xml']['EIN'], '581918112')
+        self.assertEqual(rows['ga.xml']['TaxYear'], 2021)
+        self.assertEqual(rows['ga.xml']['FormType'], '990T')
+        self.assertEqual(rows['ga.xml']['returnVersion'], '2021v4.1')
+        self.assertEqual(rows['ca.xml']['State'], 'CA')
+        self.assertIsNone(rows['ambiguous.xml']['State'])
+
+    def test_select_keeps_ambiguous_members_and_reads_by_offset(self):
+        index = load_archive_index(self.zip_path, self.index_path)
+        rows = select_members(index, states=['ca'])
+        self.assertEqual(rows['member'].to_pylist(), ['ca.xml', 'ambiguous.xml'])
+        self.assertEqual(dict(iter_indexed_members(self.zip_path, rows)),
+                         {name: self.members[name] for name in ['ca.xml', 'ambiguous.xml']})
+
+        rows = select_members(index, eins=['58-1918112'], form_types=['990T'])
+        self.assertEqual(rows['member'].to_pylist(), ['ga.xml', 'ca.xml', 'ambiguous.xml'])
+        rows = select_members(index, tax_years=[2021])
+        self.assertEqual(dict(iter_indexed_members(self.zip_path, rows)), self.members)
+
+    def test_stale_index_is_rebuilt(self):
+        load_archive_index(self.zip_path, self.index_path)
+        self.assertIsNotNone(load_archive_index(self.zip_path, self.index_path, build=False))
+        with zipfile.ZipFile(self.zip_path, 'a') as zip_file:
+            zip_file.writestr('new.xml', self.members['ga.xml'])
+        self.assertIsNone(load_archive_index(self.zip_path, self.index_path, build=False))
+        index = load_archive_index(self.zip_path, self.index_path)
+        self.assertIn('new.xml', index['member'].to_pylist())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bmf_enrichment import load_bmf_index, join_bmf_ntee_codes
+from record_store import RecordStore
+from xml_parser import parse_return
+
+from helpers import load_sample_returns
+
+BMF_CSV = """EIN,NAME,STATE,NTEE_CD,SORT_NAME
+123456789,EXAMPLE SCHOOL,GA,B20Z,
+012345678,EXAMPLE FOOD BANK,GA,k31,
+222222222,NO CODE FOUNDATION,GA,,
+123456789,EXAMPLE SCHOOL DUPLICATE,GA,B99,
+"""
+
+class TestBMFEnrichment(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp_dir.name, 'eo_ga.csv')
+        with open(self.csv_path, 'w') as f:
+            f.write(BMF_CSV)
+        self.index_path = os.path.join(self.tmp_dir.name, 'bmf_index.parquet')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_index_is_built_once_and_reused(self):
+        index = load_bmf_index([self.csv_path], self.index_path)
+        self.assertEqual(index['EIN'].to_pylist(), ['012345678', '123456789'])
+        self.assertEqual(index['NTEECode'].to_pylist(), ['K31', 'B20'])
+        self.assertTrue(os.path.exists(self.index_path))
+
+        mtime = os.path.getmtime(self.index_path)
+        self.assertTrue(load_bmf_index([self.csv_path], self.index_path).equals(index))
+        self.assertEqual(os.path.getmtime(self.index_path), mtime)
+        self.assertIsNone(load_bmf_index([], self.index_path))
+
+    def test_join_leaves_unmatched_eins_to_later_tiers(self):
+        index = load_bmf_index([self.csv_path], None)
+        store = RecordStore(batch_size=2)
+        store.append_records([
+            {'EIN': '123456789', 'OrganizationName': 'Example School', '_source_file': 'a.xml'},
+            {'EIN': '12345678', 'OrganizationName': 'Example Food Bank', '_source_file': 'b.xml'},
+            {'EIN': '222222222', 'OrganizationName': 'No Code Foundation', '_source_file': 'c.xml'},
+            {'EIN': '333333333', 'NTEECode': 'P20', 'NTEEDescription': 'Human Service Organizations',
+             '_source_file': 'd.xml'},
+            {'EIN': None, '_source_file': 'e.xml'},
+        ])
+        table, missing = join_bmf_ntee_codes(store.to_table(), index)
+        self.assertEqual(missing.to_pylist(), [False, False, True, False, True])
+        self.assertEqual(table['NTEECode'].to_pylist(), ['B20', 'K31', None, 'P20', None])
+        self.assertEqual(table['NTEEDescription'].to_pylist()[:2],
+                         ['Elementary & Secondary Schools', 'Food Banks & Pantries'])
+        self.assertEqual(table['_source_file'].to_pylist(), ['a.xml', 'b.xml', 'c.xml', 'd.xml', 'e.xml'])
+
+    def test_join_fills_parsed_records_without_a_code(self):
+        returns, _ = load_sample_returns()
+        records = [parse_return(Return, {'irs': 'http://www.irs.gov/efile'}, f'{index}.xml')
+                   for index, Return in enumerate(returns[:2])]
+        self.assertEqual([data['NTEECode'] for data in records], ['Unknown', 'Unknown'])
+        with open(self.csv_path, 'w') as f:
+            f.write(f"EIN,NTEE_CD\n{records[0]['EIN']},X21\n")
+        store = RecordStore()
+        store.append_records(records)
+
+        table, missing = join_bmf_ntee_codes(store.to_table(), load_bmf_index([self.csv_path], None))
+        self.assertEqual(table['NTEECode'].to_pylist(), ['X21', 'Unknown'])
+        self.assertEqual(missing.to_pylist(), [False, True])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import math
+import os
+import sys
+import unittest
+
+import pyarrow as pa
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from columnar import convert_column, ColumnarRecordBuilder
+from utils import convert_value
+
+VALUES = ['1', '+2', '-3', '007', '5.0', '1e3', '.5', '5.', '-1.5E-2', 'inf', '-Infinity', 'NaN',
+          'abc', '12abc', '1,000', '', 'TRUE', 'x', 'No', None]
+
+def normalize(value):
+    return 'nan' if isinstance(value, float) and math.isnan(value) else value
+
+class TestColumnar(unittest.TestCase):
+    def test_convert_column_matches_convert_value(self):
+        for type_ in ['int', 'double', 'boolean', 'string']:
+            converted, failures = convert_column(pa.array(VALUES, type=pa.string()), type_)
+            expected = [convert_value(value, type_) if value is not None else None for value in VALUES]
+            if type_ == 'boolean':
+                expected = [value if value is not None else False for value in expected]
+            self.assertEqual([normalize(value) for value in converted.to_pylist()],
+                             [normalize(value) for value in expected], type_)
+            expected_failures = sum(1 for raw, value in zip(VALUES, expected) if raw is not None and value is None)
+            self.assertEqual(failures, expected_failures, type_)
+
+    def test_builder_converts_records_and_counts_failures(self):
+        builder = ColumnarRecordBuilder()
+        builder.append({'EIN': '123456789', 'TaxYear': '2021', 'TotalRevenue': '100.5', 'TotalRevenue_path': 'a'})
+        builder.append({'EIN': '987654321', 'TaxYear': '2022', 'TotalRevenue': 'n/a'})
+        builder.append({'EIN': '555555555', 'TaxYear': 'abcd'})
+
+        table = builder.build()
+        self.assertEqual(table.schema.field('TaxYear').type, pa.int64())
+        self.assertEqual(table.schema.field('TotalRevenue').type, pa.float64())
+        self.assertEqual(table['TotalRevenue'].to_pylist(), [100.5, None, None])
+        self.assertEqual(dict(builder.failures), {'TotalRevenue': 1, 'TaxYear': 1})
+
+        records = builder.to_records()
+        self.assertEqual(records[0], {'EIN': '123456789', 'TaxYear': 2021, 'TotalRevenue': 100.5, 'TotalRevenue_path': 'a'})
+        self.assertEqual(records[1], {'EIN': '987654321', 'TaxYear': 2022, 'TotalRevenue': None})
+        self.assertEqual(records[2], {'EIN': '555555555', 'TaxYear': None})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import data_processor
+
+from helpers import load_sample_returns
+
+class TestProcessXmlFiles(unittest.TestCase):
+    def setUp(self):
+        _, documents = load_sample_returns()
+        # Several copies so the files span many chunks and all pool workers
+        self.xml_files = {f'{copy}_{index}.xml': document
+                          for copy in range(5) for index, document in enumerate(documents)}
+
+    def process(self, workers, state_filter='GA'):
+        with mock.patch.object(data_processor, 'PARSE_CHUNK_FILES', 3), \
+                mock.patch.object(data_processor, 'print_summary') as print_summary:
+            records, no_total_assets_files = data_processor.process_xml_files(
+                self.xml_files, state_filter, None, workers=workers
+            )
+        stats = print_summary.call_args.args
+        # Everything but the start time and the records themselves
+        return records.to_table(), no_total_assets_files, stats[1:2] + stats[3:]
+
+    def test_workers_produce_identical_results(self):
+        table, no_total_assets_files, stats = self.process(1)
+        self.assertGreater(table.num_rows, 0)
+        for workers in [2, 3]:
+            parallel_table, parallel_no_total_assets_files, parallel_stats = self.process(workers)
+            self.assertTrue(parallel_table.equals(table))
+            self.assertEqual(list(parallel_no_total_assets_files.items()), list(no_total_assets_files.items()))
+            self.assertEqual(parallel_stats, stats)
+
+    def test_pool_is_reused_across_archives(self):
+        self.process(2)
+        pool = data_processor.get_parse_pool(2)
+        self.process(2)
+        self.assertIs(data_processor.get_parse_pool(2), pool)
+
+class TestStreamingParse(unittest.TestCase):
+    def setUp(self):
+        self.returns, _ = load_sample_returns()
+        # The complete sample Returns of combined.xml in one multi-Return document
+        self.xml_content = b'<Returns>' + b''.join(etree.tostring(Return) for Return in self.returns) + b'</Returns>'
+
+    def parse(self, streaming):
+        with mock.patch.object(data_processor, 'XML_STREAMING_PARSE', streaming):
+            return data_processor.parse_xml_file('combined.xml', self.xml_content, 'GA')
+
+    def test_iter_returns_yields_each_return_in_order(self):
+        streamed = [etree.tostring(Return) for Return in data_processor.iter_returns(self.xml_content)]
+        self.assertEqual(streamed, [etree.tostring(Return) for Return in self.returns])
+
+    def test_streaming_matches_tree_parse(self):
+        tree_result = self.parse(False)
+        self.assertEqual(tree_result['returns_processed'], len(self.returns))
+        self.assertGreater(len(tree_result['records']), 0)
+        self.assertEqual(self.parse(True), tree_result)
+
+if __name__ == '__main__':
+    unittest.main()
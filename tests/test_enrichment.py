@@ -0,0 +1,87 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import data_processor
+from bmf_enrichment import load_bmf_index
+from enrichment import EnrichmentStage, unique_organizations
+from record_store import RecordStore
+
+from helpers import load_sample_returns
+
+def make_store():
+    store = RecordStore(batch_size=3)
+    store.append_records([
+        {'EIN': '111111111', 'OrganizationName': 'Example School', 'TaxYear': 2021, '_source_file': 'a.xml'},
+        {'EIN': '222222222', 'OrganizationName': 'Example Fund', 'TaxYear': 2021, '_source_file': 'b.xml'},
+        {'EIN': '111111111', 'OrganizationName': 'Example School Inc', 'TaxYear': 2022, '_source_file': 'c.xml'},
+        {'EIN': '333333333', 'OrganizationName': 'Example Clinic', 'NTEECode': 'E32',
+         'NTEEDescription': 'Community Health Systems', '_source_file': 'd.xml'},
+        {'EIN': None, 'OrganizationName': 'Nameless Club', '_source_file': 'e.xml'},
+        {'EIN': None, 'OrganizationName': 'Nameless Club', '_source_file': 'f.xml'},
+        {'EIN': '444444444', 'OrganizationName': 'Example Food Bank', '_source_file': 'g.xml'},
+    ])
+    return store
+
+class TestEnrichmentStage(unittest.TestCase):
+    def setUp(self):
+        self.lookups = []
+        self.prefetches = []
+
+    def lookup(self, organization_name, mission_statement, ein):
+        self.lookups.append((ein, organization_name))
+        if ein == '222222222':
+            raise RuntimeError('lookup failed')
+        return {'ntee_code': f'X{len(self.lookups):02d}', 'ntee_description': organization_name}
+
+    def prefetch(self, eins, organization_names, mission_statements):
+        self.prefetches.append(list(eins))
+
+    def test_unique_organizations(self):
+        organizations = unique_organizations(make_store().to_table())
+        self.assertEqual(organizations['EIN'].to_pylist(),
+                         ['111111111', '222222222', '333333333', None, '444444444'])
+        self.assertEqual(organizations['OrganizationName'].to_pylist()[0], 'Example School')
+
+    def test_each_organization_is_resolved_once(self):
+        stage = EnrichmentStage(self.lookup, self.prefetch, batch_size=2)
+        store = stage.run(make_store())
+        self.assertEqual(self.lookups, [('111111111', 'Example School'), ('222222222', 'Example Fund'),
+                                        ('', 'Nameless Club'), ('444444444', 'Example Food Bank')])
+        self.assertEqual(self.prefetches, [['111111111', '222222222'], [None, '444444444']])
+        table = store.to_table()
+        self.assertEqual(table['NTEECode'].to_pylist(), ['X01', None, 'X01', 'E32', 'X03', 'X03', 'X04'])
+        self.assertEqual(table['_source_file'].to_pylist(), ['a.xml', 'b.xml', 'c.xml', 'd.xml', 'e.xml', 'f.xml', 'g.xml'])
+        self.assertEqual(set(stage.timings), {'prefetch', 'lookup', 'join'})
+        self.assertIn('4 distinct organizations looked up', stage.summary())
+
+    def test_bmf_tier_runs_first(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, 'eo_ga.csv')
+            with open(csv_path, 'w') as f:
+                f.write('EIN,NAME,NTEE_CD\n111111111,EXAMPLE SCHOOL,B20\n444444444,EXAMPLE FOOD BANK,K31\n')
+            bmf_index = load_bmf_index([csv_path], None)
+        stage = EnrichmentStage(self.lookup, bmf_index=bmf_index)
+        table = stage.run(make_store().to_table())
+        self.assertEqual(self.lookups, [('222222222', 'Example Fund'), ('', 'Nameless Club')])
+        self.assertEqual(table['NTEECode'].to_pylist(), ['B20', None, 'B20', 'E32', 'X02', 'X02', 'K31'])
+        self.assertIn('bmf', stage.timings)
+
+    def test_parsed_records_are_looked_up(self):
+        _, documents = load_sample_returns()
+        xml_files = {f'{index}.xml': document for index, document in enumerate(documents)}
+        with mock.patch.object(data_processor, 'print_summary'):
+            store, _ = data_processor.process_xml_files(xml_files, 'GA', None, workers=1)
+        eins = store.to_table()['EIN'].to_pylist()
+        self.assertGreater(len(eins), 0)
+
+        table = EnrichmentStage(self.lookup).run(store).to_table()
+        self.assertEqual(sorted(ein for ein, _ in self.lookups), sorted(set(eins)))
+        self.assertNotIn('Unknown', table['NTEECode'].to_pylist())
+
+if __name__ == '__main__':
+    unittest.main()
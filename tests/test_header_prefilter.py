@@ -0,0 +1,63 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import data_processor
+from header_prefilter import scan_header, prefilter_state, MATCH, NO_MATCH, AMBIGUOUS
+
+HEADER = b'''<?xml version="1.0" encoding="utf-8"?>
+<Return xmlns="http://www.irs.gov/efile" returnVersion="2021v4.2">
+  <ReturnHeader binaryAttachmentCnt="0">
+    <TaxYr>2021</TaxYr>
+    <Filer>
+      <EIN>123456789</EIN>
+      <BusinessName><BusinessNameLine1Txt>Example Org</BusinessNameLine1Txt></BusinessName>
+      <USAddress><AddressLine1Txt>1 Main St</AddressLine1Txt><CityNm>Atlanta</CityNm>
+        <StateAbbreviationCd>%s</StateAbbreviationCd></USAddress>
+    </Filer>
+    %s
+  </ReturnHeader>
+  <ReturnData><IRS990><TotalAssetsGrp><EOYAmt>100</EOYAmt></TotalAssetsGrp></IRS990></ReturnData>
+</Return>'''
+
+def make_document(state=b'GA', extra=b''):
+    return HEADER % (state, extra)
+
+class TestHeaderPrefilter(unittest.TestCase):
+    def test_reads_filer_state_and_ein(self):
+        self.assertEqual(scan_header(make_document()), {
+            'State': 'GA', 'EIN': '123456789', 'TaxYear': 2021, 'FormType': None, 'returnVersion': '2021v4.2'
+        })
+        self.assertEqual(prefilter_state(make_document(), 'ga'), MATCH)
+        self.assertEqual(prefilter_state(make_document(), 'CA'), NO_MATCH)
+
+    def test_ambiguous_headers_fall_back_to_full_parse(self):
+        preparer = b'<PreparerFirmGrp><PreparerUSAddress><StateAbbreviationCd>CA</StateAbbreviationCd></PreparerUSAddress></PreparerFirmGrp>'
+        ambiguous = [
+            make_document(b'<!-- moved -->GA'),
+            make_document(b''),
+            make_document(extra=b'<Filer><EIN>987654321</EIN></Filer>'),
+            make_document() + make_document().split(b'?>', 1)[1],
+        ]
+        for document in ambiguous:
+            self.assertEqual(prefilter_state(document, 'CA'), AMBIGUOUS)
+        # A state outside the Filer block does not make the Filer state ambiguous
+        self.assertEqual(prefilter_state(make_document(extra=preparer), 'CA'), NO_MATCH)
+
+    def parse(self, document, state_filter, prefilter):
+        with mock.patch.object(data_processor, 'HEADER_PREFILTER', prefilter):
+            result = data_processor.parse_xml_file('return.xml', document, state_filter)
+        result.pop('prefiltered')
+        return result
+
+    def test_parse_results_match_full_parse(self):
+        documents = [make_document(), make_document(b'CA'), make_document(b'<!-- moved -->GA')]
+        for document in documents:
+            for state_filter in ['GA', 'CA']:
+                self.assertEqual(self.parse(document, state_filter, True), self.parse(document, state_filter, False))
+
+if __name__ == '__main__':
+    unittest.main()
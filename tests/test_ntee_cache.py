@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ntee_cache import NTEECache
+
+class TestNTEECache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'ntee_cache.sqlite3')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hits_negatives_and_misses(self):
+        cache = NTEECache(self.path, ttl=3600, negative_ttl=3600)
+        cache.put('propublica', '123456789', 'B20')
+        cache.put('propublica', '987654321', None)
+        self.assertEqual(cache.get('propublica', '123456789'), (True, 'B20'))
+        self.assertEqual(cache.get('propublica', '987654321'), (True, None))
+        self.assertEqual(cache.get('propublica', '555555555'), (False, None))
+        self.assertEqual(cache.get('other', '123456789'), (False, None))
+        self.assertEqual(cache.stats(), {'hits': 1, 'negative_hits': 1, 'misses': 2})
+
+        # Entries persist across instances
+        reopened = NTEECache(self.path)
+        self.assertEqual(reopened.get_many('propublica', ['123456789', '987654321']),
+                         {'123456789': (True, 'B20'), '987654321': (True, None)})
+
+    def test_negative_results_expire_separately(self):
+        cache = NTEECache(self.path, ttl=3600, negative_ttl=0.05)
+        cache.put_many('propublica', {'123456789': 'B20', '987654321': None})
+        time.sleep(0.1)
+        self.assertEqual(cache.get('propublica', '123456789'), (True, 'B20'))
+        self.assertEqual(cache.get('propublica', '987654321'), (False, None))
+
+    def test_database_errors_degrade_to_misses(self):
+        cache = NTEECache(self.path)
+        cache.put('propublica', '123456789', 'B20')
+        with sqlite3.connect(self.path) as connection:
+            connection.execute('DROP TABLE entries')
+        self.assertEqual(cache.get_many('propublica', ['123456789', '987654321']),
+                         {'123456789': (False, None), '987654321': (False, None)})
+        cache.put('propublica', '987654321', 'B20')
+        self.assertEqual(cache.stats(), {'hits': 0, 'negative_hits': 0, 'misses': 2})
+
+    def test_concurrent_writers(self):
+        cache = NTEECache(self.path)
+
+        def write(thread_id):
+            for i in range(50):
+                cache.put('propublica', f'{thread_id}-{i}', {'ntee_code': f'A{i:02d}'})
+
+        threads = [threading.Thread(target=write, args=(thread_id,)) for thread_id in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results = cache.get_many('propublica', [f'{t}-{i}' for t in range(8) for i in range(50)])
+        self.assertTrue(all(found for found, _ in results.values()))
+        self.assertEqual(results['7-49'], (True, {'ntee_code': 'A49'}))
+
+if __name__ == '__main__':
+    unittest.main()
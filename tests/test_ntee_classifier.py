@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ntee_classifier import NTEEClassifier, load_category_documents, tokenize
+
+class TestNTEEClassifier(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.classifier = NTEEClassifier(min_confidence=0.3)
+
+    def test_documents_cover_three_character_codes(self):
+        documents = load_category_documents()
+        self.assertIn('B20', documents)
+        self.assertNotIn('B', documents)
+        self.assertTrue(all(len(code) == 3 for code in documents))
+        # Category names shared by every major group are described by their own group
+        self.assertIn('Education', documents['B01'])
+        self.assertIn('Arts', documents['A01'])
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('The Libraries of Georgia, Inc.'), ['library', 'georgia'])
+
+    def test_confident_classifications(self):
+        cases = [
+            (('Atlanta Symphony Orchestra', 'Music performances'), 'A'),
+            (('Georgia Food Bank', 'Distributes food to hungry families'), 'K'),
+            (('Little League Baseball', 'Youth baseball'), 'N'),
+        ]
+        for organization, major_group in cases:
+            ntee_code, confidence = self.classifier.classify(*organization)
+            self.assertEqual(ntee_code[0], major_group, organization)
+            self.assertTrue(self.classifier.is_confident(confidence), (organization, confidence))
+
+    def test_unmatched_and_weak_classifications(self):
+        self.assertEqual(self.classifier.classify('Acme Holdings LLC', ''), (None, 0.0))
+        self.assertEqual(self.classifier.classify(None, None), (None, 0.0))
+        _, confidence = self.classifier.classify('Smith Family Foundation', '')
+        self.assertFalse(self.classifier.is_confident(confidence))
+
+    def test_classify_many_matches_classify_in_order(self):
+        organizations = [
+            ('Community Food Bank', 'Feeding hungry families in the county'),
+            ('Smith Family Foundation', ''),
+            ('Riverside Youth Soccer League', None),
+            ('', ''),
+        ] * 50
+        classified = self.classifier.classified
+        results = self.classifier.classify_many(organizations)
+        self.assertEqual(self.classifier.classified - classified, len(organizations))
+        self.assertEqual(results, [self.classifier.classify(name, mission) for name, mission in organizations])
+        self.assertEqual(results[0], results[4])
+
+if __name__ == '__main__':
+    unittest.main()
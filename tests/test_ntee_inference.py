@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai import OpenAI
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ntee_cache import NTEECache
+from ntee_inference import NTEEInferenceClient, inference_key, parse_batch_response
+
+class FakeCompletionHandler(BaseHTTPRequestHandler):
+    """Answers chat completions offline, coding schools as B20 and everything else as T99."""
+    requests = []
+    active = 0
+    max_active = 0
+    fail_next = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            organizations = json.loads(request['messages'][-1]['content'].split('Organizations:\n', 1)[1])
+            cls.requests.append(organizations)
+            time.sleep(0.05)
+            if cls.fail_next:
+                cls.fail_next -= 1
+                self.send_error(400)
+                return
+            results = [{'id': org['id'], 'ntee_code': 'B20' if 'school' in org['name'].lower() else 't99x',
+                        'confidence': 0.8} for org in organizations]
+            body = json.dumps({
+                'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0, 'model': request['model'],
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': json.dumps({'results': results})}}]
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+class TestNTEEInference(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCompletionHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.openai = OpenAI(base_url=f'http://127.0.0.1:{cls.server.server_port}/v1', api_key='test', max_retries=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakeCompletionHandler.requests = []
+        FakeCompletionHandler.max_active = 0
+        FakeCompletionHandler.fail_next = 0
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = NTEECache(os.path.join(self.tmp_dir.name, 'ntee_cache.sqlite3'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_batches_run_concurrently_and_are_cached(self):
+        organizations = [(f'Example School {i}', 'Education') for i in range(9)] + [(f'Fund {i}', '') for i in range(9)]
+        organizations.append(('  EXAMPLE school 0 ', 'education'))
+        inference = NTEEInferenceClient(self.openai, model='test-model', batch_size=4, max_concurrency=3, cache=self.cache)
+
+        results = inference.infer_ntee_codes(organizations)
+        self.assertEqual(len(results), 18)
+        self.assertEqual(results[inference_key('Example School 3', 'Education')], {'ntee_code': 'B20', 'confidence': 0.8})
+        self.assertEqual(results[inference_key('Fund 3', '')]['ntee_code'], 'T99')
+        self.assertEqual(sorted(len(batch) for batch in FakeCompletionHandler.requests), [2, 4, 4, 4, 4])
+        self.assertGreater(FakeCompletionHandler.max_active, 1)
+        self.assertLessEqual(FakeCompletionHandler.max_active, 3)
+
+        # Normalized duplicates and repeated runs are served from the cache
+        again = NTEEInferenceClient(self.openai, model='test-model', cache=self.cache).infer_ntee_codes(organizations)
+        self.assertEqual(again, results)
+        self.assertEqual(len(FakeCompletionHandler.requests), 5)
+
+    def test_failed_batches_are_not_cached(self):
+        FakeCompletionHandler.fail_next = 1
+        inference = NTEEInferenceClient(self.openai, model='test-model', batch_size=10, cache=self.cache)
+        self.assertEqual(inference.infer_ntee_codes([('Example School', 'Education')]), {})
+        self.assertEqual(inference.failed_requests, 1)
+        self.assertEqual(len(inference.infer_ntee_codes([('Example School', 'Education')])), 1)
+
+    def test_parse_batch_response(self):
+        content = 'Here you go: {"results": [{"id": 0, "ntee_code": "b203", "confidence": 0.5}, ' \
+                  '{"id": 1, "ntee_code": "none"}, {"id": 7, "ntee_code": "A01"}]}'
+        self.assertEqual(parse_batch_response(content, 2), {0: {'ntee_code': 'B20', 'confidence': 0.5}})
+        with self.assertRaises(ValueError):
+            parse_batch_response('no idea', 1)
+
+if __name__ == '__main__':
+    unittest.main()
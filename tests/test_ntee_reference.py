@@ -0,0 +1,54 @@
+import os
+import sys
+import unittest
+
+import pandas as pd
+import pyarrow as pa
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ntee_reference import NTEEReference, normalize_code
+
+class TestNTEEReference(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reference = NTEEReference()
+
+    def test_lookups(self):
+        self.assertEqual(normalize_code(' b203 '), 'B20')
+        self.assertIsNone(normalize_code(''))
+        self.assertEqual(self.reference.describe('B20'), 'Elementary & Secondary Schools')
+        self.assertEqual(self.reference.describe('b203'), 'Elementary & Secondary Schools')
+        self.assertEqual(self.reference.describe('B'), 'Education')
+        self.assertIsNone(self.reference.describe('R98'))
+        self.assertEqual(self.reference.major_group('B20'), 'B')
+        self.assertIsNone(self.reference.major_group('Unknown'))
+        self.assertEqual(self.reference.major_group_name('A69'), 'Arts, Culture & Humanities')
+
+    def test_category_text(self):
+        self.assertIn('kindergarten', self.reference.category_text('B20'))
+        # Names shared across major groups fall back to the major group's description
+        self.assertEqual(self.reference.category_text('B01'), self.reference.category_text('B'))
+        self.assertEqual(self.reference.category_text('R98'), '')
+
+    def test_map_codes_arrow(self):
+        codes = pa.chunked_array([['B20', 'a699', None], ['Unknown', ' P20']])
+        mapped = self.reference.map_codes(codes)
+        self.assertEqual(mapped.num_rows, 5)
+        self.assertEqual(mapped['NTEEMajorGroup'].to_pylist(), ['B', 'A', None, None, 'P'])
+        self.assertEqual(mapped['NTEEDescription'].to_pylist()[0], 'Elementary & Secondary Schools')
+        self.assertEqual(mapped['NTEEMajorGroupName'].to_pylist()[1], 'Arts, Culture & Humanities')
+
+        dictionary_codes = pa.array(['B20', 'B20', 'X']).dictionary_encode()
+        self.assertEqual(self.reference.map_codes(dictionary_codes)['NTEEMajorGroup'].to_pylist(), ['B', 'B', 'X'])
+
+    def test_map_codes_pandas(self):
+        codes = pd.Series(['B20', None, 'E32'], index=[10, 11, 12])
+        mapped = self.reference.map_codes(codes)
+        self.assertIsInstance(mapped, pd.DataFrame)
+        self.assertEqual(list(mapped.index), [10, 11, 12])
+        self.assertEqual(mapped.loc[12, 'NTEEMajorGroup'], 'E')
+        self.assertTrue(pd.isna(mapped.loc[11, 'NTEEDescription']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from io import BytesIO
+
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+from moto import mock_aws
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from parquet_dataset import LocalStorage, ParquetDataset, S3Storage, import_legacy_parquet, partition_path
+
+def make_table(rows):
+    return pa.Table.from_pylist([
+        {'EIN': ein, 'TaxYear': tax_year, 'State': state, 'TotalRevenue': revenue, '_source_file': f'{ein}.xml'}
+        for ein, tax_year, state, revenue in rows
+    ])
+
+class DatasetTests:
+    def test_append_writes_only_new_partition_files(self):
+        first = self.dataset.append(make_table([
+            ('111111111', 2021, 'GA', 1.0), ('222222222', 2021, 'GA', 2.0), ('333333333', 2022, 'CA', 3.0),
+        ]))
+        self.assertEqual(sorted(entry['path'].rsplit('/', 1)[0] for entry in first),
+                         ['TaxYear=2021/State=GA', 'TaxYear=2022/State=CA'])
+        second = self.dataset.append(make_table([('111111111', 2021, 'GA', 10.0), ('444444444', None, 'GA', 4.0)]))
+        self.assertEqual(len(second), 2)
+        self.assertEqual(len(self.dataset.live_files()), 4)
+        georgia_2021 = self.dataset.live_files(TaxYear=[2021], State=['GA'])
+        self.assertEqual([entry['run_id'] for entry in georgia_2021], [first[0]['run_id'], second[0]['run_id']])
+
+        # The last save of an (EIN, TaxYear) wins
+        table = self.dataset.read()
+        rows = {(row['EIN'], row['TaxYear']): row for row in table.to_pylist()}
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[('111111111', 2021)]['TotalRevenue'], 10.0)
+        self.assertEqual(rows[('444444444', None)]['State'], 'GA')
+        self.assertEqual(table.schema, self.dataset.schema)
+        self.assertEqual(self.dataset.read(State=['CA'])['EIN'].to_pylist(), ['333333333'])
+
+    def test_part_files_do_not_store_partition_columns(self):
+        entry = self.dataset.append(make_table([('111111111', 2021, 'GA', 1.0)]))[0]
+        part = pq.read_table(BytesIO(self.dataset.storage.read(entry['path'])))
+        self.assertNotIn('TaxYear', part.column_names)
+        self.assertNotIn('State', part.column_names)
+        manifest = json.loads(self.dataset.storage.read('_manifest.json'))
+        self.assertEqual(manifest['files'][0]['num_rows'], 1)
+
+    def test_empty_dataset(self):
+        self.assertEqual(self.dataset.read().num_rows, 0)
+        self.assertEqual(self.dataset.append(pa.table({'EIN': pa.array([], pa.string())})), [])
+
+    def test_upserts_resolve_across_state_partitions(self):
+        self.dataset.append(make_table([('111111111', 2021, 'GA', 1.0), ('222222222', 2021, 'GA', 2.0)]))
+        entries = self.dataset.append(make_table([('111111111', 2021, 'FL', 5.0)]))
+        self.assertEqual(entries[0]['sequence'], 1)
+        self.assertEqual(self.dataset.read(State=['GA'])['EIN'].to_pylist(), ['222222222'])
+        self.assertEqual(self.dataset.read(State=['FL'])['TotalRevenue'].to_pylist(), [5.0])
+        self.assertEqual(self.dataset.read(TaxYear=[2022]).num_rows, 0)
+
+    def test_compaction_folds_deltas_into_base_files(self):
+        for revenue in range(3):
+            self.dataset.append(make_table([('111111111', 2021, 'GA', float(revenue)),
+                                            (f'9{revenue:08d}', 2021, 'FL', 1.0), ('333333333', 2022, 'CA', 3.0)]))
+        self.dataset.append(make_table([('111111111', 2021, 'FL', 7.0)]))
+        before = self.dataset.read()
+        self.assertEqual(self.dataset.compaction_candidates(min_deltas=4), [(2021,)])
+        self.assertEqual(self.dataset.compact(), 0)
+
+        replaced = self.dataset.compact(force=True)
+        self.assertEqual(replaced, 10)
+        stats = self.dataset.stats()
+        self.assertEqual(stats['TaxYear=2021/State=FL'], {'base_files': 1, 'delta_files': 0, 'rows': 4,
+                                                          'bytes': stats['TaxYear=2021/State=FL']['bytes']})
+        self.assertNotIn('TaxYear=2021/State=GA', stats)
+        self.assertIsNone(self.dataset.storage.read(self.dataset.live_files()[0]['path'].replace('base', 'delta')))
+        after = self.dataset.read()
+        self.assertEqual(sorted(after.to_pylist(), key=str), sorted(before.to_pylist(), key=str))
+
+        # Deltas appended after compaction still win over the base files
+        self.dataset.append(make_table([('111111111', 2021, 'GA', 8.0)]))
+        self.assertEqual(self.dataset.read(State=['GA'])['TotalRevenue'].to_pylist(), [8.0])
+        self.assertEqual(self.dataset.read(State=['FL']).num_rows, 3)
+
+    def test_version_1_manifest_is_upgraded(self):
+        self.dataset.append(make_table([('111111111', 2021, 'GA', 1.0)]))
+        self.dataset.append(make_table([('111111111', 2021, 'GA', 2.0)]))
+        manifest = json.loads(self.dataset.storage.read('_manifest.json'))
+        manifest['version'] = 1
+        del manifest['next_sequence']
+        for entry in manifest['files']:
+            del entry['sequence'], entry['kind']
+        self.dataset.storage.write('_manifest.json', json.dumps(manifest).encode())
+        self.assertEqual(self.dataset.read()['TotalRevenue'].to_pylist(), [2.0])
+        self.assertEqual(self.dataset.append(make_table([('111111111', 2021, 'GA', 3.0)]))[0]['sequence'], 2)
+
+    def test_import_legacy_is_older_than_saved_records_and_runs_once(self):
+        self.dataset.append(make_table([('111111111', 2021, 'GA', 10.0)]))
+        legacy = make_table([('111111111', 2021, 'GA', 1.0), ('222222222', 2020, 'CA', 2.0)])
+        entries = self.dataset.import_legacy(legacy, 'irs990_data.parquet')
+        self.assertEqual([entry['sequence'] for entry in entries], [0, 0])
+        self.assertEqual(self.dataset.import_legacy(legacy, 'irs990_data.parquet'), [])
+        self.assertEqual(len(self.dataset.live_files()), 3)
+
+        self.dataset.append(make_table([('222222222', 2020, 'CA', 20.0)]))
+        rows = {(row['EIN'], row['TaxYear']): row['TotalRevenue'] for row in self.dataset.read().to_pylist()}
+        self.assertEqual(rows, {('111111111', 2021): 10.0, ('222222222', 2020): 20.0})
+
+class TestLocalParquetDataset(DatasetTests, unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dataset = ParquetDataset(LocalStorage(self.tmp_dir.name))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+class TestS3ParquetDataset(DatasetTests, unittest.TestCase):
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        client = boto3.client('s3')
+        client.create_bucket(Bucket='test-bucket')
+        self.dataset = ParquetDataset(S3Storage('test-bucket', 'irs990-data/irs990_dataset', client))
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def test_import_legacy_parquet(self):
+        self.assertEqual(import_legacy_parquet(self.dataset, 'test-bucket', 'irs990-data/irs990_data.parquet'), [])
+        buffer = BytesIO()
+        pq.write_table(make_table([('111111111', 2021, 'GA', 1.0)]), buffer)
+        boto3.client('s3').put_object(Bucket='test-bucket', Key='irs990-data/irs990_data.parquet', Body=buffer.getvalue())
+
+        self.assertEqual(len(import_legacy_parquet(self.dataset, 'test-bucket', 'irs990-data/irs990_data.parquet')), 1)
+        self.assertEqual(import_legacy_parquet(self.dataset, 'test-bucket', 'irs990-data/irs990_data.parquet'), [])
+        self.assertEqual(self.dataset.read()['EIN'].to_pylist(), ['111111111'])
+
+    def test_manifest_is_under_the_prefix(self):
+        self.dataset.append(make_table([('111111111', 2021, 'GA', 1.0)]))
+        keys = [item['Key'] for item in self.dataset.storage.client.list_objects_v2(Bucket='test-bucket')['Contents']]
+        self.assertIn('irs990-data/irs990_dataset/_manifest.json', keys)
+
+class TestPartitionPath(unittest.TestCase):
+    def test_partition_path(self):
+        self.assertEqual(partition_path({'TaxYear': 2021, 'State': 'GA'}), 'TaxYear=2021/State=GA')
+        self.assertEqual(partition_path({'TaxYear': None, 'State': 'A/B'}),
+                         'TaxYear=__HIVE_DEFAULT_PARTITION__/State=A%2FB')
+
+if __name__ == '__main__':
+    unittest.main()
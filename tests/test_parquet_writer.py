@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from parquet_writer import get_writer_options, write_table
+from parquet_benchmark import synthetic_records
+
+class TestParquetWriter(unittest.TestCase):
+    def test_profiles(self):
+        for profile in ['fast', 'balanced', 'compact']:
+            options = get_writer_options(profile)
+            self.assertEqual(options['compression'], 'zstd')
+            self.assertTrue(options['write_statistics'])
+            self.assertIn('State', options['use_dictionary'])
+            self.assertIn('TaxYear_path', options['use_dictionary'])
+            self.assertNotIn('EIN', options['use_dictionary'])
+        self.assertLess(get_writer_options('fast')['compression_level'], get_writer_options('compact')['compression_level'])
+        with self.assertRaises(ValueError):
+            get_writer_options('fastest')
+
+    def test_dictionary_columns_limited_to_schema(self):
+        schema = pa.schema([('State', pa.string()), ('EIN', pa.string())])
+        self.assertEqual(get_writer_options('balanced', schema)['use_dictionary'], ['State'])
+
+    def test_write_table(self):
+        table = synthetic_records(1000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'records.parquet')
+            write_table(table, path, 'balanced')
+            metadata = pq.ParquetFile(path).metadata
+            self.assertEqual(metadata.num_rows, 1000)
+            column_names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+            state = metadata.row_group(0).column(column_names.index('State'))
+            self.assertEqual(state.compression, 'ZSTD')
+            self.assertTrue(state.is_stats_set)
+            self.assertIn('RLE_DICTIONARY', state.encodings)
+            ein = metadata.row_group(0).column(column_names.index('EIN'))
+            self.assertNotIn('RLE_DICTIONARY', ein.encodings)
+            self.assertTrue(pq.read_table(path).cast(table.schema).equals(table))
+
+if __name__ == '__main__':
+    unittest.main()
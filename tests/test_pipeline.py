@@ -0,0 +1,93 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pipeline
+
+class FakeArchives:
+    """
+    Stands in for downloading and parsing: tracks which spooled archives are still held.
+    """
+
+    def __init__(self, parse_seconds=0.0, failing_downloads=(), failing_parses=()):
+        self.parse_seconds = parse_seconds
+        self.failing_downloads = set(failing_downloads)
+        self.failing_parses = set(failing_parses)
+        self.held = set()
+        self.max_held = 0
+        self.released = []
+        self.lock = threading.Lock()
+
+    def download(self, url, state_filter=None):
+        if url in self.failing_downloads:
+            raise IOError(f'cannot download {url}')
+        with self.lock:
+            self.held.add(url)
+            self.max_held = max(self.max_held, len(self.held))
+        return [(f'{url}.xml', b'<Return/>')], 1, url
+
+    def release(self, spool_path):
+        with self.lock:
+            self.held.discard(spool_path)
+            self.released.append(spool_path)
+
+    def parse(self, xml_files, state_filter=None, get_ntee_code_description=None):
+        time.sleep(self.parse_seconds)
+        filename, _ = list(xml_files)[0]
+        if filename[:-4] in self.failing_parses:
+            raise ValueError(f'cannot parse {filename}')
+        return [{'_source_file': filename}], {}
+
+    def run(self, urls, **kwargs):
+        with mock.patch.object(pipeline, '_download_archive', self.download), \
+                mock.patch.object(pipeline, 'release_spool', self.release), \
+                mock.patch.object(pipeline, 'process_xml_files', self.parse):
+            results = pipeline.run_pipeline(urls, None, None, **kwargs)
+            yield from results
+
+URLS = [f'https://example.org/archive{index}.zip' for index in range(8)]
+
+class TestPipeline(unittest.TestCase):
+    def test_single_workers_keep_url_order(self):
+        archives = FakeArchives()
+        results = list(archives.run(URLS, download_workers=1, parse_workers=1))
+        self.assertEqual([result['url'] for result in results], URLS)
+        self.assertEqual([result['records'] for result in results], [[{'_source_file': f'{url}.xml'}] for url in URLS])
+        self.assertEqual(sorted(archives.released), sorted(URLS))
+        self.assertFalse(archives.held)
+
+    def test_bounded_queue_limits_spooled_archives(self):
+        archives = FakeArchives(parse_seconds=0.05)
+        results = list(archives.run(URLS, download_workers=2, parse_workers=1, queue_size=1))
+        self.assertEqual(sorted(result['url'] for result in results), sorted(URLS))
+        # One archive being parsed, one waiting in the queue and one per blocked download worker
+        self.assertLessEqual(archives.max_held, 4)
+        self.assertFalse(archives.held)
+
+    def test_errors_are_reported_per_archive(self):
+        archives = FakeArchives(failing_downloads=[URLS[1]], failing_parses=[URLS[2]])
+        results = {result['url']: result for result in archives.run(URLS[:4], download_workers=2, parse_workers=2)}
+        self.assertEqual(sorted(results), URLS[:4])
+        self.assertIsInstance(results[URLS[1]]['error'], IOError)
+        self.assertIsInstance(results[URLS[2]]['error'], ValueError)
+        self.assertEqual(results[URLS[2]]['records'], [])
+        self.assertIsNone(results[URLS[0]]['error'])
+        self.assertEqual(sorted(archives.released), sorted([URLS[0], URLS[2], URLS[3]]))
+
+    def test_stopping_early_stops_workers_and_releases_spools(self):
+        archives = FakeArchives(parse_seconds=0.02)
+        threads_before = threading.active_count()
+        results = archives.run(URLS, download_workers=2, parse_workers=1, queue_size=1)
+        next(results)
+        results.close()
+        self.assertFalse(archives.held)
+        self.assertLess(len(archives.released), len(URLS))
+        self.assertEqual(threading.active_count(), threads_before)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ntee_cache import NTEECache
+from propublica_client import ProPublicaClient
+
+class OrganizationHandler(BaseHTTPRequestHandler):
+    """Stands in for the Nonprofit Explorer organization endpoint."""
+    ntee_codes = {}
+    throttled = Counter()
+    requests = Counter()
+    delay = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        ein = self.path.rsplit('/', 1)[1].split('.')[0]
+        type(self).requests[ein] += 1
+        time.sleep(self.delay)
+        if self.throttled[ein]:
+            type(self).throttled[ein] -= 1
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if ein not in self.ntee_codes:
+            self.send_error(404)
+            return
+        body = json.dumps({'organization': {'ein': ein, 'ntee_code': self.ntee_codes[ein]}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class TestProPublicaClient(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), OrganizationHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}/organizations'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        OrganizationHandler.ntee_codes = {'111111111': 'B203', '222222222': 'P20', '333333333': None}
+        OrganizationHandler.throttled = Counter()
+        OrganizationHandler.requests = Counter()
+        OrganizationHandler.delay = 0
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = NTEECache(os.path.join(self.tmp_dir.name, 'ntee_cache.sqlite3'))
+        self.client = ProPublicaClient(self.base_url, rate=50, burst=10, cache=self.cache)
+
+    def tearDown(self):
+        self.client.close()
+        self.tmp_dir.cleanup()
+
+    def test_batch_fetch_caches_hits_and_negatives(self):
+        eins = ['111111111', '222222222', '333333333', '444444444', '111111111', '', None]
+        self.assertEqual(self.client.fetch_ntee_codes(eins),
+                         {'111111111': 'B20', '222222222': 'P20', '333333333': None, '444444444': None})
+        self.assertEqual(OrganizationHandler.requests['111111111'], 1)
+        self.assertEqual(self.cache.get('propublica', '444444444'), (True, None))
+
+        # A second batch is answered from the cache
+        self.client.fetch_ntee_codes(['111111111', '444444444'])
+        self.assertEqual(sum(OrganizationHandler.requests.values()), 4)
+
+    def test_throttled_requests_are_retried_and_slow_down(self):
+        OrganizationHandler.throttled['111111111'] = 2
+        self.assertEqual(self.client.fetch_ntee_codes(['111111111']), {'111111111': 'B20'})
+        self.assertEqual(OrganizationHandler.requests['111111111'], 3)
+        self.assertEqual(self.client.retried_calls, 2)
+        self.assertLess(self.client._bucket.rate, 50)
+
+    def test_failed_lookups_are_not_cached(self):
+        OrganizationHandler.throttled['222222222'] = 10
+        client = ProPublicaClient(self.base_url, rate=50, burst=10, retries=1, cache=self.cache)
+        try:
+            self.assertEqual(client.fetch_ntee_codes(['222222222']), {})
+        finally:
+            client.close()
+        self.assertEqual(self.cache.get('propublica', '222222222'), (False, None))
+
+    def test_concurrent_batches_share_in_flight_requests(self):
+        OrganizationHandler.delay = 0.2
+        threads = [threading.Thread(target=self.client.fetch_ntee_codes, args=(['111111111', '222222222'],))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(OrganizationHandler.requests, Counter({'111111111': 1, '222222222': 1}))
+
+if __name__ == '__main__':
+    unittest.main()
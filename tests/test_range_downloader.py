@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from range_downloader import download_file_segmented
+
+from helpers import RangeRequestHandler
+
+class TestSegmentedDownload(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/2023_TEOS_XML_01A.zip'
+        cls.content = os.urandom(10000)
+        RangeRequestHandler.files = {'/2023_TEOS_XML_01A.zip': cls.content}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        RangeRequestHandler.supports_ranges = True
+        RangeRequestHandler.failing_offsets = set()
+        RangeRequestHandler.requested_ranges = []
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dest = os.path.join(self.tmp_dir.name, 'archive.zip')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def download(self, retries=0):
+        return download_file_segmented(self.url, self.dest, segment_size=1024, max_workers=4,
+                                       session=requests.Session(), retries=retries)
+
+    def read_dest(self):
+        with open(self.dest, 'rb') as f:
+            return f.read()
+
+    def test_downloads_all_segments(self):
+        self.download()
+        self.assertEqual(self.read_dest(), self.content)
+        self.assertEqual(len(RangeRequestHandler.requested_ranges), 10)
+        self.assertFalse(os.path.exists(self.dest + '.part.json'))
+
+    def test_resumes_after_failed_segments(self):
+        RangeRequestHandler.failing_offsets = {3072, 7168}
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.download()
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertTrue(os.path.exists(self.dest + '.part.json'))
+
+        RangeRequestHandler.failing_offsets = set()
+        RangeRequestHandler.requested_ranges = []
+        self.download()
+        self.assertEqual(self.read_dest(), self.content)
+        self.assertEqual(sorted(RangeRequestHandler.requested_ranges), [(3072, 4095), (7168, 8191)])
+
+    def test_refetches_corrupt_segment_on_resume(self):
+        RangeRequestHandler.failing_offsets = {9216}
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.download()
+        with open(self.dest + '.part', 'r+b') as f:
+            f.seek(1500)
+            f.write(b'corrupt')
+
+        RangeRequestHandler.failing_offsets = set()
+        RangeRequestHandler.requested_ranges = []
+        self.download()
+        self.assertEqual(self.read_dest(), self.content)
+        self.assertEqual(sorted(RangeRequestHandler.requested_ranges), [(1024, 2047), (9216, 9999)])
+
+    def test_retries_failed_segments_with_backoff(self):
+        RangeRequestHandler.failing_offsets = {3072}
+        with mock.patch('range_downloader.time.sleep') as sleep:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self.download(retries=2)
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(1 <= delays[0] <= 3)
+        self.assertTrue(2 <= delays[1] <= 6)
+        self.assertEqual([start for start, _ in RangeRequestHandler.requested_ranges].count(3072), 3)
+
+    def test_falls_back_without_range_support(self):
+        RangeRequestHandler.supports_ranges = False
+        self.download()
+        self.assertEqual(self.read_dest(), self.content)
+        self.assertEqual(RangeRequestHandler.requested_ranges, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import unittest
+
+import pyarrow as pa
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from record_store import RecordStore, RECORD_SCHEMA, conform_table
+from data_processor import enrich_records
+from data_analyzer import analyze_data
+
+RECORDS = [
+    {'FormType': '990', 'EIN': '123456789', 'TaxYear': 2021, 'TaxYear_path': 'a', 'TotalRevenue': 10.0,
+     'NTEECode': 'Unknown', 'NTEEDescription': 'Unknown', '_source_file': 'a.xml', 'ignored': True},
+    {'FormType': '990EZ', 'EIN': '987654321', 'TaxYear': 2022, 'TaxYear_path': 'a', 'OrganizationName': 'Org',
+     'NTEECode': 'Unknown', 'NTEEDescription': 'Unknown', '_source_file': 'b.xml'},
+    {'FormType': '990', 'EIN': '555555555', 'TaxYear': 2022, 'TaxYear_path': 'b',
+     'NTEECode': 'Unknown', 'NTEEDescription': 'Unknown', '_source_file': 'c.xml'},
+]
+
+class TestRecordStore(unittest.TestCase):
+    def test_appends_in_batches_with_fixed_schema(self):
+        store = RecordStore(batch_size=2)
+        store.append_records(RECORDS)
+        self.assertEqual(len(store), 3)
+        table = store.to_table()
+        self.assertEqual(table.schema, RECORD_SCHEMA)
+        self.assertEqual(table.schema.field('FormType').type, pa.dictionary(pa.int32(), pa.string()))
+        self.assertEqual(table.schema.field('TaxYear_path').type, pa.dictionary(pa.int32(), pa.string()))
+        self.assertEqual(table['TaxYear'].to_pylist(), [2021, 2022, 2022])
+        self.assertEqual(table['TotalRevenue'].to_pylist(), [10.0, None, None])
+        self.assertEqual(store.value_counts('FormType'), {'990': 2, '990EZ': 1})
+
+        other = RecordStore()
+        other.append_records(RECORDS[:1])
+        store.extend(other)
+        self.assertEqual(len(store), 4)
+
+    def test_conform_table_lenient(self):
+        table = pa.table({
+            'TaxYear': pa.array(['2021', 'x']),
+            'TotalAssets': pa.array(['1,000', '2e3']),
+            'State': pa.array([['GA'], ['NY']]),
+        })
+        with self.assertRaises(pa.lib.ArrowInvalid):
+            conform_table(table.select(['TaxYear']))
+        conformed = conform_table(table, lenient=True)
+        self.assertEqual(conformed.schema, RECORD_SCHEMA)
+        self.assertEqual(conformed['TaxYear'].to_pylist(), [2021, None])
+        self.assertEqual(conformed['TotalAssets'].to_pylist(), [None, 2000.0])
+        self.assertEqual(conformed['State'].to_pylist(), [None, None])
+
+    def test_enrich_records_replaces_ntee_columns(self):
+        store = RecordStore()
+        store.append_records(RECORDS)
+        calls = []
+
+        def get_ntee_code_description(organization_name, mission_statement, ein):
+            calls.append((organization_name, mission_statement, ein))
+            return {'ntee_code': f'B{ein[:2]}', 'ntee_description': 'Education'}
+
+        enrich_records(store, get_ntee_code_description)
+        table = store.to_table()
+        self.assertEqual(calls[1], ('Org', '', '987654321'))
+        self.assertEqual(table['NTEECode'].to_pylist(), ['B12', 'B98', 'B55'])
+        self.assertEqual(table['NTEEDescription'].to_pylist(), ['Education'] * 3)
+        analyze_data(store)
+
+    def test_conform_table_casts_and_keeps_extra_columns(self):
+        table = pa.table({'EIN': pa.array([123456789]), 'TaxYear': pa.array([2021.0]), 'Extra': ['x']})
+        conformed = conform_table(table)
+        self.assertEqual(conformed.schema.names, RECORD_SCHEMA.names + ['Extra'])
+        self.assertEqual(conformed['EIN'].to_pylist(), ['123456789'])
+        self.assertEqual(conformed['TaxYear'].to_pylist(), [2021])
+        self.assertEqual(conformed['State'].to_pylist(), [None])
+
+if __name__ == '__main__':
+    unittest.main()
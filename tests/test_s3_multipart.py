@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+
+import boto3
+from moto import mock_aws
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from s3_multipart import S3MultipartWriter, MIN_PART_SIZE
+
+from helpers import FailingClient
+
+BUCKET = 'multipart-test-bucket'
+
+@mock_aws
+class TestS3MultipartWriter(unittest.TestCase):
+    def setUp(self):
+        self.client = boto3.client('s3')
+        self.client.create_bucket(Bucket=BUCKET)
+
+    def assert_no_uploads(self, key):
+        self.assertNotIn('Uploads', self.client.list_multipart_uploads(Bucket=BUCKET))
+        self.assertNotIn('Contents', self.client.list_objects_v2(Bucket=BUCKET, Prefix=key))
+
+    def test_streams_parts(self):
+        data = os.urandom(2 * MIN_PART_SIZE + 1234)
+        with S3MultipartWriter(BUCKET, 'big.bin', client=self.client, part_size=MIN_PART_SIZE,
+                               max_pending_parts=1) as writer:
+            for start in range(0, len(data), 1000000):
+                writer.write(data[start:start + 1000000])
+            self.assertEqual(writer.tell(), len(data))
+        self.assertTrue(writer.closed)
+        self.assertIsNotNone(writer.upload_id)
+        self.assertEqual(self.client.get_object(Bucket=BUCKET, Key='big.bin')['Body'].read(), data)
+        self.assertNotIn('Uploads', self.client.list_multipart_uploads(Bucket=BUCKET))
+
+    def test_small_object_uses_put_object(self):
+        with S3MultipartWriter(BUCKET, 'small.bin', client=self.client, part_size=MIN_PART_SIZE) as writer:
+            writer.write(b'hello')
+        self.assertIsNone(writer.upload_id)
+        self.assertEqual(self.client.get_object(Bucket=BUCKET, Key='small.bin')['Body'].read(), b'hello')
+
+    def test_failed_part_aborts_upload(self):
+        client = FailingClient(self.client, 'upload_part', PartNumber=2)
+        with self.assertRaises(IOError):
+            with S3MultipartWriter(BUCKET, 'failed.bin', client=client, part_size=MIN_PART_SIZE) as writer:
+                writer.write(os.urandom(3 * MIN_PART_SIZE))
+        self.assertTrue(writer.closed)
+        self.assert_no_uploads('failed.bin')
+
+    def test_exception_while_writing_aborts_upload(self):
+        with self.assertRaises(RuntimeError):
+            with S3MultipartWriter(BUCKET, 'interrupted.bin', client=self.client, part_size=MIN_PART_SIZE) as writer:
+                writer.write(os.urandom(MIN_PART_SIZE + 1))
+                raise RuntimeError('encoding failed')
+        self.assert_no_uploads('interrupted.bin')
+
+    def test_rejects_small_parts(self):
+        with self.assertRaises(ValueError):
+            S3MultipartWriter(BUCKET, 'key', client=self.client, part_size=1024)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+
+import boto3
+from moto import mock_aws
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import s3_utils
+from s3_utils import get_s3_client, upload_many
+
+from helpers import FailingClient
+
+BUCKET = 'upload-many-test-bucket'
+
+@mock_aws
+class TestS3Utils(unittest.TestCase):
+    def setUp(self):
+        self.client = boto3.client('s3')
+        self.client.create_bucket(Bucket=BUCKET)
+
+    def test_shared_client(self):
+        client = get_s3_client()
+        self.assertIs(get_s3_client(), client)
+        self.assertEqual(client.meta.config.max_pool_connections, s3_utils.S3_MAX_POOL_CONNECTIONS)
+        self.assertEqual(client.meta.config.retries['mode'], s3_utils.S3_RETRY_MODE)
+
+    def test_upload_many(self):
+        objects = {f'NoTotalAssets/{index}.xml': f'<Return>{index}</Return>'.encode() for index in range(20)}
+        results = upload_many(objects, bucket=BUCKET, client=self.client, max_workers=4)
+        self.assertEqual([result['key'] for result in results], list(objects))
+        self.assertTrue(all(result['error'] is None for result in results))
+        for key, content in objects.items():
+            self.assertEqual(self.client.get_object(Bucket=BUCKET, Key=key)['Body'].read(), content)
+
+    def test_upload_many_reports_failures(self):
+        objects = [('a.xml', b'a'), ('b.xml', b'bb'), ('c.xml', b'ccc')]
+        results = upload_many(objects, bucket=BUCKET, client=FailingClient(self.client, 'put_object', Key='b.xml'))
+        self.assertEqual([result['size'] for result in results], [1, 2, 3])
+        self.assertEqual([result['error'] is None for result in results], [True, False, True])
+        self.assertIn('connection reset', results[1]['error'])
+        keys = [item['Key'] for item in self.client.list_objects_v2(Bucket=BUCKET)['Contents']]
+        self.assertEqual(keys, ['a.xml', 'c.xml'])
+        self.assertEqual(upload_many({}, bucket=BUCKET, client=self.client), [])
+
+    def test_upload_many_encodes_text(self):
+        results = upload_many({'café.xml': '<Name>Café</Name>'}, bucket=BUCKET, client=self.client)
+        content = '<Name>Café</Name>'.encode('utf-8')
+        self.assertEqual(results[0]['size'], len(content))
+        self.assertEqual(self.client.get_object(Bucket=BUCKET, Key='café.xml')['Body'].read(), content)
+
+if __name__ == '__main__':
+    unittest.main()
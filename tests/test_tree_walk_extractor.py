@@ -0,0 +1,66 @@
+import os
+import sys
+import unittest
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from extraction_plan import EXTRACTION_PLAN
+from tree_walk_extractor import TREE_WALK_EXTRACTOR, compile_path, UnsupportedPath
+from utils import detect_form_type
+
+from helpers import load_sample_returns
+
+NAMESPACES = {'irs': 'http://www.irs.gov/efile'}
+
+class TestTreeWalkExtractor(unittest.TestCase):
+    def assert_engines_agree(self, Return):
+        form_type = detect_form_type(Return, NAMESPACES)
+        xpath_result = [(field, value, path) for field, _, value, path in EXTRACTION_PLAN.extract(Return, form_type)]
+        walk_result = [(field, value, path) for field, _, value, path in TREE_WALK_EXTRACTOR.extract(Return, form_type)]
+        self.assertEqual(walk_result, xpath_result)
+
+    def test_matches_xpath_engine_on_sample_returns(self):
+        returns, _ = load_sample_returns()
+        self.assertEqual(len(returns), 8)
+        for Return in returns:
+            self.assert_engines_agree(Return)
+
+    def test_matches_xpath_engine_for_each_form_type(self):
+        _, documents = load_sample_returns()
+        for form in [b'IRS990', b'IRS990EZ', b'IRS990PF', b'IRSUnknown']:
+            self.assert_engines_agree(etree.fromstring(documents[0].replace(b'IRS990T', form)))
+
+    def test_first_text_node_in_document_order(self):
+        document = b'''<Return xmlns="http://www.irs.gov/efile">
+          <ReturnHeader><TaxYr>2021</TaxYr><Filer><EIN>12-3456789</EIN>
+            <USAddress><StateAbbreviationCd><!-- note -->RI</StateAbbreviationCd></USAddress></Filer></ReturnHeader>
+          <ReturnData><IRS990>
+            <TotalAssetsGrp>
+              <TotalAssetsEOYAmt>100</TotalAssetsEOYAmt>
+            </TotalAssetsGrp>
+            <MissionDesc>First<Br/>second</MissionDesc>
+          </IRS990></ReturnData>
+        </Return>'''
+        self.assert_engines_agree(etree.fromstring(document))
+
+    def test_multi_return_document_is_scoped_per_return(self):
+        returns, documents = load_sample_returns()
+        bodies = [document.split(b'?>', 1)[1] for document in documents[:3]]
+        batch = etree.fromstring(b'<Batch xmlns="http://www.irs.gov/efile">' + b''.join(bodies) + b'</Batch>')
+        batch_returns = batch.xpath('//irs:Return', namespaces=NAMESPACES)
+        self.assertEqual(len(batch_returns), 3)
+        for standalone, Return in zip(returns, batch_returns):
+            self.assert_engines_agree(Return)
+            self.assertEqual(EXTRACTION_PLAN.extract(Return, '990T'), EXTRACTION_PLAN.extract(standalone, '990T'))
+
+    def test_unsupported_paths_are_rejected(self):
+        with self.assertRaises(UnsupportedPath):
+            compile_path('substring(//*[local-name()="TaxPeriodEndDt"]/text(),1,4)')
+        with self.assertRaises(UnsupportedPath):
+            compile_path('//*[starts-with(local-name(), "Total")]/text()')
+        self.assertEqual(len(compile_path('//*[local-name()="ReturnHeader"]/*[local-name()="TaxYr"]/text()')), 2)
+
+if __name__ == '__main__':
+    unittest.main()
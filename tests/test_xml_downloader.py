@@ -0,0 +1,92 @@
+import io
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import xml_downloader
+from xml_downloader import count_xml_members, download_to_spool, get_spool_path, iter_xml_members, release_spool
+
+from helpers import RangeRequestHandler
+
+MEMBERS = {
+    '202301.xml': b'<Return>1</Return>',
+    'index.csv': b'ein,name\n',
+    'nested/202302.xml': b'<Return>2</Return>',
+    'readme.txt': b'not a return',
+}
+
+def build_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for filename, content in MEMBERS.items():
+            zip_file.writestr(filename, content)
+    return buffer.getvalue()
+
+class TestXmlMembers(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp_dir.name, 'archive.zip')
+        with open(self.zip_path, 'wb') as f:
+            f.write(build_zip())
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_iter_xml_members_yields_only_xml_in_order(self):
+        self.assertEqual(list(iter_xml_members(self.zip_path)),
+                         [('202301.xml', b'<Return>1</Return>'), ('nested/202302.xml', b'<Return>2</Return>')])
+
+    def test_count_xml_members(self):
+        self.assertEqual(count_xml_members(self.zip_path), 2)
+
+class TestDownloadToSpool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/2023_TEOS_XML_01A.zip'
+        cls.content = build_zip()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        RangeRequestHandler.files = {'/2023_TEOS_XML_01A.zip': self.content}
+        RangeRequestHandler.supports_ranges = True
+        RangeRequestHandler.failing_offsets = set()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(xml_downloader, 'ARCHIVE_CACHE_ENABLED', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_spools_archive_and_release_removes_it(self):
+        spool_path = download_to_spool(self.url, spool_dir=self.tmp_dir.name)
+        self.assertEqual(spool_path, get_spool_path(self.url, self.tmp_dir.name))
+        with open(spool_path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual([filename for filename, _ in iter_xml_members(spool_path)], ['202301.xml', 'nested/202302.xml'])
+
+        release_spool(spool_path)
+        self.assertFalse(os.path.exists(spool_path))
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_spool_path_is_stable_per_url(self):
+        self.assertEqual(get_spool_path(self.url, self.tmp_dir.name), get_spool_path(self.url, self.tmp_dir.name))
+        self.assertNotEqual(get_spool_path(self.url, self.tmp_dir.name),
+                            get_spool_path(self.url.replace('01A', '02A'), self.tmp_dir.name))
+        self.assertTrue(get_spool_path(self.url, self.tmp_dir.name).endswith('_2023_TEOS_XML_01A.zip'))
+
+if __name__ == '__main__':
+    unittest.main()